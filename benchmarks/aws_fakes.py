@@ -0,0 +1,833 @@
+"""
+In-memory stand-ins for the DynamoDB, SQS and Step Functions APIs used by
+the DOFS Lambdas, for running the real handlers locally without an AWS
+account.
+
+Only the calls and expression syntax the handlers actually use are
+implemented. Items are copied on write and read like a real table, floats
+are rejected the same way boto3 rejects them, and every API call can be
+given an artificial latency to model network round trips. Tables can keep
+a stream of their changes, in the records a DynamoDB stream hands Lambda.
+"""
+
+import contextlib
+import copy
+import itertools
+import re
+import threading
+import time
+import types
+import uuid
+from collections import deque
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+def client_error(code, message, operation, item=None):
+    response = {'Error': {'Code': code, 'Message': message}}
+    if item is not None:
+        # Low-level (typed) attribute values, as botocore returns them
+        serializer = TypeSerializer()
+        response['Item'] = {key: serializer.serialize(value) for key, value in item.items()}
+    return ClientError(response, operation)
+
+class CallStats:
+    """
+    Counts API calls per operation and applies the configured latency
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+def check_no_floats(value):
+    """
+    Mirror boto3's TypeError for float values in DynamoDB items
+    """
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        for item in value.values():
+            check_no_floats(item)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            check_no_floats(item)
+
+# --- DynamoDB expression evaluation -------------------------------------------
+
+_TOKEN_RE = re.compile(r"\s*(<>|<=|>=|[=<>(),+\-]|[#:]?[A-Za-z_][A-Za-z0-9_\.\[\]#]*)")
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN_RE.match(expression, position)
+        if not match:
+            raise ValueError(f"Cannot parse expression at: {expression[position:]}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+class _Expression:
+    """
+    Evaluates condition/key/filter expressions and update expressions
+    """
+
+    def __init__(self, names=None, values=None):
+        self.names = names or {}
+        self.values = values or {}
+
+    def path(self, token):
+        parts = []
+        for part in token.split('.'):
+            parts.append(self.names.get(part, part))
+        return parts
+
+    def resolve(self, item, token):
+        if token.startswith(':'):
+            return True, self.values[token]
+        value = item
+        for part in self.path(token):
+            if not isinstance(value, dict) or part not in value:
+                return False, None
+            value = value[part]
+        return True, value
+
+    # condition grammar: or -> and -> not -> primary
+    def condition(self, item, expression):
+        self.tokens = _tokenize(expression)
+        self.position = 0
+        result = self._or(item)
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token {self.tokens[self.position]} in {expression}")
+        return result
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _expect(self, token):
+        if self._next().upper() != token:
+            raise ValueError(f"Expected {token}")
+
+    def _or(self, item):
+        result = self._and(item)
+        while (self._peek() or '').upper() == 'OR':
+            self._next()
+            right = self._and(item)
+            result = result or right
+        return result
+
+    def _and(self, item):
+        result = self._not(item)
+        while (self._peek() or '').upper() == 'AND':
+            self._next()
+            right = self._not(item)
+            result = result and right
+        return result
+
+    def _not(self, item):
+        if (self._peek() or '').upper() == 'NOT':
+            self._next()
+            return not self._not(item)
+        return self._primary(item)
+
+    def _primary(self, item):
+        token = self._next()
+        if token == '(':
+            result = self._or(item)
+            self._expect(')')
+            return result
+
+        function = token.lower()
+        if function in ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains') \
+                and self._peek() == '(':
+            self._next()
+            found, value = self.resolve(item, self._next())
+            argument = None
+            if self._peek() == ',':
+                self._next()
+                argument = self.resolve(item, self._next())[1]
+            self._expect(')')
+            if function == 'attribute_exists':
+                return found
+            if function == 'attribute_not_exists':
+                return not found
+            if function == 'begins_with':
+                return found and isinstance(value, str) and value.startswith(argument)
+            return found and argument in value
+
+        found, left = self.resolve(item, token)
+        operator = self._next().upper()
+        if operator == 'IN':
+            self._expect('(')
+            candidates = [self.resolve(item, self._next())[1]]
+            while self._peek() == ',':
+                self._next()
+                candidates.append(self.resolve(item, self._next())[1])
+            self._expect(')')
+            return found and left in candidates
+        if operator == 'BETWEEN':
+            low = self.resolve(item, self._next())[1]
+            self._expect('AND')
+            high = self.resolve(item, self._next())[1]
+            return found and low <= left <= high
+
+        right_found, right = self.resolve(item, self._next())
+        if not found or not right_found:
+            return operator == '<>'
+        try:
+            return {
+                '=': left == right,
+                '<>': left != right,
+                '<': left < right,
+                '<=': left <= right,
+                '>': left > right,
+                '>=': left >= right,
+            }[operator]
+        except TypeError:
+            return False
+
+    # update expressions: SET / REMOVE / ADD / DELETE clauses
+    def update(self, item, expression):
+        clauses = re.split(r'\b(SET|REMOVE|ADD|DELETE)\b', expression, flags=re.IGNORECASE)
+        for keyword, body in zip(clauses[1::2], clauses[2::2]):
+            keyword = keyword.upper()
+            for action in _split_top_level(body):
+                if keyword == 'SET':
+                    target, value_expression = action.split('=', 1)
+                    self._assign(item, target.strip(), self._value(item, value_expression.strip()))
+                elif keyword == 'REMOVE':
+                    self._remove(item, action.strip())
+                elif keyword == 'ADD':
+                    target, operand = action.split()
+                    found, current = self.resolve(item, target)
+                    increment = self.values[operand]
+                    if isinstance(increment, set):
+                        self._assign(item, target, (current if found else set()) | increment)
+                    else:
+                        self._assign(item, target, (current if found else 0) + increment)
+                else:
+                    target, operand = action.split()
+                    found, current = self.resolve(item, target)
+                    if found:
+                        self._assign(item, target, current - self.values[operand])
+
+    def _value(self, item, expression):
+        expression = expression.strip()
+        for operator in ('+', '-'):
+            parts = _split_top_level(expression, operator)
+            if len(parts) == 2:
+                left = self._value(item, parts[0])
+                right = self._value(item, parts[1])
+                return left + right if operator == '+' else left - right
+        match = re.match(r'(if_not_exists|list_append)\s*\((.*)\)$', expression, flags=re.IGNORECASE)
+        if match:
+            first, second = _split_top_level(match.group(2))
+            if match.group(1).lower() == 'if_not_exists':
+                found, value = self.resolve(item, first.strip())
+                return value if found else self._value(item, second)
+            return self._value(item, first) + self._value(item, second)
+        found, value = self.resolve(item, expression)
+        if not found:
+            raise client_error('ValidationException',
+                               f"The provided expression refers to an attribute that does not exist: {expression}",
+                               'UpdateItem')
+        return copy.deepcopy(value)
+
+    def _assign(self, item, target, value):
+        parts = self.path(target)
+        container = item
+        for part in parts[:-1]:
+            container = container.setdefault(part, {})
+        container[parts[-1]] = value
+
+    def _remove(self, item, target):
+        parts = self.path(target)
+        container = item
+        for part in parts[:-1]:
+            container = container.get(part, {})
+        container.pop(parts[-1], None)
+
+def _split_top_level(text, separator=','):
+    parts, depth, current = [], 0, ''
+    for char in text:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current)
+    return parts
+
+def _check_placeholders(names, values, *expressions):
+    """
+    DynamoDB rejects requests with unused #name or :value placeholders
+    """
+    *expressions, operation = expressions
+    tokens = set()
+    for expression in expressions:
+        if expression:
+            tokens.update(re.findall(r'[#:][A-Za-z0-9_]+', expression))
+    for placeholder in list(names or {}) + list(values or {}):
+        if placeholder not in tokens:
+            raise client_error('ValidationException',
+                               f"Value provided in ExpressionAttribute{'Names' if placeholder[0] == '#' else 'Values'} "
+                               f"unused in expressions: keys: {{{placeholder}}}", operation)
+
+def _build_expression(expression, names, values, is_key_condition=False):
+    """
+    Accept either string expressions or boto3.dynamodb.conditions objects
+    """
+    if isinstance(expression, ConditionBase):
+        built = ConditionExpressionBuilder().build_expression(expression, is_key_condition=is_key_condition)
+        names = {**(names or {}), **built.attribute_name_placeholders}
+        values = {**(values or {}), **built.attribute_value_placeholders}
+        expression = built.condition_expression
+    return expression, names, values
+
+# --- DynamoDB -------------------------------------------------------------------
+
+class FakeTable:
+    """
+    A DynamoDB table (resource-level API) held in a dict
+    """
+
+    def __init__(self, name, hash_key, range_key=None, indexes=None, stats=None):
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # index name -> (hash_key, range_key)
+        self.indexes = indexes or {}
+        self.items = {}
+        self.stats = stats or CallStats()
+        self._lock = threading.RLock()
+        # Change records (NEW_AND_OLD_IMAGES) once enable_stream() is called
+        self.stream = None
+        self._sequence = itertools.count(1)
+
+    def enable_stream(self):
+        self.stream = deque()
+
+    def _changed(self, old, new):
+        """
+        Add a stream record for a write; writes that change nothing have none
+        """
+        if self.stream is None or old == new:
+            return
+        serializer = TypeSerializer()
+        current = new if new is not None else old
+        change = {
+            'Keys': {name: serializer.serialize(current[name]) for name in (self.hash_key, self.range_key) if name},
+            'ApproximateCreationDateTime': int(time.time()),
+            'SequenceNumber': f"{next(self._sequence):021d}",
+            'StreamViewType': 'NEW_AND_OLD_IMAGES'
+        }
+        for field, value in (('OldImage', old), ('NewImage', new)):
+            if value is not None:
+                change[field] = {name: serializer.serialize(attribute) for name, attribute in value.items()}
+        self.stream.append({
+            'eventID': uuid.uuid4().hex,
+            'eventName': 'INSERT' if old is None else 'REMOVE' if new is None else 'MODIFY',
+            'eventSource': 'aws:dynamodb',
+            'eventSourceARN': f"arn:aws:dynamodb:us-west-2:000000000000:table/{self.name}/stream/sim",
+            'dynamodb': change
+        })
+
+    def _key(self, item):
+        if self.range_key:
+            return (item[self.hash_key], item[self.range_key])
+        return item[self.hash_key]
+
+    def _check_condition(self, existing, kwargs, operation):
+        expression = kwargs.get('ConditionExpression')
+        if expression is None:
+            return
+        expression, names, values = _build_expression(
+            expression, kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues'))
+        _check_placeholders(names, values, expression, kwargs.get('UpdateExpression'), operation)
+        if not _Expression(names, values).condition(existing or {}, expression):
+            item = existing if kwargs.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD' else None
+            raise client_error('ConditionalCheckFailedException', 'The conditional request failed', operation, item)
+
+    def put_item(self, Item, **kwargs):
+        self.stats.record('PutItem')
+        check_no_floats(Item)
+        with self._lock:
+            key = self._key(Item)
+            existing = self.items.get(key)
+            self._check_condition(existing, kwargs, 'PutItem')
+            self.items[key] = copy.deepcopy(Item)
+            self._changed(existing, Item)
+        if kwargs.get('ReturnValues') == 'ALL_OLD' and existing is not None:
+            return {'Attributes': existing}
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self.stats.record('GetItem')
+        with self._lock:
+            item = self.items.get(self._key(Key))
+            return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def delete_item(self, Key, **kwargs):
+        self.stats.record('DeleteItem')
+        with self._lock:
+            key = self._key(Key)
+            self._check_condition(self.items.get(key), kwargs, 'DeleteItem')
+            self._changed(self.items.pop(key, None), None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, **kwargs):
+        self.stats.record('UpdateItem')
+        check_no_floats(kwargs.get('ExpressionAttributeValues', {}))
+        with self._lock:
+            key = self._key(Key)
+            existing = self.items.get(key)
+            if 'ConditionExpression' not in kwargs:
+                _check_placeholders(kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues'),
+                                    UpdateExpression, 'UpdateItem')
+            self._check_condition(existing, {'UpdateExpression': UpdateExpression, **kwargs}, 'UpdateItem')
+            item = copy.deepcopy(existing) if existing is not None else copy.deepcopy(Key)
+            expression = _Expression(kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues'))
+            expression.update(item, UpdateExpression)
+            self.items[key] = item
+            self._changed(existing, item)
+        return_values = kwargs.get('ReturnValues', 'NONE')
+        if return_values == 'ALL_NEW':
+            return {'Attributes': copy.deepcopy(item)}
+        if return_values == 'ALL_OLD':
+            return {'Attributes': copy.deepcopy(existing)} if existing else {}
+        return {}
+
+    def _select(self, items, kwargs, key_names=None):
+        filter_expression = kwargs.get('FilterExpression')
+        if filter_expression is not None:
+            expression, names, values = _build_expression(
+                filter_expression, kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues'))
+            evaluator = _Expression(names, values)
+            items = [item for item in items if evaluator.condition(item, expression)]
+        return items
+
+    def _paginate(self, items, kwargs, key_names):
+        start_key = kwargs.get('ExclusiveStartKey')
+        if start_key:
+            marker = tuple(start_key.get(name) for name in key_names)
+            for index, item in enumerate(items):
+                if tuple(item.get(name) for name in key_names) == marker:
+                    items = items[index + 1:]
+                    break
+        limit = kwargs.get('Limit')
+        response = {}
+        if limit and len(items) > limit:
+            items = items[:limit]
+            response['LastEvaluatedKey'] = {name: items[-1][name] for name in key_names if name in items[-1]}
+        return items, response
+
+    def query(self, KeyConditionExpression, **kwargs):
+        self.stats.record('Query')
+        index_name = kwargs.get('IndexName')
+        hash_key, range_key = self.indexes[index_name] if index_name else (self.hash_key, self.range_key)
+        expression, names, values = _build_expression(
+            KeyConditionExpression, kwargs.get('ExpressionAttributeNames'),
+            kwargs.get('ExpressionAttributeValues'), is_key_condition=True)
+        evaluator = _Expression(names, values)
+        with self._lock:
+            items = [copy.deepcopy(item) for item in self.items.values()
+                     if hash_key in item and evaluator.condition(item, expression)]
+        if range_key:
+            items.sort(key=lambda item: item.get(range_key), reverse=not kwargs.get('ScanIndexForward', True))
+        key_names = [name for name in (hash_key, range_key, self.hash_key, self.range_key) if name]
+        items, response = self._paginate(items, kwargs, list(dict.fromkeys(key_names)))
+        items = self._select(items, kwargs)
+        return {**response, 'Items': items, 'Count': len(items)}
+
+    def scan(self, **kwargs):
+        self.stats.record('Scan')
+        with self._lock:
+            items = [copy.deepcopy(item) for item in self.items.values()]
+        total_segments = kwargs.get('TotalSegments')
+        if total_segments:
+            segment = kwargs['Segment']
+            items = [item for index, item in enumerate(items) if index % total_segments == segment]
+        key_names = [name for name in (self.hash_key, self.range_key) if name]
+        items, response = self._paginate(items, kwargs, key_names)
+        items = self._select(items, kwargs)
+        return {**response, 'Items': items, 'Count': len(items)}
+
+class FakeDynamoDB:
+    """
+    boto3.resource('dynamodb') stand-in holding named FakeTables
+    """
+
+    def __init__(self, stats=None, unprocessed_rate=0.0, rng=None):
+        self.stats = stats or CallStats()
+        self.tables = {}
+        # Fraction of BatchWriteItem requests returned as UnprocessedItems
+        self.unprocessed_rate = unprocessed_rate
+        self.rng = rng
+        # boto3 resources expose their low-level client as meta.client
+        self.meta = types.SimpleNamespace(client=FakeDynamoDBClient(self))
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        self.tables[name] = FakeTable(name, hash_key, range_key, indexes, self.stats)
+        return self.tables[name]
+
+    def Table(self, name):
+        if name not in self.tables:
+            raise client_error('ResourceNotFoundException', f"Requested resource not found: {name}", 'DescribeTable')
+        return self.tables[name]
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self.stats.record('BatchWriteItem')
+        if sum(len(requests) for requests in RequestItems.values()) > 25:
+            raise client_error('ValidationException', 'Too many items requested for the BatchWriteItem call',
+                               'BatchWriteItem')
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            table = self.Table(table_name)
+            seen = set()
+            for request in requests:
+                if self.unprocessed_rate and self.rng and self.rng.random() < self.unprocessed_rate:
+                    unprocessed.setdefault(table_name, []).append(request)
+                    continue
+                if 'PutRequest' in request:
+                    item = request['PutRequest']['Item']
+                    check_no_floats(item)
+                    key = table._key(item)
+                    if key in seen:
+                        raise client_error('ValidationException',
+                                           'Provided list of item keys contains duplicates', 'BatchWriteItem')
+                    seen.add(key)
+                    with table._lock:
+                        table._changed(table.items.get(key), item)
+                        table.items[key] = copy.deepcopy(item)
+                else:
+                    with table._lock:
+                        table._changed(table.items.pop(table._key(request['DeleteRequest']['Key']), None), None)
+        return {'UnprocessedItems': unprocessed}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self.stats.record('BatchGetItem')
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self.Table(table_name)
+            found = []
+            with table._lock:
+                for key in request['Keys']:
+                    item = table.items.get(table._key(key))
+                    if item is not None:
+                        found.append(copy.deepcopy(item))
+            responses[table_name] = found
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+class FakeDynamoDBClient:
+    """
+    boto3.client('dynamodb') stand-in for TransactWriteItems, which only
+    the low-level client offers; attribute values are typed ({'N': '3'}).
+    A ClientRequestToken makes a repeat of a transaction that went through
+    a no-op, as in DynamoDB (without its 10 minute expiry).
+    """
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.stats = resource.stats
+        self._deserializer = TypeDeserializer()
+        self._tokens = {}
+        self._tokens_lock = threading.Lock()
+
+    def _plain(self, values):
+        return {key: self._deserializer.deserialize(value) for key, value in (values or {}).items()}
+
+    def transact_write_items(self, TransactItems, ClientRequestToken=None, **kwargs):
+        self.stats.record('TransactWriteItems')
+        if len(TransactItems) > 100:
+            raise client_error('ValidationException', 'Member must have length less than or equal to 100',
+                               'TransactWriteItems')
+
+        if ClientRequestToken is not None:
+            with self._tokens_lock:
+                applied = self._tokens.get(ClientRequestToken)
+            if applied is not None:
+                if applied != TransactItems:
+                    raise client_error('IdempotentParameterMismatchException',
+                                       'The request uses the same client token as a previous, but non-identical '
+                                       'request', 'TransactWriteItems')
+                return {}
+
+        operations = []
+        seen = set()
+        for entry in TransactItems:
+            (kind, request), = entry.items()
+            table = self.resource.Table(request['TableName'])
+            item = self._plain(request['Item']) if kind == 'Put' else None
+            key = table._key(item if item is not None else self._plain(request['Key']))
+            if (table.name, key) in seen:
+                raise client_error('ValidationException',
+                                   'Transaction request cannot include multiple operations on one item',
+                                   'TransactWriteItems')
+            seen.add((table.name, key))
+            operations.append((kind, request, table, key, item))
+
+        # All conditions are checked before anything is written, holding
+        # every table involved, so the transaction applies all or nothing
+        tables = sorted({table.name: table for _, _, table, _, _ in operations}.items())
+        with contextlib.ExitStack() as stack:
+            for _, table in tables:
+                stack.enter_context(table._lock)
+
+            reasons = []
+            for kind, request, table, key, item in operations:
+                existing = table.items.get(key)
+                condition = request.get('ConditionExpression')
+                names = request.get('ExpressionAttributeNames')
+                values = self._plain(request.get('ExpressionAttributeValues'))
+                if condition and not _Expression(names, values).condition(existing or {}, condition):
+                    reason = {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'}
+                    if existing is not None and request.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD':
+                        serializer = TypeSerializer()
+                        reason['Item'] = {name: serializer.serialize(value) for name, value in existing.items()}
+                    reasons.append(reason)
+                else:
+                    reasons.append({'Code': 'None'})
+
+            if any(reason['Code'] != 'None' for reason in reasons):
+                error = client_error('TransactionCanceledException',
+                                     'Transaction cancelled, please refer cancellation reasons for specific reasons '
+                                     f"[{', '.join(reason['Code'] for reason in reasons)}]", 'TransactWriteItems')
+                error.response['CancellationReasons'] = reasons
+                raise error
+
+            for kind, request, table, key, item in operations:
+                existing = table.items.get(key)
+                if kind == 'Put':
+                    table.items[key] = item
+                    table._changed(existing, item)
+                elif kind == 'Delete':
+                    table.items.pop(key, None)
+                    table._changed(existing, None)
+                elif kind == 'Update':
+                    updated = copy.deepcopy(existing) if existing is not None else self._plain(request['Key'])
+                    _Expression(request.get('ExpressionAttributeNames'),
+                                self._plain(request.get('ExpressionAttributeValues'))).update(
+                        updated, request['UpdateExpression'])
+                    table.items[key] = updated
+                    table._changed(existing, updated)
+        if ClientRequestToken is not None:
+            with self._tokens_lock:
+                self._tokens[ClientRequestToken] = copy.deepcopy(TransactItems)
+        return {}
+
+# --- SQS ----------------------------------------------------------------------------
+
+class FakeQueue:
+    def __init__(self, url, dlq_url=None, max_receive_count=None):
+        self.url = url
+        self.dlq_url = dlq_url
+        self.max_receive_count = max_receive_count
+        self.messages = deque()
+        self.sent = 0
+        self.dropped = 0
+
+class FakeSQS:
+    """
+    boto3.client('sqs') stand-in with delay, redelivery and redrive support.
+    Time comes from a pluggable clock so simulations can fast-forward delays.
+    """
+
+    def __init__(self, stats=None, clock=time.time):
+        self.stats = stats or CallStats()
+        self.queues = {}
+        self.clock = clock
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create_queue(self, url, dlq_url=None, max_receive_count=None):
+        self.queues[url] = FakeQueue(url, dlq_url, max_receive_count)
+        return self.queues[url]
+
+    def _queue(self, url, operation):
+        if url not in self.queues:
+            raise client_error('AWS.SimpleQueueService.NonExistentQueue', f"Queue {url} does not exist", operation)
+        return self.queues[url]
+
+    def _enqueue(self, queue, body, attributes=None, delay_seconds=0):
+        if len(body.encode('utf-8')) > 262144:
+            raise client_error('InvalidParameterValue', 'Message must be shorter than 262144 bytes', 'SendMessage')
+        message = {
+            'MessageId': str(uuid.UUID(int=next(self._ids))),
+            'Body': body,
+            'MessageAttributes': attributes or {},
+            'ReceiveCount': 0,
+            'SentTimestamp': int(self.clock() * 1000),
+            'VisibleAt': self.clock() + (delay_seconds or 0)
+        }
+        with self._lock:
+            queue.messages.append(message)
+            queue.sent += 1
+        return message
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None, DelaySeconds=0, **kwargs):
+        self.stats.record('SendMessage')
+        message = self._enqueue(self._queue(QueueUrl, 'SendMessage'), MessageBody, MessageAttributes, DelaySeconds)
+        return {'MessageId': message['MessageId']}
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        self.stats.record('SendMessageBatch')
+        if len(Entries) > 10:
+            raise client_error('AWS.SimpleQueueService.TooManyEntriesInBatchRequest',
+                               'Maximum number of entries per request are 10', 'SendMessageBatch')
+        queue = self._queue(QueueUrl, 'SendMessageBatch')
+        successful = []
+        for entry in Entries:
+            message = self._enqueue(queue, entry['MessageBody'], entry.get('MessageAttributes'),
+                                    entry.get('DelaySeconds', 0))
+            successful.append({'Id': entry['Id'], 'MessageId': message['MessageId']})
+        return {'Successful': successful, 'Failed': []}
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=None, **kwargs):
+        self.stats.record('GetQueueAttributes')
+        queue = self._queue(QueueUrl, 'GetQueueAttributes')
+        now = self.clock()
+        with self._lock:
+            visible = sum(1 for message in queue.messages if message['VisibleAt'] <= now)
+        return {'Attributes': {
+            'ApproximateNumberOfMessages': str(visible),
+            'ApproximateNumberOfMessagesDelayed': str(len(queue.messages) - visible),
+            'ApproximateNumberOfMessagesNotVisible': '0'
+        }}
+
+    # Event source mapping helpers used by the simulator (not SQS API calls)
+
+    def receive_records(self, url, max_records):
+        """
+        Take up to max_records visible messages as Lambda SQS event records
+        """
+        queue = self.queues[url]
+        now = self.clock()
+        records = []
+        with self._lock:
+            remaining = deque()
+            while queue.messages:
+                message = queue.messages.popleft()
+                if len(records) < max_records and message['VisibleAt'] <= now:
+                    message['ReceiveCount'] += 1
+                    records.append(message)
+                else:
+                    remaining.append(message)
+            queue.messages = remaining
+        return [self.to_record(url, message) for message in records], records
+
+    def to_record(self, url, message):
+        return {
+            'messageId': message['MessageId'],
+            'receiptHandle': f"handle-{message['MessageId']}",
+            'body': message['Body'],
+            'attributes': {
+                'ApproximateReceiveCount': str(message['ReceiveCount']),
+                'SentTimestamp': str(message['SentTimestamp'])
+            },
+            'messageAttributes': {
+                name: {'stringValue': value.get('StringValue'), 'dataType': value.get('DataType', 'String')}
+                for name, value in message['MessageAttributes'].items()
+            },
+            'eventSource': 'aws:sqs',
+            'eventSourceARN': f"arn:aws:sqs:local:000000000000:{url.rsplit('/', 1)[-1]}"
+        }
+
+    def return_messages(self, url, messages):
+        """
+        Messages reported in batchItemFailures become visible again, or are
+        redriven to the DLQ once they exceed maxReceiveCount. Queues with a
+        maxReceiveCount but no DLQ drop them instead of cycling forever.
+        """
+        queue = self.queues[url]
+        for message in messages:
+            if queue.max_receive_count and message['ReceiveCount'] >= queue.max_receive_count:
+                with self._lock:
+                    if queue.dlq_url:
+                        dlq = self.queues[queue.dlq_url]
+                        dlq.messages.append({**message, 'ReceiveCount': 0, 'VisibleAt': self.clock()})
+                        dlq.sent += 1
+                    else:
+                        queue.dropped += 1
+            else:
+                with self._lock:
+                    queue.messages.append(message)
+
+    def depth(self, url):
+        return len(self.queues[url].messages)
+
+    def next_visible_at(self, url):
+        messages = self.queues[url].messages
+        return min((message['VisibleAt'] for message in messages), default=None)
+
+# --- Step Functions ---------------------------------------------------------------
+
+class FakeStepFunctions:
+    """
+    boto3.client('stepfunctions') stand-in; executions are queued and run
+    later by the simulator
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats or CallStats()
+        self.pending = deque()
+        self.names = set()
+        self._lock = threading.Lock()
+
+    def start_execution(self, stateMachineArn, name, input, **kwargs):
+        self.stats.record('StartExecution')
+        execution_arn = f"{stateMachineArn.replace(':stateMachine:', ':execution:')}:{name}"
+        with self._lock:
+            if execution_arn in self.names:
+                raise client_error('ExecutionAlreadyExists', f"Execution already exists: '{execution_arn}'",
+                                   'StartExecution')
+            self.names.add(execution_arn)
+            self.pending.append({'executionArn': execution_arn, 'input': input})
+        return {'executionArn': execution_arn, 'startDate': time.time()}
+
+class FakeContext:
+    """
+    Minimal Lambda context object
+    """
+
+    def __init__(self, function_name, region='us-west-2', account_id='000000000000', timeout_ms=30000):
+        self.function_name = function_name
+        self.invoked_function_arn = f"arn:aws:lambda:{region}:{account_id}:function:{function_name}"
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.time() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+def to_decimal_tree(value):
+    """
+    Helper for seeding fake tables with JSON-ish data
+    """
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {key: to_decimal_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_decimal_tree(item) for item in value]
+    return value
@@ -0,0 +1,123 @@
+"""
+Micro-benchmark: shared order_codec vs the legacy float/Decimal round trips
+
+Replays one order through the storage -> SQS -> fulfillment hop both ways:
+
+  legacy: convert_floats_to_decimal -> convert_decimal_to_float ->
+          json.dumps -> json.loads -> convert_floats_to_decimal
+  codec:  to_dynamo -> dumps -> parse_message_body
+
+Usage:
+    python benchmarks/codec_benchmark.py [--items 1 10 100 1000] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'shared', 'python'))
+
+import order_codec
+
+def convert_floats_to_decimal(obj):
+    """
+    Legacy converter previously copied into each Lambda
+    """
+    if isinstance(obj, list):
+        return [convert_floats_to_decimal(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {key: convert_floats_to_decimal(value) for key, value in obj.items()}
+    elif isinstance(obj, float):
+        return Decimal(str(obj))
+    else:
+        return obj
+
+def convert_decimal_to_float(obj):
+    """
+    Legacy converter previously used by order_storage
+    """
+    if isinstance(obj, list):
+        return [convert_decimal_to_float(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {key: convert_decimal_to_float(value) for key, value in obj.items()}
+    elif isinstance(obj, Decimal):
+        return float(obj)
+    else:
+        return obj
+
+def build_order(item_count):
+    """
+    Build an order shaped like the ones the validator hands to order_storage
+    """
+    items = [
+        {
+            'product_id': f"PROD-{i:05d}",
+            'product_name': f"Product {i}",
+            'quantity': (i % 5) + 1,
+            'unit_price': round(4.99 + (i % 37) * 1.25, 2)
+        }
+        for i in range(item_count)
+    ]
+    return {
+        'order_id': 'BENCH-0001',
+        'customer_name': 'Bench User',
+        'customer_email': 'bench@example.com',
+        'created_at': '2025-01-01T00:00:00',
+        'status': 'VALIDATED',
+        'items': items,
+        'total_amount': round(sum(item['quantity'] * item['unit_price'] for item in items), 2),
+        'calculated_total_amount': round(sum(item['quantity'] * item['unit_price'] for item in items), 2),
+        'shipping_address': {'street': '123 Main St', 'city': 'Anytown', 'state': 'CA', 'zip_code': '12345'}
+    }
+
+def legacy_path(order):
+    stored = convert_floats_to_decimal(order)
+    body = json.dumps(convert_decimal_to_float(stored))
+    return convert_floats_to_decimal(json.loads(body))
+
+def codec_path(order):
+    stored = order_codec.to_dynamo(order)
+    body = order_codec.dumps(stored)
+    return order_codec.parse_message_body(body)
+
+def measure(func, order, repeat):
+    """
+    Return (microseconds per call, peak KiB allocated during one call)
+    """
+    func(order)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(order)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    func(order)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed * 1e6, (peak - baseline) / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'items':>6} {'path':>7} {'us/order':>10} {'peak KiB':>10} {'speedup':>8}")
+    for item_count in args.items:
+        order = build_order(item_count)
+        assert legacy_path(order) == codec_path(order)
+        repeat = max(1, args.repeat // max(1, item_count // 100))
+        legacy = measure(legacy_path, order, repeat)
+        codec = measure(codec_path, order, repeat)
+        print(f"{item_count:>6} {'legacy':>7} {legacy[0]:>10.1f} {legacy[1]:>10.1f}")
+        print(f"{item_count:>6} {'codec':>7} {codec[0]:>10.1f} {codec[1]:>10.1f} {legacy[0] / codec[0]:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Cold-start profile: import time and client creation cost per Lambda handler
+
+Each handler is loaded in a fresh interpreter (python -X importtime) the
+way the Lambda runtime imports it during the init phase. The report shows:
+
+  import_ms   time to import the handler module (module-level code included)
+  clients_ms  time to create the boto3 clients/resources it uses, which the
+              shared aws_clients bootstrap defers to the first request
+  top imports the heaviest top-level imports by cumulative time
+
+No network access or AWS credentials are needed; clients are only built.
+
+Usage:
+    python benchmarks/cold_start_profile.py [--runs 5] [--top 5] [--json report.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HANDLERS = {
+    'api_handler': os.path.join('lambdas', 'api_handler', 'lambda_function.py'),
+    'validator': os.path.join('lambdas', 'validator', 'lambda_function.py'),
+    'order_storage': os.path.join('lambdas', 'order_storage', 'lambda_function.py'),
+    'fulfill_order': os.path.join('lambdas', 'fulfill_order', 'lambda_function.py'),
+    'dlq_processor': os.path.join('terraform', 'modules', 'sqs', 'dlq_processor.py'),
+    'redrive': os.path.join('lambdas', 'redrive', 'lambda_function.py'),
+    'order_aggregates': os.path.join('lambdas', 'order_aggregates', 'lambda_function.py'),
+}
+
+# Runs inside the child interpreter; prints one JSON line on stdout
+PROBE = r'''
+import importlib.util, json, sys, time
+path, handler_dir, shared_dir = sys.argv[1:4]
+sys.path[:0] = [handler_dir, shared_dir]
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('lambda_function', path)
+module = importlib.util.module_from_spec(spec)
+sys.modules['lambda_function'] = module
+spec.loader.exec_module(module)
+import_seconds = time.perf_counter() - started
+clients = {}
+for name, value in list(vars(module).items()):
+    if hasattr(type(value), '_resolve'):
+        started = time.perf_counter()
+        value._resolve()
+        clients[name] = time.perf_counter() - started
+print(json.dumps({'import': import_seconds, 'clients': clients}))
+'''
+
+def parse_importtime(stderr):
+    """
+    Top-level entries of -X importtime output as {package: cumulative_us}
+    """
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # Nested imports are indented two spaces per level
+        name = name[1:]
+        if name.startswith(' '):
+            continue
+        imports[name] = imports.get(name, 0) + int(cumulative_us)
+    return imports
+
+def profile_handler(name, path, env):
+    handler_path = os.path.join(REPO_ROOT, path)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, handler_path,
+         os.path.dirname(handler_path), os.path.join(REPO_ROOT, 'lambdas', 'shared', 'python')],
+        capture_output=True, text=True, env=env, check=True
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return probe, parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per handler (median is reported)')
+    parser.add_argument('--top', type=int, default=5, help='heaviest top-level imports to list')
+    parser.add_argument('--handlers', nargs='+', choices=sorted(HANDLERS), default=list(HANDLERS))
+    parser.add_argument('--json', help='write the machine-readable report to this path')
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-west-2'),
+        'AWS_ACCESS_KEY_ID': os.environ.get('AWS_ACCESS_KEY_ID', 'profile'),
+        'AWS_SECRET_ACCESS_KEY': os.environ.get('AWS_SECRET_ACCESS_KEY', 'profile'),
+        'PYTHONDONTWRITEBYTECODE': '1',
+    }
+
+    report = {}
+    print(f"{'handler':>14} {'import ms':>10} {'clients ms':>11}  top imports (cumulative ms)")
+    for name in args.handlers:
+        import_times, client_times, imports = [], [], {}
+        for _ in range(args.runs):
+            probe, run_imports = profile_handler(name, HANDLERS[name], env)
+            import_times.append(probe['import'] * 1000)
+            client_times.append(sum(probe['clients'].values()) * 1000)
+            for package, cumulative_us in run_imports.items():
+                imports.setdefault(package, []).append(cumulative_us / 1000)
+
+        top = sorted(((statistics.median(values), package) for package, values in imports.items()), reverse=True)
+        report[name] = {
+            'import_ms': round(statistics.median(import_times), 2),
+            'clients_ms': round(statistics.median(client_times), 2),
+            'clients': sorted(probe['clients']),
+            'top_imports_ms': {package: round(ms, 2) for ms, package in top[:args.top]},
+        }
+        summary = ', '.join(f"{package} {ms:.1f}" for ms, package in top[:args.top])
+        print(f"{name:>14} {report[name]['import_ms']:>10.2f} {report[name]['clients_ms']:>11.2f}  {summary}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
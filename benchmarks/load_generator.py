@@ -0,0 +1,348 @@
+"""
+Open-loop load generator for the order API (POST /order)
+
+Sends orders at a fixed target rate from a pool of worker threads, either
+to a deployed endpoint over HTTP or to api_handler in-process on the
+in-memory AWS fakes of pipeline_simulator.py. Orders are replayed from a
+JSONL file (one order body per line, cycled as needed) or generated with
+a configurable item-count distribution.
+
+The schedule is open loop: request i is due at start + i / rps whether or
+not earlier requests have finished. Latency is measured from that due
+time, so a saturated target or too few workers show up as queueing delay
+instead of silently lowering the offered rate. Service time (from the
+actual send) is reported separately.
+
+The report has p50/p90/p99/max latency, a latency histogram, status codes,
+error types and achieved throughput; --json writes it machine-readable.
+--max-p99-ms and --max-error-rate make the run exit non-zero.
+
+Usage:
+    python benchmarks/load_generator.py --target local [--pipeline-mode inline]
+        [--rps 200] [--duration 10 | --requests 2000] [--concurrency 32]
+        [--items 3 | --items 1:50,3:30,10:15,100:5] [--input orders.jsonl]
+        [--io-latency-ms 0] [--header 'x-api-key: ...'] [--json report.json]
+
+    python benchmarks/load_generator.py --target "$(cd terraform && terraform output -raw api_endpoint)" --rps 50
+"""
+
+import argparse
+import contextlib
+import http.client
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aws_fakes
+import pipeline_simulator
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+def parse_item_counts(spec):
+    """
+    "3" -> always 3 items; "1:50,3:30,10:20" -> 1, 3 or 10 items with
+    those relative weights
+    """
+    if ':' not in spec:
+        return [int(spec)], [1.0]
+    counts, weights = [], []
+    for entry in spec.split(','):
+        count, weight = entry.split(':')
+        counts.append(int(count))
+        weights.append(float(weight))
+    return counts, weights
+
+def order_source(args, rng):
+    """
+    Endless iterator of order bodies (JSON strings)
+    """
+    if args.input:
+        bodies = [json.dumps(order) for order in pipeline_simulator.load_orders(args.input, 0)]
+        if not bodies:
+            raise SystemExit(f"No orders in {args.input}")
+        return itertools.cycle(bodies)
+
+    counts, weights = parse_item_counts(args.items)
+
+    def generate():
+        for i in itertools.count():
+            item_count = rng.choices(counts, weights)[0]
+            yield json.dumps(pipeline_simulator.synthetic_order(i, item_count, args.invalid_rate, rng))
+    return generate()
+
+def parse_headers(values):
+    headers = {'Content-Type': 'application/json'}
+    for value in values:
+        name, _, content = value.partition(':')
+        headers[name.strip()] = content.strip()
+    return headers
+
+class HttpTarget:
+    """
+    POSTs to a deployed endpoint; one keep-alive connection per worker
+    """
+
+    def __init__(self, url, headers, timeout):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.headers = headers
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            factory = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = self._local.connection = factory(self.host, timeout=self.timeout)
+        return connection
+
+    def send(self, body):
+        connection = self._connection()
+        try:
+            connection.request('POST', self.path, body=body, headers=self.headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except Exception:
+            # Reconnect on the next request
+            connection.close()
+            self._local.connection = None
+            raise
+
+class LocalTarget:
+    """
+    Invokes api_handler in-process with API Gateway proxy events, on the
+    pipeline simulator's in-memory AWS fakes
+    """
+
+    def __init__(self, args, headers):
+        simulator_args = pipeline_simulator.build_parser().parse_args([])
+        simulator_args.pipeline_mode = args.pipeline_mode
+        simulator_args.io_latency_ms = args.io_latency_ms
+        simulator_args.seed = args.seed
+        simulator_args.admission_rate = args.admission_rate
+        simulator_args.admission_max_queue_depth = args.admission_max_queue_depth
+        self.simulator = pipeline_simulator.Simulator(simulator_args)
+        self.handler = self.simulator.modules['api_handler'].lambda_handler
+        self.context = aws_fakes.FakeContext('dofs-api-handler-load')
+        self.headers = headers
+
+    def send(self, body):
+        event = {'resource': '/order', 'path': '/order', 'httpMethod': 'POST',
+                 'headers': dict(self.headers), 'body': body}
+        return self.handler(event, self.context)['statusCode']
+
+class Recorder:
+    """
+    Per-request samples, appended from the worker threads
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.service_times = []
+        self.statuses = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency, service_time, status=None, error=None):
+        with self._lock:
+            self.latencies.append(latency)
+            self.service_times.append(service_time)
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+
+def run(target, bodies, total, rps, concurrency, recorder):
+    """
+    Issue total requests on the open-loop schedule (as fast as possible
+    when rps is 0) and return the elapsed seconds
+    """
+    schedule = queue.Queue()
+    start = time.perf_counter() + 0.05
+
+    def worker():
+        while True:
+            entry = schedule.get()
+            if entry is None:
+                return
+            due, body = entry
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                status = target.send(body)
+                error = None
+            except Exception as e:
+                status, error = None, type(e).__name__
+            done = time.perf_counter()
+            recorder.record(done - min(due, sent), done - sent, status, error)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for i in range(total):
+        due = start + i / rps if rps else time.perf_counter()
+        schedule.put((due, next(bodies)))
+    for _ in threads:
+        schedule.put(None)
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'p50_ms': round(pipeline_simulator.percentile(values, 50) * 1000, 3),
+        'p90_ms': round(pipeline_simulator.percentile(values, 90) * 1000, 3),
+        'p99_ms': round(pipeline_simulator.percentile(values, 99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3),
+    }
+
+def histogram(values):
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for value in values:
+        milliseconds = value * 1000
+        for index, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if milliseconds <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+    return [{'le_ms': label, 'count': count} for label, count in zip(labels, counts)]
+
+def report(args, recorder, elapsed, total):
+    completed = len(recorder.latencies)
+    failed = sum(recorder.errors.values()) + sum(
+        count for status, count in recorder.statuses.items() if status is None or status >= 500)
+    return {
+        'config': {
+            'target': args.target,
+            'pipeline_mode': args.pipeline_mode if args.target == 'local' else None,
+            'rps': args.rps,
+            'concurrency': args.concurrency,
+            'requests': total,
+            'items': None if args.input else args.items,
+            'input': args.input,
+            'io_latency_ms': args.io_latency_ms if args.target == 'local' else None,
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'achieved_rps': round(completed / elapsed, 2) if elapsed > 0 else None,
+        'completed': completed,
+        'latency': summarize(recorder.latencies),
+        'service_time': summarize(recorder.service_times),
+        'histogram': histogram(recorder.latencies),
+        'status_codes': {str(status): count for status, count in sorted(recorder.statuses.items())},
+        'errors': dict(sorted(recorder.errors.items())),
+        'error_rate': round(failed / completed, 4) if completed else None,
+    }
+
+def print_report(result):
+    latency = result['latency']
+    print(f"{result['completed']} requests in {result['elapsed_seconds']}s: {result['achieved_rps']} req/s "
+          f"(target {result['config']['rps'] or 'max'}, {result['config']['concurrency']} workers)")
+    print(f"latency      p50 {latency.get('p50_ms')} ms  p90 {latency.get('p90_ms')} ms  "
+          f"p99 {latency.get('p99_ms')} ms  max {latency.get('max_ms')} ms")
+    service = result['service_time']
+    print(f"service time p50 {service.get('p50_ms')} ms  p90 {service.get('p90_ms')} ms  "
+          f"p99 {service.get('p99_ms')} ms  max {service.get('max_ms')} ms")
+    print()
+    peak = max((bucket['count'] for bucket in result['histogram']), default=0) or 1
+    for bucket in result['histogram']:
+        if bucket['count']:
+            print(f"{bucket['le_ms']:>9} ms {bucket['count']:>8} {'#' * max(1, round(40 * bucket['count'] / peak))}")
+    print()
+    print(f"status codes: {result['status_codes']}  errors: {result['errors']}  error rate: {result['error_rate']}")
+
+def check_thresholds(result, args):
+    violations = []
+    p99 = result['latency'].get('p99_ms')
+    if args.max_p99_ms and p99 is not None and p99 > args.max_p99_ms:
+        violations.append(f"p99 latency {p99} ms > {args.max_p99_ms} ms")
+    if args.max_error_rate is not None and (result['error_rate'] or 0) > args.max_error_rate:
+        violations.append(f"error rate {result['error_rate']} > {args.max_error_rate}")
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', default='local', help="'local' for in-process api_handler, or the endpoint URL")
+    parser.add_argument('--rps', type=float, default=100.0, help='target requests per second (0 = as fast as possible)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load at the target rate')
+    parser.add_argument('--requests', type=int, default=0, help='number of requests (overrides --duration)')
+    parser.add_argument('--concurrency', type=int, default=32, help='worker threads')
+    parser.add_argument('--input', help='replay order bodies from a JSONL file, cycling through it')
+    parser.add_argument('--items', default='3', help="items per order: 'N' or weighted 'N:W,N:W,...'")
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help='fraction of synthetic orders failing validation')
+    parser.add_argument('--header', action='append', default=[], metavar='NAME: VALUE',
+                        help='extra request header (repeatable)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='HTTP timeout in seconds')
+    parser.add_argument('--pipeline-mode', choices=['stepfunctions', 'inline'], default='stepfunctions',
+                        help='local target: start executions or run the pipeline in-process')
+    parser.add_argument('--io-latency-ms', type=float, default=0.0,
+                        help='local target: artificial latency per AWS API call')
+    parser.add_argument('--admission-rate', type=float, default=0.0,
+                        help='local target: api_handler orders/s per client (0 = off)')
+    parser.add_argument('--admission-max-queue-depth', type=int, default=0,
+                        help='local target: shed orders while the order queue is deeper than this (0 = off)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="write the machine-readable report to this path ('-' for stdout)")
+    parser.add_argument('--max-p99-ms', type=float, default=0.0, help='fail when p99 latency exceeds this')
+    parser.add_argument('--max-error-rate', type=float, help='fail when the error rate (5xx and errors) exceeds this')
+    parser.add_argument('--verbose', action='store_true', help='local target: show handler logs and EMF output')
+    args = parser.parse_args()
+
+    if args.requests:
+        total = args.requests
+    elif args.rps:
+        total = int(args.rps * args.duration)
+    else:
+        parser.error('--rps 0 needs --requests')
+
+    rng = random.Random(args.seed)
+    bodies = order_source(args, rng)
+    headers = parse_headers(args.header)
+
+    logging.getLogger().addHandler(logging.StreamHandler() if args.verbose else logging.NullHandler())
+    target = LocalTarget(args, headers) if args.target == 'local' else HttpTarget(args.target, headers, args.timeout)
+
+    recorder = Recorder()
+    # EMF metric lines from the local handler go to stdout; keep them out of the report
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(sys.stdout if args.verbose or args.target != 'local' else devnull):
+        elapsed = run(target, bodies, total, args.rps, args.concurrency, recorder)
+
+    result = report(args, recorder, elapsed, total)
+    if args.json == '-':
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(result, f, indent=2)
+
+    violations = check_thresholds(result, args)
+    for violation in violations:
+        print(f"THRESHOLD FAILED: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: order queue message bodies, plain JSON vs the envelope
+
+Encodes a stored order the way order_storage sends it to the order queue
+and decodes it the way fulfill_order reads it:
+
+  json:      order_codec.dumps -> parse_message_body (the format before
+             the envelope, still written with ORDER_MESSAGE_FORMAT=json)
+  envelope:  order_codec.encode_message -> parse_message_body
+
+Usage:
+    python benchmarks/message_format_benchmark.py [--items 1 10 100 1000] [--repeat 500]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'shared', 'python'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import order_codec
+from codec_benchmark import build_order
+
+def stored_order(item_count):
+    """
+    An order as order_storage writes it to DynamoDB and the queue
+    """
+    order = build_order(item_count)
+    order.update({
+        'order_id': '6f1c2a9e-3b7d-4c1e-9a52-0d8e7f6b4c21',
+        'status': 'STORED',
+        'validation_timestamp': '2026-01-01T00:00:00.412345',
+        'storage_timestamp': '2026-01-01T00:00:00.512345',
+        'updated_at': '2026-01-01T00:00:00.512345',
+        'status_shard': 'STORED#2026-01-01#3',
+        'order_metadata': {'source': 'api', 'version': '1.0'},
+        'order_summary': {'total_items': item_count, 'total_quantity': 3 * item_count, 'currency': 'USD'}
+    })
+    return order_codec.to_dynamo(order)
+
+def encode_json(order):
+    return order_codec.dumps(order)
+
+def encode_envelope(order):
+    return order_codec.encode_message(order)
+
+def measure(func, argument, repeat):
+    """
+    Microseconds per call
+    """
+    func(argument)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(argument)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    # Compare against plain JSON even if the environment selects it
+    order_codec.MESSAGE_FORMAT = 'envelope'
+
+    print(f"{'items':>6} {'format':>9} {'bytes':>9} {'encode us':>10} {'decode us':>10} {'size':>7}")
+    for item_count in args.items:
+        order = stored_order(item_count)
+        repeat = max(1, args.repeat // max(1, item_count // 100))
+        json_body = encode_json(order)
+        envelope_body = encode_envelope(order)
+        assert order_codec.parse_message_body(json_body) == order_codec.parse_message_body(envelope_body)
+
+        for name, encode, body in (('json', encode_json, json_body), ('envelope', encode_envelope, envelope_body)):
+            encode_us = measure(encode, order, repeat)
+            decode_us = measure(order_codec.parse_message_body, body, repeat)
+            print(f"{item_count:>6} {name:>9} {len(body.encode('utf-8')):>9} {encode_us:>10.1f} {decode_us:>10.1f} "
+                  f"{len(body) / len(json_body):>6.0%}")
+
+if __name__ == '__main__':
+    main()
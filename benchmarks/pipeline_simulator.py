@@ -0,0 +1,723 @@
+"""
+End-to-end pipeline simulator: the real Lambda handlers on in-memory AWS
+
+Loads api_handler, validator, order_storage, fulfill_order, the DLQ
+processor and the order aggregates stream consumer from the repository,
+points their boto3 globals at the stand-ins in aws_fakes.py and replays an
+order stream through the whole pipeline:
+
+  api_handler -> Step Functions (ValidateOrder -> StoreOrder -> SendToQueue)
+              -> order queue -> fulfill_order -> DLQ -> dlq_processor
+  orders / failed_orders streams -> order_aggregates
+
+Failed fulfillments come back through their delayed retry messages; the
+virtual clock skips ahead to each delivery, and to each due retry-sweep
+index entry, for which fulfill_order's scheduled sweep is invoked.
+
+Reports end-to-end orders/second, per-stage latency percentiles, optional
+per-invocation allocations (tracemalloc), AWS API calls per order and the
+per-hop breakdown of every order's trace on the virtual clock. The
+--min-throughput and --max-p99-ms thresholds make the run exit non-zero,
+so CI can catch performance regressions without an AWS account.
+
+Usage:
+    python benchmarks/pipeline_simulator.py [--orders 1000] [--items 3]
+        [--pipeline-mode stepfunctions|inline] [--api-batch-size 0]
+        [--input orders.jsonl] [--io-latency-ms 0] [--trace-allocations]
+        [--json report.json] [--min-throughput 100] [--max-p99-ms fulfill_order=50]
+        [--retry-base-seconds 30] [--retry-max-delay-seconds 3600]
+        [--inventory-stock 0] [--hot-skus 0] [--hot-sku-shards 8]
+        [--stream-batch-size 500]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'lambdas', 'shared', 'python'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'lambdas', 'fulfill_order'))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'lambdas', 'api_handler'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aws_fakes
+
+ORDERS_TABLE = 'dofs-orders-sim'
+FAILED_ORDERS_TABLE = 'dofs-failed-orders-sim'
+LEDGER_TABLE = 'dofs-fulfillment-ledger-sim'
+INVENTORY_TABLE = 'dofs-inventory-sim'
+IDEMPOTENCY_TABLE = 'dofs-order-idempotency-sim'
+AGGREGATES_TABLE = 'dofs-order-aggregates-sim'
+ORDER_QUEUE_URL = 'https://sqs.local/000000000000/dofs-order-queue-sim'
+DLQ_URL = 'https://sqs.local/000000000000/dofs-order-dlq-sim'
+
+# Same wiring as terraform/modules/sqs and terraform/modules/dynamodb
+MAX_RECEIVE_COUNT = 3
+# Upper bound on sweep rounds, in case retries keep landing in the DLQ
+MAX_RETRY_SWEEPS = 1000
+# Matches the default retry_sweep_schedule, rate(1 minute)
+RETRY_SWEEP_INTERVAL_SECONDS = 60
+# Synthetic orders draw product IDs from PROD-00001..PROD-05000
+PRODUCT_COUNT = 5000
+
+HANDLERS = {
+    'api_handler': os.path.join('lambdas', 'api_handler', 'lambda_function.py'),
+    'validator': os.path.join('lambdas', 'validator', 'lambda_function.py'),
+    'order_storage': os.path.join('lambdas', 'order_storage', 'lambda_function.py'),
+    'fulfill_order': os.path.join('lambdas', 'fulfill_order', 'lambda_function.py'),
+    'dlq_processor': os.path.join('terraform', 'modules', 'sqs', 'dlq_processor.py'),
+    'order_aggregates': os.path.join('lambdas', 'order_aggregates', 'lambda_function.py'),
+}
+
+class VirtualClock:
+    """
+    Wall clock that can be fast-forwarded past SQS message delays
+    """
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def now(self):
+        return time.time() + self.offset
+
+    def advance_to(self, timestamp):
+        self.offset += max(0.0, timestamp - self.now())
+
+class StageStats:
+    """
+    Latency and allocation samples for one pipeline stage
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.durations = []
+        self.allocations = []
+        self.errors = 0
+        self.records = 0
+
+    def summary(self):
+        durations = sorted(self.durations)
+        result = {
+            'invocations': len(durations),
+            'records': self.records,
+            'errors': self.errors,
+            'total_ms': round(sum(durations) * 1000, 3),
+        }
+        if durations:
+            result.update({
+                'mean_ms': round(sum(durations) / len(durations) * 1000, 4),
+                'p50_ms': round(percentile(durations, 50) * 1000, 4),
+                'p90_ms': round(percentile(durations, 90) * 1000, 4),
+                'p99_ms': round(percentile(durations, 99) * 1000, 4),
+                'max_ms': round(durations[-1] * 1000, 4),
+            })
+        if self.allocations:
+            result['alloc_mean_kib'] = round(sum(self.allocations) / len(self.allocations) / 1024, 2)
+            result['alloc_max_kib'] = round(max(self.allocations) / 1024, 2)
+        return result
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class Simulator:
+    """
+    Owns the fakes, the loaded handler modules and the per-stage statistics
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.clock = VirtualClock()
+        self.rng = random.Random(args.seed)
+        self.stats = aws_fakes.CallStats(latency=args.io_latency_ms / 1000.0)
+        self.dynamodb = aws_fakes.FakeDynamoDB(self.stats, unprocessed_rate=args.unprocessed_rate, rng=self.rng)
+        self.sqs = aws_fakes.FakeSQS(self.stats, clock=self.clock.now)
+        self.stepfunctions = aws_fakes.FakeStepFunctions(self.stats)
+        self.stages = {}
+        self._depth = 0
+        self.retry_sweeps = 0
+        self.stream_records = 0
+
+        self.dynamodb.create_table(ORDERS_TABLE, 'order_id',
+                                   indexes={'status-shard-updated_at-index': ('status_shard', 'updated_at'),
+                                            'retry-sweep-index': ('retry_shard', 'retry_sweep_at')})
+        self.dynamodb.create_table(FAILED_ORDERS_TABLE, 'order_id',
+                                   indexes={'failed-shard-failed_at-index': ('failed_shard', 'failed_at')})
+        self.dynamodb.create_table(LEDGER_TABLE, 'idempotency_key')
+        self.dynamodb.create_table(INVENTORY_TABLE, 'stock_key')
+        self.dynamodb.create_table(IDEMPOTENCY_TABLE, 'idempotency_key')
+        self.dynamodb.create_table(AGGREGATES_TABLE, 'aggregate', 'bucket')
+        # Same stream view as terraform/modules/dynamodb
+        self.dynamodb.tables[ORDERS_TABLE].enable_stream()
+        self.dynamodb.tables[FAILED_ORDERS_TABLE].enable_stream()
+        self.sqs.create_queue(DLQ_URL, max_receive_count=MAX_RECEIVE_COUNT)
+        self.sqs.create_queue(ORDER_QUEUE_URL, dlq_url=DLQ_URL, max_receive_count=MAX_RECEIVE_COUNT)
+
+        self.configure_environment()
+        self.modules = self.load_handlers()
+
+    def configure_environment(self):
+        """
+        Environment variables normally set by terraform/modules/lambdas
+        """
+        os.environ.update({
+            'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-west-2'),
+            'PROJECT_NAME': 'dofs',
+            'ENVIRONMENT': 'sim',
+            'PIPELINE_MODE': self.args.pipeline_mode,
+            'ORDERS_TABLE_NAME': ORDERS_TABLE,
+            'FAILED_ORDERS_TABLE_NAME': FAILED_ORDERS_TABLE,
+            'FULFILLMENT_LEDGER_TABLE_NAME': LEDGER_TABLE,
+            'IDEMPOTENCY_TABLE_NAME': IDEMPOTENCY_TABLE,
+            'ORDER_AGGREGATES_TABLE_NAME': AGGREGATES_TABLE,
+            'ORDER_QUEUE_URL': ORDER_QUEUE_URL,
+            'DLQ_URL': DLQ_URL,
+            'FULFILLMENT_RETRY_BASE_SECONDS': str(self.args.retry_base_seconds),
+            'FULFILLMENT_RETRY_MAX_DELAY_SECONDS': str(self.args.retry_max_delay_seconds),
+        })
+
+    def load_handlers(self):
+        """
+        Import every handler under its own module name and swap its boto3
+        globals for the in-memory fakes
+        """
+        import order_pipeline
+
+        modules = {}
+        for name, path in HANDLERS.items():
+            module = order_pipeline.load_stage_module(f"sim_{name}", [os.path.join(REPO_ROOT, path)])
+            for attribute, fake in (('dynamodb', self.dynamodb), ('sqs', self.sqs),
+                                    ('stepfunctions', self.stepfunctions)):
+                if hasattr(module, attribute):
+                    setattr(module, attribute, fake)
+            modules[name] = module
+
+        modules['fulfill_order'].FULFILLMENT_CONCURRENCY = self.args.fulfillment_concurrency
+
+        # Admission control samples the fake queues; buckets refill in real time
+        import admission
+        admission.CLIENT_RATE = self.args.admission_rate
+        admission.CLIENT_BURST = 2 * self.args.admission_rate
+        admission.MAX_QUEUE_DEPTH = self.args.admission_max_queue_depth
+        admission.buckets.clear()
+        admission.signal.update(sampled_at=None, queue_depth=None, dlq_depth=None, drain_rate=None,
+                                dlq_growth=0.0, throttled_until=0.0)
+        import idempotency_keys
+        idempotency_keys.cache.clear()
+        idempotency_keys.seen = idempotency_keys.BloomFilter(idempotency_keys.FILTER_CAPACITY)
+
+        # Retry due times follow the virtual clock
+        import retry_scheduler
+        retry_scheduler.clock = self.clock.now
+
+        # Order traces too, so queue delays and retry backoff show up as waits
+        import tracing
+        tracing.clock = self.clock.now
+        tracing.sink = self.traces = []
+
+        # Claim checks go to a local directory standing in for S3
+        import claim_check
+        if self.args.claim_check_bytes:
+            claim_check.store = claim_check.FileStore(tempfile.mkdtemp(prefix='dofs-claim-check-'))
+            claim_check.THRESHOLD_BYTES = self.args.claim_check_bytes
+        else:
+            claim_check.store = None
+
+        # Every product starts with the same stock, loaded outside the API counts
+        import inventory
+        inventory.clock = self.clock.now
+        inventory.stock_cache.clear()
+        inventory.TABLE_NAME = INVENTORY_TABLE if self.args.inventory_stock else None
+        inventory.HOT_SKUS = frozenset(product_id(i) for i in range(1, self.args.hot_skus + 1))
+        inventory.HOT_SKU_SHARDS = self.args.hot_sku_shards
+        if self.args.inventory_stock:
+            table = self.dynamodb.tables[INVENTORY_TABLE]
+            for i in range(1, PRODUCT_COUNT + 1):
+                for row in inventory.stock_rows(product_id(i), self.args.inventory_stock):
+                    table.items[row['stock_key']] = aws_fakes.to_decimal_tree(row)
+
+        # Step Functions passes JSON between states, so each task sees a
+        # freshly decoded event just as the Lambda runtime would deliver it;
+        # inline mode hands the state dicts over directly
+        marshal = self.args.pipeline_mode != order_pipeline.PIPELINE_MODE_INLINE
+        self.pipeline = order_pipeline.OrderPipeline(
+            validate_handler=self.task('validator', modules['validator'].lambda_handler, marshal),
+            store_handler=self.task('order_storage', modules['order_storage'].lambda_handler, marshal),
+            sqs_client=self.sqs,
+            order_queue_url=ORDER_QUEUE_URL,
+            dlq_url=DLQ_URL
+        )
+        if not marshal:
+            modules['api_handler'].inline_pipeline = self.pipeline
+        return modules
+
+    def task(self, name, handler, marshal):
+        import order_codec
+
+        def invoke(event, context):
+            if marshal:
+                event = json.loads(order_codec.dumps(event, lenient=True))
+            return self.timed(name, handler, event, aws_fakes.FakeContext(name), records=1)
+        return invoke
+
+    def timed(self, name, handler, event, context, records=0):
+        """
+        Invoke a handler and record its latency. Allocation peaks are only
+        taken for the outermost stage, since nested stages share the peak.
+        """
+        stage = self.stages.setdefault(name, StageStats(name))
+        measure_allocations = self.args.trace_allocations and self._depth == 0
+        if measure_allocations:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return handler(event, context)
+        except Exception:
+            stage.errors += 1
+            raise
+        finally:
+            stage.durations.append(time.perf_counter() - start)
+            stage.records += records
+            self._depth -= 1
+            if measure_allocations:
+                stage.allocations.append(tracemalloc.get_traced_memory()[1] - baseline)
+
+    # --- phases ------------------------------------------------------------------
+
+    def submit(self, orders):
+        """
+        POST each order (or --api-batch-size chunks) through api_handler
+        """
+        handler = self.modules['api_handler'].lambda_handler
+        context = aws_fakes.FakeContext('dofs-api-handler-sim')
+        statuses = {}
+
+        if self.args.api_batch_size:
+            requests = [
+                {'resource': '/orders/batch', 'httpMethod': 'POST',
+                 'body': json.dumps(orders[start:start + self.args.api_batch_size])}
+                for start in range(0, len(orders), self.args.api_batch_size)
+            ]
+        else:
+            requests = [
+                {'resource': '/order', 'httpMethod': 'POST', 'body': json.dumps(order)}
+                for order in orders
+            ]
+            if self.args.duplicate_rate:
+                # Client retries: resend some orders with the same Idempotency-Key
+                rng = random.Random(self.args.seed)
+                keyed = []
+                for i, request in enumerate(requests):
+                    request['headers'] = {'Idempotency-Key': f"sim-{i}"}
+                    keyed.append(request)
+                    if rng.random() < self.args.duplicate_rate:
+                        keyed.append(request)
+                requests = keyed
+
+        for request in requests:
+            response = self.timed('api_handler', handler, request, context,
+                                  records=len(json.loads(request['body'])) if self.args.api_batch_size else 1)
+            status = response['statusCode']
+            statuses[status] = statuses.get(status, 0) + 1
+        return statuses
+
+    def run_executions(self):
+        """
+        Run every started Step Functions execution through the pipeline
+        """
+        context = aws_fakes.FakeContext('dofs-order-processor-sim')
+        results = {}
+        while self.stepfunctions.pending:
+            execution = self.stepfunctions.pending.popleft()
+            result = self.timed('execution', lambda event, ctx: self.pipeline.run(event, ctx),
+                                json.loads(execution['input']), context, records=1)
+            results[result['status']] = results.get(result['status'], 0) + 1
+        return results
+
+    def drain(self, stage_name, queue_url, handler, batch_size):
+        """
+        Poll a queue the way an SQS event source mapping does, honouring
+        batchItemFailures and fast-forwarding over delayed messages
+        """
+        context = aws_fakes.FakeContext(stage_name)
+        while True:
+            records, messages = self.sqs.receive_records(queue_url, batch_size)
+            if not records:
+                next_visible = self.sqs.next_visible_at(queue_url)
+                if next_visible is None:
+                    return
+                self.clock.advance_to(next_visible)
+                continue
+
+            try:
+                response = self.timed(stage_name, handler, {'Records': records}, context, records=len(records))
+                failed_ids = {failure['itemIdentifier'] for failure in (response or {}).get('batchItemFailures', [])}
+            except Exception:
+                # A raised error fails the whole batch
+                failed_ids = {message['MessageId'] for message in messages}
+            self.sqs.return_messages(queue_url, [m for m in messages if m['MessageId'] in failed_ids])
+
+    def aggregate(self):
+        """
+        Feed the orders and failed_orders streams to order_aggregates, one
+        event source mapping per table
+        """
+        handler = self.modules['order_aggregates'].lambda_handler
+        context = aws_fakes.FakeContext('dofs-order-aggregates-sim')
+        for table_name in (ORDERS_TABLE, FAILED_ORDERS_TABLE):
+            stream = self.dynamodb.tables[table_name].stream
+            while stream:
+                records = [stream.popleft() for _ in range(min(self.args.stream_batch_size, len(stream)))]
+                self.stream_records += len(records)
+                response = self.timed('order_aggregates', handler, {'Records': records}, context, records=len(records))
+                failures = response['batchItemFailures']
+                if failures:
+                    # Retried from the first record that was not applied
+                    sequence = failures[0]['itemIdentifier']
+                    failed_at = next(index for index, record in enumerate(records)
+                                     if record['dynamodb']['SequenceNumber'] == sequence)
+                    stream.extendleft(reversed(records[failed_at:]))
+
+    def aggregates_consistent(self):
+        """
+        Whether the stream-maintained counters equal a recount of both tables
+        """
+        import order_aggregates
+        expected = order_aggregates.totals(self.dynamodb.tables[ORDERS_TABLE].items.values(),
+                                           self.dynamodb.tables[FAILED_ORDERS_TABLE].items.values())
+        stored = order_aggregates.prune({
+            (item['aggregate'], item['bucket']): {field: value for field, value in item.items()
+                                                  if field not in ('aggregate', 'bucket', 'updated_at')}
+            for item in self.dynamodb.tables[AGGREGATES_TABLE].items.values()
+        })
+        return stored == expected
+
+    def next_retry_sweep(self):
+        """
+        Earliest retry_sweep_at still in the orders table's retry index
+        """
+        due = [item['retry_sweep_at'] for item in self.dynamodb.tables[ORDERS_TABLE].items.values()
+               if 'retry_sweep_at' in item]
+        return float(min(due)) if due else None
+
+    def fulfill(self):
+        """
+        Drain the order queue, then run the scheduled retry sweep whenever
+        index entries come due, until no retries are outstanding
+        """
+        handler = self.modules['fulfill_order'].lambda_handler
+        context = aws_fakes.FakeContext('fulfill_order')
+        for _ in range(MAX_RETRY_SWEEPS):
+            self.drain('fulfill_order', ORDER_QUEUE_URL, handler, self.args.batch_size)
+            due = self.next_retry_sweep()
+            if due is None:
+                return
+            self.clock.advance_to(max(due, self.clock.now() + RETRY_SWEEP_INTERVAL_SECONDS))
+            self.timed('retry_sweep', handler, {'source': 'aws.events', 'detail-type': 'Scheduled Event'}, context)
+            self.retry_sweeps += 1
+
+    def run(self, orders):
+        if self.args.trace_allocations:
+            tracemalloc.start()
+
+        phases = {}
+        start = time.perf_counter()
+
+        phase_start = time.perf_counter()
+        api_statuses = self.submit(orders)
+        phases['submit'] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        execution_results = self.run_executions()
+        phases['executions'] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        self.fulfill()
+        phases['fulfillment'] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        self.drain('dlq_processor', DLQ_URL, self.modules['dlq_processor'].lambda_handler,
+                   self.args.dlq_batch_size)
+        phases['dlq'] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        self.aggregate()
+        phases['aggregates'] = time.perf_counter() - phase_start
+
+        elapsed = time.perf_counter() - start
+        if self.args.trace_allocations:
+            tracemalloc.stop()
+
+        return self.report(orders, elapsed, phases, api_statuses, execution_results)
+
+    def report(self, orders, elapsed, phases, api_statuses, execution_results):
+        order_statuses = {}
+        for item in self.dynamodb.tables[ORDERS_TABLE].items.values():
+            status = item.get('status', 'UNKNOWN')
+            order_statuses[status] = order_statuses.get(status, 0) + 1
+
+        return {
+            'config': {
+                'orders': len(orders),
+                'pipeline_mode': self.args.pipeline_mode,
+                'api_batch_size': self.args.api_batch_size,
+                'fulfillment_batch_size': self.args.batch_size,
+                'fulfillment_concurrency': self.args.fulfillment_concurrency,
+                'io_latency_ms': self.args.io_latency_ms,
+                'seed': self.args.seed,
+            },
+            'elapsed_seconds': round(elapsed, 4),
+            'orders_per_second': round(len(orders) / elapsed, 2) if elapsed else None,
+            'phases_seconds': {name: round(value, 4) for name, value in phases.items()},
+            'stages': {name: stage.summary() for name, stage in self.stages.items()},
+            'api_calls': dict(sorted(self.stats.calls.items())),
+            'api_calls_per_order': round(sum(self.stats.calls.values()) / len(orders), 2) if orders else None,
+            'outcomes': {
+                'api_status_codes': {str(code): count for code, count in sorted(api_statuses.items())},
+                'executions': execution_results,
+                'orders_by_status': dict(sorted(order_statuses.items())),
+                'failed_orders': len(self.dynamodb.tables[FAILED_ORDERS_TABLE].items),
+                'ledger_entries': len(self.dynamodb.tables[LEDGER_TABLE].items),
+                'idempotency_records': len(self.dynamodb.tables[IDEMPOTENCY_TABLE].items),
+                'inventory_reservations': sum(1 for key in self.dynamodb.tables[INVENTORY_TABLE].items
+                                              if key.startswith('RESERVATION#')),
+                'queue_sent': self.sqs.queues[ORDER_QUEUE_URL].sent,
+                'dlq_sent': self.sqs.queues[DLQ_URL].sent,
+                'dlq_dropped': self.sqs.queues[DLQ_URL].dropped,
+                'retry_sweeps': self.retry_sweeps,
+                'stream_records': self.stream_records,
+                'aggregate_buckets': len(self.dynamodb.tables[AGGREGATES_TABLE].items),
+                'aggregates_consistent': self.aggregates_consistent(),
+            },
+            'trace': trace_summary(self.traces)
+        }
+
+def trace_summary(traces):
+    """
+    Order-to-outcome latency per outcome, and per-hop percentiles with each
+    hop's share of the time spent by the slowest 1% of fulfilled orders
+    """
+    summary = {}
+    for outcome in ('Fulfillment', 'Failure'):
+        totals = sorted(trace['total_ms'] for trace in traces if trace['outcome'] == outcome)
+        if totals:
+            summary[f"order_to_{outcome.lower()}"] = {
+                'orders': len(totals),
+                'p50_ms': round(percentile(totals, 50), 3),
+                'p90_ms': round(percentile(totals, 90), 3),
+                'p99_ms': round(percentile(totals, 99), 3),
+                'max_ms': round(totals[-1], 3),
+            }
+
+    hops = {}
+    for trace in traces:
+        for name, milliseconds in trace['hops']:
+            hops.setdefault(name, []).append(milliseconds)
+
+    fulfilled = [trace for trace in traces if trace['outcome'] == 'Fulfillment']
+    tail = []
+    if fulfilled:
+        cutoff = percentile(sorted(trace['total_ms'] for trace in fulfilled), 99)
+        tail = [trace for trace in fulfilled if trace['total_ms'] >= cutoff]
+    tail_total = sum(trace['total_ms'] for trace in tail)
+
+    summary['hops'] = {}
+    for name, values in hops.items():
+        values.sort()
+        tail_ms = sum(milliseconds for trace in tail for hop, milliseconds in trace['hops'] if hop == name)
+        summary['hops'][name] = {
+            'samples': len(values),
+            'p50_ms': round(percentile(values, 50), 3),
+            'p90_ms': round(percentile(values, 90), 3),
+            'p99_ms': round(percentile(values, 99), 3),
+            'share_of_p99': round(tail_ms / tail_total, 4) if tail_total else None,
+        }
+    return summary
+
+def product_id(number):
+    return f"PROD-{number:05d}"
+
+def synthetic_orders(count, item_count, invalid_rate, rng, hot_skus=0):
+    """
+    Orders shaped like the README examples; a fraction fail validation.
+    With hot_skus, every order's first item is one of the first hot_skus
+    products, as in a flash sale.
+    """
+    return [synthetic_order(i, item_count, invalid_rate, rng, hot_skus) for i in range(count)]
+
+def synthetic_order(i, item_count, invalid_rate, rng, hot_skus=0):
+    """
+    The i-th synthetic order, with item_count items
+    """
+    order = {
+        'customer_name': f"Customer {i}",
+        'customer_email': f"customer{i}@example.com",
+        'items': [
+            {
+                'product_id': product_id(rng.randint(1, PRODUCT_COUNT)),
+                'quantity': rng.randint(1, 5),
+                'price': round(rng.uniform(1, 200), 2)
+            }
+            for _ in range(item_count)
+        ],
+        'shipping_address': {
+            'street': f"{i} Main St",
+            'city': 'Anytown',
+            'state': 'CA',
+            'zip_code': f"{rng.randint(10000, 99999)}"
+        }
+    }
+    if hot_skus and order['items']:
+        order['items'][0]['product_id'] = product_id(rng.randint(1, hot_skus))
+    if rng.random() < invalid_rate:
+        order['customer_email'] = 'not-an-email'
+    return order
+
+def load_orders(path, limit):
+    """
+    Replay orders from a JSONL file, one order body per line
+    """
+    orders = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                orders.append(json.loads(line))
+            if limit and len(orders) >= limit:
+                break
+    return orders
+
+def check_thresholds(result, args):
+    """
+    Return a list of threshold violations
+    """
+    violations = []
+    if args.min_throughput and (result['orders_per_second'] or 0) < args.min_throughput:
+        violations.append(f"throughput {result['orders_per_second']} orders/s below {args.min_throughput}")
+    for limit in args.max_p99_ms:
+        stage_name, _, value = limit.partition('=')
+        stage = result['stages'].get(stage_name)
+        if stage is None:
+            violations.append(f"unknown stage '{stage_name}' in --max-p99-ms")
+        elif stage.get('p99_ms', 0) > float(value):
+            violations.append(f"{stage_name} p99 {stage['p99_ms']}ms above {value}ms")
+    return violations
+
+def print_report(result):
+    print(f"{result['config']['orders']} orders in {result['elapsed_seconds']:.3f}s "
+          f"({result['orders_per_second']} orders/s, mode={result['config']['pipeline_mode']})")
+    print()
+    header = f"{'stage':>16} {'calls':>7} {'records':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'alloc KiB':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, stage in result['stages'].items():
+        alloc = stage.get('alloc_mean_kib', '-')
+        print(f"{name:>16} {stage['invocations']:>7} {stage['records']:>8} {stage.get('p50_ms', 0):>9.3f} "
+              f"{stage.get('p90_ms', 0):>9.3f} {stage.get('p99_ms', 0):>9.3f} {stage.get('max_ms', 0):>9.3f} {alloc:>10}")
+    print()
+    trace = result['trace']
+    for name, totals in trace.items():
+        if name.startswith('order_to_'):
+            print(f"{name}: {totals['orders']} orders, p50 {totals['p50_ms']:.3f} ms, "
+                  f"p99 {totals['p99_ms']:.3f} ms, max {totals['max_ms']:.3f} ms")
+    if trace['hops']:
+        header = f"{'hop':>28} {'samples':>8} {'p50 ms':>11} {'p90 ms':>11} {'p99 ms':>11} {'p99 share':>10}"
+        print(header)
+        print('-' * len(header))
+        for name, hop in trace['hops'].items():
+            share = '-' if hop['share_of_p99'] is None else f"{hop['share_of_p99']:.1%}"
+            print(f"{name:>28} {hop['samples']:>8} {hop['p50_ms']:>11.3f} {hop['p90_ms']:>11.3f} "
+                  f"{hop['p99_ms']:>11.3f} {share:>10}")
+        print()
+    print(f"AWS API calls per order: {result['api_calls_per_order']} {result['api_calls']}")
+    print(f"Outcomes: {json.dumps(result['outcomes'])}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000, help='number of synthetic orders')
+    parser.add_argument('--items', type=int, default=3, help='items per synthetic order')
+    parser.add_argument('--invalid-rate', type=float, default=0.05, help='fraction of orders failing validation')
+    parser.add_argument('--input', help='replay order bodies from a JSONL file instead')
+    parser.add_argument('--pipeline-mode', choices=['stepfunctions', 'inline'], default='stepfunctions')
+    parser.add_argument('--api-batch-size', type=int, default=0,
+                        help='submit through /orders/batch in chunks of this size (0 = one request per order)')
+    parser.add_argument('--batch-size', type=int, default=10, help='fulfill_order SQS batch size')
+    parser.add_argument('--fulfillment-concurrency', type=int, default=16,
+                        help='threads fulfill_order processes a batch on (1 = sequential)')
+    parser.add_argument('--dlq-batch-size', type=int, default=100, help='dlq_processor SQS batch size')
+    parser.add_argument('--stream-batch-size', type=int, default=500,
+                        help='order_aggregates DynamoDB stream batch size')
+    parser.add_argument('--io-latency-ms', type=float, default=0.0, help='artificial latency per AWS API call')
+    parser.add_argument('--unprocessed-rate', type=float, default=0.0,
+                        help='fraction of BatchWriteItem requests returned as UnprocessedItems')
+    parser.add_argument('--retry-base-seconds', type=int, default=30,
+                        help='fulfillment retry backoff base (FULFILLMENT_RETRY_BASE_SECONDS)')
+    parser.add_argument('--retry-max-delay-seconds', type=int, default=3600,
+                        help='fulfillment retry backoff cap (FULFILLMENT_RETRY_MAX_DELAY_SECONDS)')
+    parser.add_argument('--claim-check-bytes', type=int, default=0,
+                        help='check in orders larger than this many bytes to a temporary directory (0 = off)')
+    parser.add_argument('--inventory-stock', type=int, default=0,
+                        help='reserve inventory, starting every product with this many units (0 = off)')
+    parser.add_argument('--hot-skus', type=int, default=0,
+                        help='products with sharded stock; every order includes one of them')
+    parser.add_argument('--hot-sku-shards', type=int, default=8, help='stock rows per hot SKU')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0,
+                        help='fraction of orders sent twice with the same Idempotency-Key')
+    parser.add_argument('--admission-rate', type=float, default=0.0,
+                        help='api_handler orders/s per client, with a burst of twice that (0 = off)')
+    parser.add_argument('--admission-max-queue-depth', type=int, default=0,
+                        help='api_handler sheds orders while the order queue is deeper than this (0 = off)')
+    parser.add_argument('--trace-allocations', action='store_true', help='record tracemalloc peaks per invocation')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='write the machine-readable report to this path')
+    parser.add_argument('--min-throughput', type=float, default=0.0, help='fail below this many orders/s')
+    parser.add_argument('--max-p99-ms', action='append', default=[], metavar='STAGE=MS',
+                        help='fail when a stage p99 exceeds MS (repeatable)')
+    parser.add_argument('--verbose', action='store_true', help='show handler logs and EMF output')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+
+    # Handlers log at INFO on the root logger; keep the cost of building
+    # records but drop the output unless asked for
+    logging.getLogger().addHandler(logging.StreamHandler() if args.verbose else logging.NullHandler())
+
+    # fulfill_order's simulated outcomes use the module-level random
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    if args.input:
+        orders = load_orders(args.input, args.orders)
+    else:
+        orders = synthetic_orders(args.orders, args.items, args.invalid_rate, rng, args.hot_skus)
+
+    simulator = Simulator(args)
+    # EMF metric lines go to stdout in Lambda; keep them out of the report
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        result = simulator.run(orders)
+
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    violations = check_thresholds(result, args)
+    for violation in violations:
+        print(f"THRESHOLD FAILED: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
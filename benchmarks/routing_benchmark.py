@@ -0,0 +1,92 @@
+"""
+Micro-benchmark: fulfillment-center routing for large order batches
+
+Routes batches of synthetic orders (random US zip codes, 1-5 items of 1-5
+units) with fulfill_order's routing index and compares the cost with
+parsing the same orders' queue messages, which fulfill_order does for
+every record anyway:
+
+  load:     parse fulfillment_centers.json into the index (once per container)
+  route:    routing.route_order per order
+  parse:    order_codec.parse_message_body per order (reference)
+
+Usage:
+    python benchmarks/routing_benchmark.py [--batches 1000 10000 100000] [--seed 42]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'shared', 'python'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'fulfill_order'))
+
+import order_codec
+import routing
+
+def synthetic_orders(count, rng):
+    orders = []
+    for i in range(count):
+        orders.append({
+            'order_id': f"order-{i}",
+            'items': [
+                {'product_id': f"PROD-{rng.randint(1, 5000):05d}", 'quantity': rng.randint(1, 5), 'price': 10}
+                for _ in range(rng.randint(1, 5))
+            ],
+            'shipping_address': {'street': f"{i} Main St", 'city': 'Anytown', 'state': 'CA',
+                                 'zip_code': f"{rng.randint(501, 99999):05d}"}
+        })
+    return orders
+
+def measure_load(repeat=20):
+    """
+    Milliseconds per load of the data file
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        routing.load()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--batches', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = routing.index
+    print(f"index: {os.path.getsize(routing.DATA_FILE)} bytes, {len(index.routes)} prefixes, "
+          f"{len(index.centers)} centers, load {measure_load():.2f} ms")
+    print()
+    print(f"{'orders':>8} {'route ms':>9} {'ns/order':>9} {'parse ms':>9} {'route/parse':>12} {'default':>8}")
+
+    for count in args.batches:
+        orders = synthetic_orders(count, rng)
+        bodies = [order_codec.encode_message(order) for order in orders]
+        now = datetime.utcnow()
+
+        start = time.perf_counter()
+        routes = [routing.route_order(order, now) for order in orders]
+        route_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for body in bodies:
+            order_codec.parse_message_body(body)
+        parse_seconds = time.perf_counter() - start
+
+        defaults = sum(1 for order in orders
+                       if index.candidates(order['shipping_address']['zip_code']) is index.default)
+        print(f"{count:>8} {route_seconds * 1e3:>9.1f} {route_seconds / count * 1e9:>9.0f} "
+              f"{parse_seconds * 1e3:>9.1f} {route_seconds / parse_seconds:>12.1%} {defaults / count:>8.1%}")
+
+    centers = {}
+    for route in routes:
+        centers[route['fulfillment_center']] = centers.get(route['fulfillment_center'], 0) + 1
+    print()
+    print('last batch by center:', dict(sorted(centers.items())))
+
+if __name__ == '__main__':
+    main()
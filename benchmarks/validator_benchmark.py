@@ -0,0 +1,115 @@
+"""
+Benchmark: compiled order schema vs the legacy hand-written validator checks
+
+Reports time per order and per line item for orders of 1 to 1,000 items,
+plus validate_many throughput for a batch of mixed-size orders.
+
+Usage:
+    python benchmarks/validator_benchmark.py [--items 1 10 100 1000] [--repeat 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambdas', 'shared', 'python'))
+
+import order_schema
+
+def legacy_validate(event):
+    """
+    The validator's previous if-chains: fail fast, then a second pass for totals
+    """
+    required_fields = ['order_id', 'customer_name', 'customer_email', 'items']
+    for field in required_fields:
+        if field not in event or not event[field]:
+            raise ValueError(f"Missing or empty required field: {field}")
+
+    email = event['customer_email']
+    if '@' not in email or '.' not in email:
+        raise ValueError("Invalid email format")
+
+    items = event['items']
+    if not isinstance(items, list) or len(items) == 0:
+        raise ValueError("Items must be a non-empty list")
+
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"Item {i} must be an object")
+        for field in ['product_id', 'quantity']:
+            if field not in item:
+                raise ValueError(f"Item {i} missing required field: {field}")
+        if 'price' in item:
+            price_value = item['price']
+        elif 'unit_price' in item:
+            price_value = item['unit_price']
+        else:
+            raise ValueError(f"Item {i} missing price field (must have 'price' or 'unit_price')")
+        if not isinstance(item['quantity'], (int, float)) or item['quantity'] <= 0:
+            raise ValueError(f"Item {i} quantity must be a positive number")
+        if not isinstance(price_value, (int, float)) or price_value <= 0:
+            raise ValueError(f"Item {i} price must be a positive number")
+
+    if 'total_amount' in event:
+        provided_total = event['total_amount']
+        if not isinstance(provided_total, (int, float)) or provided_total <= 0:
+            raise ValueError("Total amount must be a positive number")
+
+    return sum(item['quantity'] * (item.get('price') or item.get('unit_price')) for item in items)
+
+def build_order(item_count, rng):
+    items = [
+        {
+            'product_id': f"PROD-{i:05d}",
+            'quantity': rng.randint(1, 5),
+            'unit_price': round(rng.uniform(1, 200), 2)
+        }
+        for i in range(item_count)
+    ]
+    return {
+        'order_id': f"BENCH-{item_count}",
+        'customer_name': 'Bench User',
+        'customer_email': 'bench@example.com',
+        'items': items,
+        'total_amount': round(sum(item['quantity'] * item['unit_price'] for item in items), 2)
+    }
+
+def time_per_call(func, order, repeat):
+    func(order)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(order)
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=1000, help='orders in the validate_many run')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'items':>6} {'legacy us':>10} {'compiled us':>12} {'ns/item':>9} {'speedup':>8}")
+    for item_count in args.items:
+        order = build_order(item_count, rng)
+        errors, total = order_schema.validate_order(order)
+        assert not errors and abs(total - legacy_validate(order)) < 1e-6
+        repeat = max(10, args.repeat // item_count)
+        legacy = time_per_call(legacy_validate, order, repeat)
+        compiled = time_per_call(order_schema.validate_order, order, repeat)
+        print(f"{item_count:>6} {legacy * 1e6:>10.1f} {compiled * 1e6:>12.1f} "
+              f"{compiled * 1e9 / item_count:>9.0f} {legacy / compiled:>7.2f}x")
+
+    orders = [build_order(rng.choice([1, 2, 5, 10, 50]), rng) for _ in range(args.batch)]
+    start = time.perf_counter()
+    results = order_schema.validate_many(orders)
+    elapsed = time.perf_counter() - start
+    assert all(result['valid'] for result in results)
+    print(f"validate_many: {len(orders)} orders in {elapsed * 1e3:.1f} ms "
+          f"({len(orders) / elapsed:,.0f} orders/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Admission control for order submissions (POST /order and /orders/batch)
+
+Two checks run before an order is handed to Step Functions:
+
+A token bucket per client, keyed on its API key (the caller's source IP
+when there is none), refilling at ADMISSION_CLIENT_RATE orders per second
+up to ADMISSION_CLIENT_BURST. A bulk submission takes one token per
+order. One larger than the burst is admitted once the bucket is full and
+leaves it in debt, so the client's later submissions wait until the
+whole batch is paid off. Buckets live in a per-container LRU, so a client's effective limit
+is the rate times the warm containers serving it; API Gateway usage plans
+remain the global quota.
+
+A pipeline signal from GetQueueAttributes on order_queue and the DLQ,
+sampled at most every ADMISSION_SIGNAL_TTL_SECONDS per container. New
+orders are shed while the order queue holds more than
+ADMISSION_MAX_QUEUE_DEPTH messages or the DLQ grows faster than
+ADMISSION_MAX_DLQ_GROWTH messages per second. A StartExecution throttle
+marks the pipeline saturated for ADMISSION_THROTTLE_BACKOFF_SECONDS.
+
+Shed requests get a 429 with Retry-After: the time until the bucket holds
+enough tokens, the time the queue needs to drain below the limit at its
+observed rate, or the time until the next signal sample. A failed sample
+keeps the previous signal, so admission fails open.
+
+Tunables (environment):
+    ADMISSION_CLIENT_RATE               orders/s per client; 0 (default) disables
+    ADMISSION_CLIENT_BURST              bucket size, default 2x the rate
+    ADMISSION_MAX_QUEUE_DEPTH           visible order_queue messages; 0 (default) disables
+    ADMISSION_MAX_DLQ_GROWTH            DLQ messages/s; 0 (default) disables
+    ADMISSION_SIGNAL_TTL_SECONDS        default 5
+    ADMISSION_THROTTLE_BACKOFF_SECONDS  default 2
+    ADMISSION_MAX_RETRY_AFTER_SECONDS   default 60
+"""
+
+import os
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import telemetry
+
+logger = logging.getLogger()
+
+CLIENT_RATE = float(os.environ.get('ADMISSION_CLIENT_RATE', '0'))
+CLIENT_BURST = float(os.environ.get('ADMISSION_CLIENT_BURST', '0')) or 2 * CLIENT_RATE
+MAX_QUEUE_DEPTH = int(os.environ.get('ADMISSION_MAX_QUEUE_DEPTH', '0'))
+MAX_DLQ_GROWTH = float(os.environ.get('ADMISSION_MAX_DLQ_GROWTH', '0'))
+SIGNAL_TTL_SECONDS = float(os.environ.get('ADMISSION_SIGNAL_TTL_SECONDS', '5'))
+THROTTLE_BACKOFF_SECONDS = float(os.environ.get('ADMISSION_THROTTLE_BACKOFF_SECONDS', '2'))
+MAX_RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_MAX_RETRY_AFTER_SECONDS', '60'))
+
+ORDER_QUEUE_URL = os.environ.get('ORDER_QUEUE_URL')
+DLQ_URL = os.environ.get('DLQ_URL')
+
+BUCKETS_MAX_ENTRIES = 10000
+
+REASON_RATE_LIMITED = 'RateLimited'
+REASON_QUEUE_DEPTH = 'QueueDepth'
+REASON_DLQ_GROWTH = 'DlqGrowth'
+REASON_THROTTLED = 'Throttled'
+
+# client key -> [tokens, refilled_at], least recently used first
+buckets = OrderedDict()
+
+# Last pipeline sample, with rates taken against the sample before it
+signal = {
+    'sampled_at': None,
+    'queue_depth': None,
+    'dlq_depth': None,
+    'drain_rate': None,
+    'dlq_growth': 0.0,
+    'throttled_until': 0.0
+}
+
+# Bulk submissions and local load tests call in from several threads
+lock = threading.Lock()
+
+# Monotonic seconds; replaceable so simulations can fast-forward
+clock = time.monotonic
+
+def client_key(event):
+    """
+    The caller's API key, or its source IP when the request has none
+    """
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    api_key = headers.get('x-api-key') or identity.get('apiKey')
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{identity.get('sourceIp') or 'unknown'}"
+
+def take_tokens(key, cost, now):
+    """
+    Seconds until the client's bucket can cover cost; 0 when it did.
+    The full cost is always taken, so a cost above the burst (needing a
+    full bucket) leaves the bucket negative.
+    """
+    needed = min(cost, CLIENT_BURST)
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = buckets[key] = [CLIENT_BURST, now]
+        if len(buckets) > BUCKETS_MAX_ENTRIES:
+            buckets.popitem(last=False)
+    else:
+        buckets.move_to_end(key)
+        bucket[0] = min(CLIENT_BURST, bucket[0] + (now - bucket[1]) * CLIENT_RATE)
+        bucket[1] = now
+    if bucket[0] >= needed:
+        bucket[0] -= cost
+        return 0
+    return (needed - bucket[0]) / CLIENT_RATE
+
+def queue_depth(sqs, queue_url):
+    attributes = sqs.get_queue_attributes(
+        QueueUrl=queue_url, AttributeNames=['ApproximateNumberOfMessages']
+    )['Attributes']
+    return int(attributes['ApproximateNumberOfMessages'])
+
+def refresh_signal(sqs, now):
+    """
+    Sample the queue depths when the signal is older than its TTL. Only
+    the request that claims the sample waits on GetQueueAttributes; the
+    lock is not held meanwhile, and other requests keep using the
+    previous signal.
+    """
+    with lock:
+        if signal['sampled_at'] is not None and now - signal['sampled_at'] < SIGNAL_TTL_SECONDS:
+            return
+        previous_at, previous_queue, previous_dlq = signal['sampled_at'], signal['queue_depth'], signal['dlq_depth']
+        # Claimed before sampling, so concurrent requests do not sample too
+        # and one failing sample does not retry on every request
+        signal['sampled_at'] = now
+    try:
+        depth = queue_depth(sqs, ORDER_QUEUE_URL) if MAX_QUEUE_DEPTH and ORDER_QUEUE_URL else None
+        dlq_depth = queue_depth(sqs, DLQ_URL) if MAX_DLQ_GROWTH and DLQ_URL else None
+    except Exception as e:
+        logger.warning("Could not sample queue depths for admission control: %s", e)
+        return
+
+    elapsed = now - previous_at if previous_at is not None else None
+    with lock:
+        signal['queue_depth'] = depth
+        signal['dlq_depth'] = dlq_depth
+        if elapsed and depth is not None and previous_queue is not None:
+            signal['drain_rate'] = (previous_queue - depth) / elapsed
+        if elapsed and dlq_depth is not None and previous_dlq is not None:
+            signal['dlq_growth'] = max(0.0, (dlq_depth - previous_dlq) / elapsed)
+    if depth is not None:
+        telemetry.metrics.gauge('OrderQueueDepth', depth, 'Count')
+
+def saturation(now):
+    """
+    (reason, seconds to wait) while the pipeline is saturated, else None
+    """
+    if signal['throttled_until'] > now:
+        return REASON_THROTTLED, signal['throttled_until'] - now
+    if signal['sampled_at'] is None:
+        return None
+
+    next_sample = signal['sampled_at'] + SIGNAL_TTL_SECONDS - now
+    depth = signal['queue_depth']
+    if MAX_QUEUE_DEPTH and depth is not None and depth > MAX_QUEUE_DEPTH:
+        drain_rate = signal['drain_rate']
+        if drain_rate and drain_rate > 0:
+            return REASON_QUEUE_DEPTH, max(next_sample, (depth - MAX_QUEUE_DEPTH) / drain_rate)
+        return REASON_QUEUE_DEPTH, MAX_RETRY_AFTER_SECONDS
+    if MAX_DLQ_GROWTH and signal['dlq_growth'] > MAX_DLQ_GROWTH:
+        return REASON_DLQ_GROWTH, next_sample
+    return None
+
+def admit(sqs, event, cost=1):
+    """
+    Decide whether a submission of cost orders goes ahead. Returns
+    {'admitted': bool, 'reason': shed reason or None, 'retry_after': whole seconds}
+    """
+    now = clock()
+    if MAX_QUEUE_DEPTH or MAX_DLQ_GROWTH:
+        refresh_signal(sqs, now)
+    with lock:
+        shed = saturation(now)
+        if shed is None and CLIENT_RATE > 0:
+            wait = take_tokens(client_key(event), cost, now)
+            if wait:
+                shed = REASON_RATE_LIMITED, wait
+
+    if shed is None:
+        telemetry.metrics.count('OrdersAdmitted', cost)
+        return {'admitted': True, 'reason': None, 'retry_after': 0}
+
+    reason, wait = shed
+    telemetry.metrics.count('OrdersShed', cost)
+    telemetry.metrics.count(f"OrdersShed{reason}", cost)
+    logger.info("Shedding %d orders: %s", cost, reason)
+    return {'admitted': False, 'reason': reason,
+            'retry_after': min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(wait)))}
+
+def throttled():
+    """
+    Record a StartExecution throttle; submissions are shed for the backoff
+    """
+    with lock:
+        signal['throttled_until'] = max(signal['throttled_until'], clock() + THROTTLE_BACKOFF_SECONDS)
+    telemetry.metrics.count('StartExecutionThrottles')
+
+def retry_after_throttle():
+    return max(1, math.ceil(THROTTLE_BACKOFF_SECONDS))
@@ -0,0 +1,248 @@
+"""
+Idempotency keys for order submissions (POST /order, and the orders of
+POST /orders/batch that carry an order_id)
+
+A submission is keyed on its Idempotency-Key header, scoped to the caller
+(API key, else source IP), or else on the order_id in its body, which
+names the order for every caller. Keys are stored hashed in a TTL'd
+DynamoDB table together with a fingerprint of the request body:
+
+    claim     conditional put of an IN_PROGRESS record with a new order_id
+    complete  once the execution started (or the inline pipeline answered),
+              the record keeps the response: order_id, execution_arn, status
+    release   a submission that failed on our side drops its claim, so
+              the client's retry starts over
+
+A repeated submission gets the stored response back and starts nothing.
+The same key with a different body is rejected (422), and a repeat while
+the first is still IN_PROGRESS gets a 409. A claim left IN_PROGRESS for
+IDEMPOTENCY_CLAIM_LEASE_SECONDS (a container died mid-request) is taken
+over with its original order_id.
+
+Completed responses stay in a per-container LRU, so a retry landing on
+the same container costs no round trip. A Bloom filter of every key this
+container has claimed or found sends likely repeats to a single GetItem.
+All other keys go straight to the claim, which also returns the stored
+record when the key exists, so a new key costs one conditional write.
+
+Tunables (environment):
+    IDEMPOTENCY_TABLE_NAME           dedupe table; keys are ignored when unset
+    IDEMPOTENCY_KEY_TTL_SECONDS      default 86400
+    IDEMPOTENCY_CLAIM_LEASE_SECONDS  default 60
+    IDEMPOTENCY_CACHE_SIZE           completed responses kept, default 5000
+    IDEMPOTENCY_FILTER_CAPACITY      keys before the filter is cleared, default 100000
+"""
+
+import os
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import telemetry
+
+logger = logging.getLogger()
+
+TABLE_NAME = os.environ.get('IDEMPOTENCY_TABLE_NAME')
+KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 3600)))
+CLAIM_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_CLAIM_LEASE_SECONDS', '60'))
+CACHE_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '5000'))
+FILTER_CAPACITY = int(os.environ.get('IDEMPOTENCY_FILTER_CAPACITY', '100000'))
+
+HEADER = 'idempotency-key'
+MAX_KEY_LENGTH = 255
+
+# Execution names are at most 80 characters: order-<order_id>-<timestamp>
+ORDER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,60}$')
+
+STATUS_IN_PROGRESS = 'IN_PROGRESS'
+STATUS_COMPLETED = 'COMPLETED'
+
+# About 1% false positives at FILTER_CAPACITY keys
+FILTER_HASHES = 7
+
+deserializer = TypeDeserializer()
+
+# hashed key -> completed record, least recently used first
+cache = OrderedDict()
+
+# Bulk submissions and local load tests call in from several threads
+lock = threading.Lock()
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings; cleared once it has taken
+    capacity keys, which only costs a few extra claims afterwards
+    """
+
+    def __init__(self, capacity, hashes=FILTER_HASHES):
+        self.capacity = capacity
+        self.hashes = hashes
+        # ~9.6 bits per key for 1% false positives
+        self.size = max(64, capacity * 10)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, key):
+        if self.count >= self.capacity:
+            self.bits = bytearray(len(self.bits))
+            self.count = 0
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+seen = BloomFilter(FILTER_CAPACITY)
+
+def is_enabled():
+    return bool(TABLE_NAME)
+
+def valid_order_id(order_id):
+    return isinstance(order_id, str) and bool(ORDER_ID_PATTERN.match(order_id))
+
+def request_key(headers, client, body):
+    """
+    Hashed dedupe key of a submission, or None when it carries neither an
+    Idempotency-Key header nor an order_id. Raises ValueError for a key
+    that is too long.
+    """
+    header_key = next((value for name, value in (headers or {}).items() if name.lower() == HEADER), None)
+    if header_key:
+        if len(header_key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+        scoped = f"key\n{client}\n{header_key}"
+    elif isinstance(body, dict) and body.get('order_id') is not None:
+        scoped = f"order\n{body['order_id']}"
+    else:
+        return None
+    return hashlib.sha256(scoped.encode('utf-8')).hexdigest()
+
+def fingerprint(body):
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')).hexdigest()
+
+def remember(key, record):
+    with lock:
+        seen.add(key)
+        if record.get('record_status') == STATUS_COMPLETED:
+            cache[key] = record
+            cache.move_to_end(key)
+            while len(cache) > CACHE_MAX_ENTRIES:
+                cache.popitem(last=False)
+
+def lookup(dynamodb, key):
+    """
+    The stored record of a key this container has seen, or None when the
+    key is new here and should be claimed
+    """
+    with lock:
+        record = cache.get(key)
+        if record is not None:
+            cache.move_to_end(key)
+            telemetry.metrics.count('IdempotencyCacheHits')
+            return record
+        if key not in seen:
+            return None
+
+    telemetry.metrics.count('IdempotencyLookups')
+    record = dynamodb.Table(TABLE_NAME).get_item(Key={'idempotency_key': key}, ConsistentRead=True).get('Item')
+    now = time.time()
+    if record is None or record.get('expires_at', 0) <= now:
+        return None
+    if record.get('record_status') == STATUS_IN_PROGRESS and record.get('claimed_at', 0) < now - CLAIM_LEASE_SECONDS:
+        # Abandoned claim: the claim takes it over
+        return None
+    remember(key, record)
+    return record
+
+def claim(dynamodb, key, request_fingerprint, order_id):
+    """
+    Claim a key for a new submission. Returns (order_id to use, None) when
+    claimed, or (None, existing record) when the key is already taken.
+    """
+    now = int(time.time())
+    try:
+        previous = dynamodb.Table(TABLE_NAME).put_item(
+            Item={
+                'idempotency_key': key,
+                'record_status': STATUS_IN_PROGRESS,
+                'fingerprint': request_fingerprint,
+                'order_id': order_id,
+                'claimed_at': now,
+                'expires_at': now + KEY_TTL_SECONDS
+            },
+            # Expired records may linger until TTL deletion catches up
+            ConditionExpression='attribute_not_exists(idempotency_key) OR expires_at < :now OR '
+                                '(record_status = :in_progress AND claimed_at < :lease_cutoff AND fingerprint = :fingerprint)',
+            ExpressionAttributeValues={
+                ':now': now,
+                ':in_progress': STATUS_IN_PROGRESS,
+                ':lease_cutoff': now - CLAIM_LEASE_SECONDS,
+                ':fingerprint': request_fingerprint
+            },
+            ReturnValues='ALL_OLD',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        ).get('Attributes')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        record = {name: deserializer.deserialize(value) for name, value in e.response.get('Item', {}).items()}
+        remember(key, record)
+        return None, record
+
+    with lock:
+        seen.add(key)
+    if previous and previous.get('record_status') == STATUS_IN_PROGRESS and previous.get('expires_at', 0) > now:
+        # Took over an abandoned claim: keep the order_id it may already have started
+        logger.warning("Taking over idempotency claim for order %s", previous['order_id'])
+        order_id = previous['order_id']
+        dynamodb.Table(TABLE_NAME).update_item(
+            Key={'idempotency_key': key},
+            UpdateExpression='SET order_id = :order_id',
+            ExpressionAttributeValues={':order_id': order_id}
+        )
+    return order_id, None
+
+def complete(dynamodb, key, status_code, response_body):
+    """
+    Keep the response (status and JSON body) of a finished submission for
+    replays
+    """
+    record = dynamodb.Table(TABLE_NAME).update_item(
+        Key={'idempotency_key': key},
+        UpdateExpression='SET record_status = :completed, status_code = :status_code, #response = :response',
+        ExpressionAttributeNames={'#response': 'response'},
+        ExpressionAttributeValues={
+            ':completed': STATUS_COMPLETED,
+            ':status_code': status_code,
+            ':response': response_body
+        },
+        ReturnValues='ALL_NEW'
+    )['Attributes']
+    remember(key, record)
+
+def release(dynamodb, key):
+    """
+    Drop the claim of a submission that failed on our side
+    """
+    try:
+        dynamodb.Table(TABLE_NAME).delete_item(
+            Key={'idempotency_key': key},
+            ConditionExpression='record_status = :in_progress',
+            ExpressionAttributeValues={':in_progress': STATUS_IN_PROGRESS}
+        )
+    except Exception as e:
+        # The lease lets a later retry take the claim over anyway
+        logger.warning("Could not release idempotency claim: %s", e)
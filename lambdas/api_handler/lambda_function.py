@@ -1,33 +1,98 @@
 import json
-import boto3
 import os
 import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from botocore.exceptions import ClientError
+import admission
+import aws_clients
+import claim_check
+import idempotency_keys
+import order_codec
+import order_index
+import order_aggregates
+import order_lookup
+import order_pipeline
+import telemetry
+import tracing
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(telemetry.LOG_LEVEL)
 
-stepfunctions = boto3.client('stepfunctions')
+# PIPELINE_MODE=inline runs validator and order_storage in-process instead
+# of starting a Step Functions execution per order
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', order_pipeline.PIPELINE_MODE_STEPFUNCTIONS)
 
+# Bulk submissions start executions from a bounded worker pool
+BATCH_MAX_ORDERS = int(os.environ.get('BATCH_MAX_ORDERS', '500'))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '16'))
+
+# Adaptive retry mode adds client-side rate limiting on top of exponential
+# backoff, so concurrent StartExecution calls slow down when throttled
+stepfunctions = aws_clients.client(
+    'stepfunctions',
+    retries={'max_attempts': 8, 'mode': 'adaptive'},
+    max_pool_connections=max(BATCH_MAX_WORKERS, aws_clients.MAX_POOL_CONNECTIONS)
+)
+
+# Bulk submissions claim idempotency keys from the worker threads
+dynamodb = aws_clients.resource('dynamodb', per_thread=True)
+
+# Queue depth samples for admission control
+sqs = aws_clients.client('sqs')
+
+ORDERS_TABLE_NAME = os.environ.get('ORDERS_TABLE_NAME')
+FAILED_ORDERS_TABLE_NAME = os.environ.get('FAILED_ORDERS_TABLE_NAME')
+
+# Resolved once per container on the first request
+cached_state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
+
+inline_pipeline = None
+
+def get_inline_pipeline():
+    """
+    Build the in-process pipeline once per container
+    """
+    global inline_pipeline
+    if inline_pipeline is None:
+        handler_dir = os.path.dirname(os.path.abspath(__file__))
+        validator = order_pipeline.load_stage_module(
+            'validator', order_pipeline.stage_search_paths(handler_dir, 'validator'))
+        order_storage = order_pipeline.load_stage_module(
+            'order_storage', order_pipeline.stage_search_paths(handler_dir, 'order_storage'))
+        inline_pipeline = order_pipeline.OrderPipeline(
+            validate_handler=validator.lambda_handler,
+            store_handler=order_storage.lambda_handler,
+            sqs_client=order_storage.sqs,
+            order_queue_url=os.environ.get('ORDER_QUEUE_URL'),
+            dlq_url=os.environ.get('DLQ_URL')
+        )
+    return inline_pipeline
+
+@telemetry.instrument('api_handler')
 def lambda_handler(event, context):
     """
     API Gateway handler that receives order requests and triggers Step Functions
     """
     
+    aws_clients.log_cold_start('api_handler')
+    request_started = tracing.started()
+    
     try:
+        if event.get('httpMethod') == 'GET':
+            if event.get('resource', '').endswith('/stats'):
+                return handle_stats(event)
+            params = event.get('queryStringParameters') or {}
+            if (event.get('pathParameters') or {}).get('order_id') or 'ids' in params:
+                return handle_lookup(event)
+            return handle_list(event)
+        
         # Parse the request
         if 'body' not in event:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Missing request body'
-                })
-            }
+            return build_response(400, {
+                'error': 'Missing request body'
+            })
         
         # Parse JSON body
         try:
@@ -36,67 +101,504 @@ def lambda_handler(event, context):
             else:
                 body = event['body']
         except json.JSONDecodeError:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Invalid JSON in request body'
+            return build_response(400, {
+                'error': 'Invalid JSON in request body'
+            })
+        
+        # A JSON array body or the /orders/batch resource selects bulk mode
+        batch = isinstance(body, list) or event.get('resource', '').endswith('/batch')
+        orders = body.get('orders') if batch and isinstance(body, dict) else body
+        
+        # Shed load before it reaches Step Functions
+        decision = admission.admit(sqs, event, len(orders) if batch and isinstance(orders, list) and orders else 1)
+        if not decision['admitted']:
+            return build_throttled_response(decision['reason'], decision['retry_after'])
+        
+        if PIPELINE_MODE == order_pipeline.PIPELINE_MODE_INLINE:
+            state_machine_arn = None
+        else:
+            state_machine_arn = get_state_machine_arn(context)
+        
+        if batch:
+            return handle_batch(body, state_machine_arn, context, request_started)
+        
+        if not isinstance(body, dict):
+            return build_response(400, {
+                'error': 'Order must be a JSON object'
+            })
+        
+        if body.get('order_id') is not None and not idempotency_keys.valid_order_id(body['order_id']):
+            return build_response(400, {
+                'error': "order_id must be 1-60 letters, digits, '-' or '_'"
+            })
+        
+        return submit_order(event, body, state_machine_arn, context, request_started)
+        
+    except Exception as e:
+        logger.error("Error processing order: %s", e)
+        
+        return build_response(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        })
+
+def submit_order(event, body, state_machine_arn, context, request_started):
+    """
+    Submit one order. With an Idempotency-Key header or its own order_id,
+    a repeated submission gets the first response back and starts nothing.
+    """
+    order_id = body.get('order_id') or str(uuid.uuid4())
+    
+    key = None
+    if idempotency_keys.is_enabled():
+        try:
+            key = idempotency_keys.request_key(event.get('headers'), admission.client_key(event), body)
+        except ValueError as e:
+            return build_response(400, {
+                'error': str(e)
+            })
+    
+    if key is not None:
+        request_fingerprint = idempotency_keys.fingerprint(body)
+        try:
+            record = idempotency_keys.lookup(dynamodb, key)
+            if record is None:
+                order_id, record = idempotency_keys.claim(dynamodb, key, request_fingerprint, order_id)
+        except Exception as e:
+            # Without the claim a retry could start the order twice
+            logger.error("Idempotency claim failed for order %s: %s", order_id, e)
+            telemetry.metrics.count('IdempotencyErrors')
+            return build_response(503, {
+                'error': 'Order submission is temporarily unavailable'
+            }, {'Retry-After': '1', 'Access-Control-Expose-Headers': 'Retry-After'})
+        if record is not None:
+            return replay_submission(record, request_fingerprint)
+    
+    try:
+        response = start_order(order_id, build_order_data(order_id, body, request_started), state_machine_arn, context)
+    except Exception:
+        if key is not None:
+            release_key(key, order_id)
+        raise
+    
+    if key is not None:
+        if response['statusCode'] == 429 or response['statusCode'] >= 500:
+            # Failed on our side or shed: the client's retry should run again
+            release_key(key, order_id)
+        else:
+            try:
+                idempotency_keys.complete(dynamodb, key, response['statusCode'], response['body'])
+            except Exception as e:
+                # The order is started; an unfinished claim only delays a replay
+                logger.error("Failed to complete idempotency record of order %s: %s", order_id, e)
+                telemetry.metrics.count('IdempotencyErrors')
+    return response
+
+def release_key(key, order_id):
+    """
+    Drop a claim so the client's retry runs again; a claim that cannot be
+    released is taken over once its lease runs out
+    """
+    try:
+        idempotency_keys.release(dynamodb, key)
+    except Exception as e:
+        logger.error("Failed to release idempotency record of order %s: %s", order_id, e)
+        telemetry.metrics.count('IdempotencyErrors')
+
+def start_order(order_id, order_data, state_machine_arn, context):
+    """
+    Start the order's execution, or run it through the inline pipeline
+    """
+    if state_machine_arn is None:
+        result = run_inline(order_id, order_data, context)
+        telemetry.metrics.count('OrdersAccepted' if result['status'] == 202 else 'OrdersRejected')
+        return build_response(result.pop('status'), result)
+    
+    # Start Step Function execution
+    try:
+        response = start_order_execution(state_machine_arn, order_id, order_data)
+    except ClientError as e:
+        if 'Throttl' not in e.response.get('Error', {}).get('Code', ''):
+            raise
+        logger.warning("StartExecution throttled for order %s", order_id)
+        admission.throttled()
+        return build_throttled_response(admission.REASON_THROTTLED, admission.retry_after_throttle())
+    
+    logger.info("Started Step Function execution for order %s: %s", order_id, response['executionArn'])
+    telemetry.metrics.count('OrdersAccepted')
+    
+    return build_response(202, {
+        'message': 'Order received and processing started',
+        'order_id': order_id,
+        'execution_arn': response['executionArn']
+    })
+
+def replay_submission(record, request_fingerprint):
+    """
+    Answer a repeated submission from its idempotency record
+    """
+    if record.get('fingerprint') != request_fingerprint:
+        return build_response(422, {
+            'error': 'Idempotency key was already used for a different order'
+        })
+    
+    if record.get('record_status') != idempotency_keys.STATUS_COMPLETED:
+        return build_response(409, {
+            'error': 'An order with this idempotency key is still being submitted',
+            'order_id': record.get('order_id')
+        }, {'Retry-After': '1', 'Access-Control-Expose-Headers': 'Retry-After'})
+    
+    logger.info("Replaying submission of order %s", record.get('order_id'))
+    telemetry.metrics.count('IdempotentReplays')
+    response = build_response(int(record['status_code']), None, {'Idempotent-Replayed': 'true'})
+    response['body'] = record['response']
+    return response
+
+def handle_list(event):
+    """
+    GET /orders and GET /orders/failed: one page of orders with a status,
+    newest first. Query parameters: status, since, until, limit, cursor.
+    """
+    params = event.get('queryStringParameters') or {}
+    failed = event.get('resource', '').endswith('/failed')
+    
+    status = params.get('status')
+    if not status:
+        return build_response(400, {
+            'error': 'Missing status query parameter'
+        })
+    
+    if failed:
+        table_name, list_page = FAILED_ORDERS_TABLE_NAME, order_index.list_failed_orders
+    else:
+        table_name, list_page = ORDERS_TABLE_NAME, order_index.list_orders
+    
+    try:
+        orders, cursor = list_page(
+            dynamodb, table_name, status,
+            since=params.get('since'),
+            until=params.get('until'),
+            limit=params.get('limit') or 50,
+            cursor=params.get('cursor')
+        )
+    except ValueError as e:
+        return build_response(400, {
+            'error': str(e)
+        })
+    
+    telemetry.metrics.count('OrderListings')
+    return build_response(200, {
+        'orders': orders,
+        'count': len(orders),
+        'next_cursor': cursor
+    })
+
+def handle_stats(event):
+    """
+    GET /orders/stats: orders per status, and orders and revenue per hour
+    with failure reasons, from the pre-aggregated counters. Query
+    parameters: since, until.
+    """
+    if not order_aggregates.is_enabled():
+        return build_response(404, {
+            'error': 'Order aggregates are not enabled'
+        })
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        stats = order_aggregates.query(
+            dynamodb.Table(order_aggregates.TABLE_NAME),
+            since=params.get('since'),
+            until=params.get('until')
+        )
+    except ValueError as e:
+        return build_response(400, {
+            'error': str(e)
+        })
+    
+    telemetry.metrics.count('OrderStatsReads')
+    return build_response(200, stats)
+
+def handle_lookup(event):
+    """
+    GET /orders/{order_id}, or GET /orders?ids=a,b,c for up to 100 orders:
+    current status and fulfillment details, with ETag / If-None-Match
+    """
+    order_id = (event.get('pathParameters') or {}).get('order_id')
+    
+    with telemetry.metrics.timer('OrderLookupLatency'):
+        if order_id:
+            payload = order_lookup.get_order(dynamodb.Table(ORDERS_TABLE_NAME), order_id)
+            if payload is None:
+                return build_response(404, {
+                    'error': f"Order {order_id} not found"
+                })
+        else:
+            order_ids = [value.strip() for value in event['queryStringParameters']['ids'].split(',') if value.strip()]
+            if not order_ids or len(order_ids) > order_lookup.MAX_IDS:
+                return build_response(400, {
+                    'error': f"ids must list between 1 and {order_lookup.MAX_IDS} order IDs"
                 })
+            views = order_lookup.get_orders(dynamodb, ORDERS_TABLE_NAME, order_ids)
+            payload = {
+                'orders': [views[order_id] for order_id in dict.fromkeys(order_ids) if order_id in views],
+                'missing': [order_id for order_id in dict.fromkeys(order_ids) if order_id not in views]
             }
-        
-        # Generate order ID and add metadata
-        order_id = str(uuid.uuid4())
-        order_data = {
+    
+    telemetry.metrics.gauge('OrderCacheHitRatio', order_lookup.hit_ratio(), 'Percent')
+    
+    etag = order_lookup.etag(payload)
+    headers = {'ETag': etag, 'Access-Control-Expose-Headers': 'ETag'}
+    request_headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    if order_lookup.not_modified(request_headers.get('if-none-match'), etag):
+        telemetry.metrics.count('OrderLookupsNotModified')
+        return build_response(304, None, headers)
+    
+    return build_response(200, payload, headers)
+
+def run_inline(order_id, order_data, context):
+    """
+    Process an order synchronously through the in-process pipeline.
+    Failed orders are routed to the DLQ exactly as the state machine does.
+    """
+    result = get_inline_pipeline().run(order_data, context)
+    
+    if result['status'] == 'SUCCEEDED':
+        logger.info("Order %s validated and stored inline", order_id)
+        return {
+            'status': 202,
+            'message': 'Order received and stored',
             'order_id': order_id,
-            'created_at': datetime.utcnow().isoformat(),
-            'status': 'RECEIVED',
-            **body
+            'order_status': result['output'].get('status')
         }
+    
+    error_message = json.loads(result['error']['Cause'])['errorMessage']
+    return {
+        # Validation failures are the client's; storage failures are ours
+        'status': 422 if result['state'] == 'ValidateOrder' else 500,
+        'error': error_message,
+        'order_id': order_id,
+        'failed_state': result['state']
+    }
+
+def handle_batch(body, state_machine_arn, context, request_started):
+    """
+    Start one execution per order in a bulk submission and report a
+    per-order result list. Orders that carry their own order_id are
+    deduplicated on it as in submit_order; a repeat gets the first
+    result back and starts nothing.
+    """
+    
+    orders = body.get('orders') if isinstance(body, dict) else body
+    
+    if not isinstance(orders, list) or len(orders) == 0:
+        return build_response(400, {
+            'error': 'Batch body must be a non-empty JSON array of orders'
+        })
+    
+    if len(orders) > BATCH_MAX_ORDERS:
+        return build_response(413, {
+            'error': f"Batch contains {len(orders)} orders, maximum is {BATCH_MAX_ORDERS}"
+        })
+    
+    def submit(index, order):
+        if not isinstance(order, dict):
+            return {
+                'index': index,
+                'status': 400,
+                'error': 'Order must be a JSON object'
+            }
         
-        # Get Step Function ARN from environment or construct it
-        project_name = os.environ.get('PROJECT_NAME', 'dofs')
-        environment = os.environ.get('ENVIRONMENT', 'dev')
-        region = os.environ.get('AWS_DEFAULT_REGION', context.invoked_function_arn.split(':')[3])
-        account_id = context.invoked_function_arn.split(':')[4]
+        if order.get('order_id') is not None and not idempotency_keys.valid_order_id(order['order_id']):
+            return {
+                'index': index,
+                'status': 400,
+                'error': "order_id must be 1-60 letters, digits, '-' or '_'"
+            }
         
-        state_machine_arn = f"arn:aws:states:{region}:{account_id}:stateMachine:{project_name}-order-processor-{environment}"
+        order_id = order.get('order_id') or str(uuid.uuid4())
         
-        # Start Step Function execution
-        response = stepfunctions.start_execution(
-            stateMachineArn=state_machine_arn,
-            name=f"order-{order_id}-{int(datetime.utcnow().timestamp())}",
-            input=json.dumps(order_data)
-        )
+        key = None
+        if idempotency_keys.is_enabled() and order.get('order_id') is not None:
+            key = idempotency_keys.request_key(None, None, order)
+            request_fingerprint = idempotency_keys.fingerprint(order)
+            try:
+                record = idempotency_keys.lookup(dynamodb, key)
+                if record is None:
+                    order_id, record = idempotency_keys.claim(dynamodb, key, request_fingerprint, order_id)
+            except Exception as e:
+                logger.error("Idempotency claim failed for order %s: %s", order_id, e)
+                telemetry.metrics.count('IdempotencyErrors')
+                return {
+                    'index': index,
+                    'order_id': order_id,
+                    'status': 500,
+                    'error': 'Failed to start order processing'
+                }
+            if record is not None:
+                return {'index': index, **replay_batch_item(record, request_fingerprint)}
         
-        logger.info(f"Started Step Function execution for order {order_id}: {response['executionArn']}")
+        result = start_batch_item(order_id, order)
         
-        return {
-            'statusCode': 202,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Order received and processing started',
-                'order_id': order_id,
-                'execution_arn': response['executionArn']
-            })
-        }
+        if key is not None:
+            try:
+                if result['status'] == 429 or result['status'] >= 500:
+                    # Failed on our side or shed: the client's retry should run again
+                    idempotency_keys.release(dynamodb, key)
+                else:
+                    idempotency_keys.complete(dynamodb, key, result['status'], order_codec.dumps(result))
+            except Exception as e:
+                # The order is started; an unfinished claim only delays a replay
+                logger.error("Failed to complete idempotency record of order %s: %s", order_id, e)
+                telemetry.metrics.count('IdempotencyErrors')
         
-    except Exception as e:
-        logger.error(f"Error processing order: {str(e)}")
+        return {'index': index, **result}
+    
+    def start_batch_item(order_id, order):
+        if state_machine_arn is None:
+            # One order's failure must not lose the results of the others
+            try:
+                result = run_inline(order_id, build_order_data(order_id, order, request_started), context)
+            except Exception as e:
+                logger.error("Inline pipeline failed for order %s: %s", order_id, e)
+                return {
+                    'order_id': order_id,
+                    'status': 500,
+                    'error': 'Failed to process order'
+                }
+            return result
+        
+        try:
+            response = start_order_execution(state_machine_arn, order_id,
+                                             build_order_data(order_id, order, request_started))
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
+            logger.error("Failed to start execution for order %s: %s", order_id, e)
+            return {
+                'order_id': order_id,
+                'status': 429 if 'Throttl' in error_code else 500,
+                'error': error_code or 'Failed to start order processing'
+            }
         
         return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
\ No newline at end of file
+            'order_id': order_id,
+            'status': 202,
+            'execution_arn': response['executionArn']
+        }
+    
+    workers = min(BATCH_MAX_WORKERS, len(orders))
+    if state_machine_arn is None:
+        # boto3 resources used by the in-process stages are not thread safe
+        get_inline_pipeline()
+        workers = 1
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(submit, range(len(orders)), orders))
+    
+    if any(result['status'] == 429 for result in results):
+        admission.throttled()
+    
+    accepted = sum(1 for result in results if result['status'] == 202)
+    replayed = sum(1 for result in results if result.get('replayed'))
+    logger.info("Batch submission complete. Accepted: %d, Rejected: %d, Replayed: %d",
+                accepted, len(results) - accepted, replayed)
+    # Replays are counted as IdempotentReplays only, as for single orders
+    started = [result for result in results if not result.get('replayed')]
+    telemetry.metrics.count('OrdersAccepted', sum(1 for result in started if result['status'] == 202))
+    telemetry.metrics.count('OrdersRejected', sum(1 for result in started if result['status'] != 202))
+    
+    # 207 tells the client to inspect the per-order statuses
+    return build_response(202 if accepted == len(results) else 207, {
+        'message': 'Batch received and processing started',
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results
+    })
+
+def replay_batch_item(record, request_fingerprint):
+    """
+    Result of a repeated bulk order from its idempotency record; the
+    per-order counterpart of replay_submission
+    """
+    if record.get('fingerprint') != request_fingerprint:
+        return {
+            'order_id': record.get('order_id'),
+            'status': 422,
+            'error': 'order_id was already used for a different order'
+        }
+    
+    if record.get('record_status') != idempotency_keys.STATUS_COMPLETED:
+        return {
+            'order_id': record.get('order_id'),
+            'status': 409,
+            'error': 'An order with this order_id is still being submitted'
+        }
+    
+    logger.info("Replaying submission of order %s", record.get('order_id'))
+    telemetry.metrics.count('IdempotentReplays')
+    return {**json.loads(record['response']), 'status': int(record['status_code']), 'replayed': True}
+
+def build_order_data(order_id, body, request_started):
+    """
+    Add the order ID, receive metadata and a new trace to an order body;
+    they win over any the client sent. Large orders are checked in, so
+    only a reference to their items travels through the pipeline.
+    """
+    order_data = claim_check.check_in({
+        **body,
+        'order_id': order_id,
+        'created_at': datetime.utcnow().isoformat(),
+        'status': 'RECEIVED',
+        'trace': tracing.start()
+    })
+    tracing.mark(order_data, 'api', request_started)
+    return order_data
+
+def start_order_execution(state_machine_arn, order_id, order_data):
+    """
+    Start the order processing state machine for a single order
+    """
+    return stepfunctions.start_execution(
+        stateMachineArn=state_machine_arn,
+        name=f"order-{order_id}-{int(datetime.utcnow().timestamp())}",
+        input=json.dumps(order_data)
+    )
+
+def get_state_machine_arn(context):
+    """
+    Get Step Function ARN from environment or construct it once per container
+    """
+    global cached_state_machine_arn
+    if cached_state_machine_arn is None:
+        project_name = os.environ.get('PROJECT_NAME', 'dofs')
+        environment = os.environ.get('ENVIRONMENT', 'dev')
+        region = os.environ.get('AWS_DEFAULT_REGION', context.invoked_function_arn.split(':')[3])
+        account_id = context.invoked_function_arn.split(':')[4]
+        cached_state_machine_arn = f"arn:aws:states:{region}:{account_id}:stateMachine:{project_name}-order-processor-{environment}"
+    
+    return cached_state_machine_arn
+
+def build_throttled_response(reason, retry_after):
+    """
+    429 telling the client when to retry a shed submission
+    """
+    return build_response(429, {
+        'error': 'Too many requests' if reason == admission.REASON_RATE_LIMITED else 'Order pipeline is saturated',
+        'reason': reason,
+        'retry_after': retry_after
+    }, {'Retry-After': str(retry_after), 'Access-Control-Expose-Headers': 'Retry-After'})
+
+def build_response(status_code, body, headers=None):
+    """
+    Build an API Gateway proxy response with CORS headers; a None body is
+    sent empty
+    """
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            **(headers or {})
+        },
+        'body': '' if body is None else order_codec.dumps(body)
+    }
@@ -0,0 +1,160 @@
+"""
+Order status lookups for GET /orders/{order_id} and GET /orders?ids=...
+
+Lookups read a projection of the order (status and fulfillment details)
+through a per-container LRU cache. Entries for orders still in flight
+expire after CACHE_TTL_SECONDS, so pollers see a status change quickly.
+Orders in a final status change no more and are kept for
+TERMINAL_TTL_SECONDS. Unknown order IDs are cached too, so polling for an
+order that does not exist does not reach DynamoDB on every request.
+
+Multi-ID lookups fetch all cache misses with BatchGetItem. Responses carry
+an ETag computed from the returned order view. A client that sends it
+back in If-None-Match gets a 304 with no body.
+"""
+
+import os
+import hashlib
+import random
+import time
+from collections import OrderedDict
+
+import order_codec
+import telemetry
+
+CACHE_TTL_SECONDS = float(os.environ.get('ORDER_CACHE_TTL_SECONDS', '2'))
+TERMINAL_TTL_SECONDS = float(os.environ.get('ORDER_CACHE_TERMINAL_TTL_SECONDS', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('ORDER_CACHE_SIZE', '5000'))
+
+# BatchGetItem accepts at most 100 keys per call
+MAX_IDS = 100
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.05
+
+TERMINAL_STATUSES = frozenset({'FULFILLED', 'STORAGE_FAILED'})
+
+# Attributes returned to clients; everything else stays internal
+LOOKUP_FIELDS = (
+    'order_id', 'status', 'created_at', 'updated_at', 'retry_count',
+    'tracking_number', 'fulfillment_details', 'fulfillment_timestamp', 'error_message'
+)
+PROJECTION = {
+    'ProjectionExpression': ', '.join(f"#f{index}" for index in range(len(LOOKUP_FIELDS))),
+    'ExpressionAttributeNames': {f"#f{index}": name for index, name in enumerate(LOOKUP_FIELDS)}
+}
+
+# order_id -> (expires_at, view or None), least recently used first
+cache = OrderedDict()
+cache_stats = {'hits': 0, 'misses': 0}
+
+# Monotonic seconds; replaceable so simulations can fast-forward
+clock = time.monotonic
+
+def order_view(item):
+    return {name: item[name] for name in LOOKUP_FIELDS if name in item}
+
+def cached(order_id):
+    """
+    (True, view) on a fresh cache entry, (False, None) otherwise
+    """
+    entry = cache.get(order_id)
+    if entry is None or entry[0] <= clock():
+        cache_stats['misses'] += 1
+        telemetry.metrics.count('OrderCacheMisses')
+        return False, None
+    cache.move_to_end(order_id)
+    cache_stats['hits'] += 1
+    telemetry.metrics.count('OrderCacheHits')
+    return True, entry[1]
+
+def remember(order_id, view):
+    ttl = TERMINAL_TTL_SECONDS if view and view.get('status') in TERMINAL_STATUSES else CACHE_TTL_SECONDS
+    cache[order_id] = (clock() + ttl, view)
+    cache.move_to_end(order_id)
+    while len(cache) > CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
+
+def get_order(table, order_id):
+    """
+    The order's view, or None if there is no such order
+    """
+    hit, view = cached(order_id)
+    if hit:
+        return view
+
+    item = table.get_item(Key={'order_id': order_id}, **PROJECTION).get('Item')
+    view = order_view(item) if item else None
+    remember(order_id, view)
+    return view
+
+def get_orders(dynamodb, table_name, order_ids):
+    """
+    Views of up to MAX_IDS orders keyed by order_id; unknown IDs are left out
+    """
+    views = {}
+    misses = []
+    for order_id in dict.fromkeys(order_ids):
+        hit, view = cached(order_id)
+        if not hit:
+            misses.append(order_id)
+        elif view:
+            views[order_id] = view
+
+    if misses:
+        found = batch_get(dynamodb, table_name, misses)
+        for order_id in misses:
+            view = found.get(order_id)
+            remember(order_id, view)
+            if view:
+                views[order_id] = view
+    return views
+
+def batch_get(dynamodb, table_name, order_ids):
+    """
+    One BatchGetItem call plus UnprocessedKeys retries
+    """
+    request_items = {table_name: {'Keys': [{'order_id': order_id} for order_id in order_ids], **PROJECTION}}
+    found = {}
+    attempt = 0
+    while request_items:
+        response = dynamodb.batch_get_item(RequestItems=request_items)
+        for item in response.get('Responses', {}).get(table_name, []):
+            found[item['order_id']] = order_view(item)
+
+        request_items = response.get('UnprocessedKeys') or {}
+        if not request_items:
+            break
+
+        attempt += 1
+        telemetry.metrics.count('BatchGetRetries')
+        if attempt >= MAX_ATTEMPTS:
+            raise RuntimeError(f"BatchGetItem left keys unprocessed after {attempt} attempts")
+        time.sleep(random.uniform(0, BASE_DELAY * (2 ** attempt)))
+    return found
+
+def etag(payload):
+    """
+    Strong ETag over the JSON encoding of a response payload
+    """
+    return '"' + hashlib.sha256(order_codec.dumps(payload).encode('utf-8')).hexdigest()[:32] + '"'
+
+def not_modified(if_none_match, current_etag):
+    """
+    Whether an If-None-Match header value matches the current ETag
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate in ('*', current_etag):
+            return True
+    return False
+
+def hit_ratio():
+    """
+    Percentage of this container's lookups served from the cache
+    """
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    return round(100.0 * cache_stats['hits'] / lookups, 2) if lookups else 0.0
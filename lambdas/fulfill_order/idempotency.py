@@ -0,0 +1,116 @@
+"""
+Fulfillment idempotency ledger
+
+Each fulfillment attempt is identified by order_id plus a processing
+version (the order's retry_count). Attempts are claimed with a conditional
+put on the ledger table before any fulfillment work starts, and keys seen
+by this container are remembered in a small LRU so repeats skip the
+DynamoDB round trip entirely.
+"""
+
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+LEDGER_TABLE_NAME = os.environ.get('FULFILLMENT_LEDGER_TABLE_NAME')
+RECENT_KEYS_MAX = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+# An unfinished claim older than this may be taken over (e.g. after a crash)
+CLAIM_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '300'))
+LEDGER_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(7 * 24 * 3600)))
+
+STATUS_IN_PROGRESS = 'IN_PROGRESS'
+STATUS_COMPLETED = 'COMPLETED'
+
+# Per-container cache of idempotency keys already claimed or completed,
+# shared by fulfill_order's worker threads
+recent_keys = OrderedDict()
+recent_keys_lock = threading.Lock()
+
+def is_enabled():
+    return bool(LEDGER_TABLE_NAME)
+
+def idempotency_key(order_data):
+    """
+    Key a fulfillment attempt on order_id plus its processing version
+    """
+    return f"{order_data['order_id']}#v{int(order_data.get('retry_count', 0))}"
+
+def seen_recently(key):
+    with recent_keys_lock:
+        if key in recent_keys:
+            recent_keys.move_to_end(key)
+            return True
+    return False
+
+def remember(key):
+    with recent_keys_lock:
+        recent_keys[key] = True
+        recent_keys.move_to_end(key)
+        while len(recent_keys) > RECENT_KEYS_MAX:
+            recent_keys.popitem(last=False)
+
+def claim(dynamodb, key, order_id):
+    """
+    Claim a fulfillment attempt with a conditional write.
+    Returns False if another delivery already claimed or completed it.
+    """
+    now = int(time.time())
+    try:
+        dynamodb.Table(LEDGER_TABLE_NAME).put_item(
+            Item={
+                'idempotency_key': key,
+                'order_id': order_id,
+                'ledger_status': STATUS_IN_PROGRESS,
+                'claimed_at': now,
+                'expires_at': now + LEDGER_TTL_SECONDS
+            },
+            ConditionExpression='attribute_not_exists(idempotency_key) OR '
+                                '(ledger_status = :in_progress AND claimed_at < :lease_cutoff)',
+            ExpressionAttributeValues={
+                ':in_progress': STATUS_IN_PROGRESS,
+                ':lease_cutoff': now - CLAIM_LEASE_SECONDS
+            }
+        )
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            remember(key)
+            return False
+        raise
+    
+    remember(key)
+    return True
+
+def completion_item(key, order_id):
+    """
+    Ledger item marking an attempt completed. It is written only once the
+    order's status transition has gone through (or been rejected as
+    stale), so an attempt whose transition failed stays claimable.
+    """
+    now = int(time.time())
+    return {
+        'idempotency_key': key,
+        'order_id': order_id,
+        'ledger_status': STATUS_COMPLETED,
+        'completed_at': now,
+        'expires_at': now + LEDGER_TTL_SECONDS
+    }
+
+def release(dynamodb, key):
+    """
+    Drop a claim whose order write failed so the redelivery can proceed
+    """
+    with recent_keys_lock:
+        recent_keys.pop(key, None)
+    try:
+        dynamodb.Table(LEDGER_TABLE_NAME).delete_item(
+            Key={'idempotency_key': key},
+            ConditionExpression='ledger_status = :in_progress',
+            ExpressionAttributeValues={':in_progress': STATUS_IN_PROGRESS}
+        )
+    except Exception as e:
+        # The lease lets a later delivery take the claim over anyway
+        logger.warning("Could not release idempotency claim %s: %s", key, e)
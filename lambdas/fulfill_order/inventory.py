@@ -0,0 +1,315 @@
+"""
+Inventory reservations against the stock table
+
+All lines of an order are reserved in one TransactWriteItems call: a
+conditional decrement per stock row (available >= quantity) plus a
+reservation marker keyed on order_id and the attempt's processing version
+(its retry_count). Either every line is reserved or none is. A redelivered
+attempt finds its marker and reuses the reservation instead of taking the
+stock twice. release() is the compensating transaction: it deletes the
+marker and adds the quantities back, once.
+
+A hot SKU (INVENTORY_HOT_SKUS) is kept as INVENTORY_HOT_SKU_SHARDS rows,
+<product_id>#<n>, so a flash sale spreads its writes over several
+partitions. An order takes its quantity from the shard picked by a hash of
+its order_id, topping up from the next shards when that one runs low.
+
+Stock levels seen by this container (from failed conditions, reads and
+its own writes) are cached for INVENTORY_CACHE_TTL_SECONDS. An order that
+the cache shows cannot be served fails without a write.
+
+Tunables (environment):
+    INVENTORY_TABLE_NAME         stock table; reservations are off when unset
+    INVENTORY_HOT_SKUS           comma-separated product IDs with sharded stock
+    INVENTORY_HOT_SKU_SHARDS     rows per hot SKU, default 8. Changing it
+                                 requires reloading the hot SKUs' stock.
+    INVENTORY_CACHE_TTL_SECONDS  default 2
+"""
+
+import os
+import logging
+import threading
+import time
+import zlib
+
+from botocore.exceptions import ClientError
+
+import telemetry
+
+logger = logging.getLogger()
+
+TABLE_NAME = os.environ.get('INVENTORY_TABLE_NAME')
+HOT_SKUS = frozenset(sku.strip() for sku in os.environ.get('INVENTORY_HOT_SKUS', '').split(',') if sku.strip())
+HOT_SKU_SHARDS = int(os.environ.get('INVENTORY_HOT_SKU_SHARDS', '8'))
+CACHE_TTL_SECONDS = float(os.environ.get('INVENTORY_CACHE_TTL_SECONDS', '2'))
+RESERVATION_TTL_SECONDS = int(os.environ.get('INVENTORY_RESERVATION_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# TransactWriteItems accepts at most 100 actions; one is the marker
+MAX_TRANSACT_ITEMS = 100
+MAX_ATTEMPTS = 3
+
+ERROR_INSUFFICIENT = 'Insufficient inventory'
+ERROR_CONTENDED = 'Inventory reservation contended'
+
+# stock_key -> (expires_at, available units), shared by worker threads
+stock_cache = {}
+stock_cache_lock = threading.Lock()
+
+# Monotonic seconds; replaceable so simulations can fast-forward
+clock = time.monotonic
+
+def is_enabled():
+    return bool(TABLE_NAME)
+
+def stock_keys(product_id):
+    if product_id in HOT_SKUS:
+        return [f"{product_id}#{shard}" for shard in range(HOT_SKU_SHARDS)]
+    return [product_id]
+
+def marker_key(order_id, version, index):
+    return f"RESERVATION#{order_id}#v{version}#{index}"
+
+def order_lines(items):
+    """
+    Units per product_id, summed over the order's items
+    """
+    lines = {}
+    for item in items or []:
+        if isinstance(item, dict) and item.get('product_id') is not None:
+            product_id = str(item['product_id'])
+            lines[product_id] = lines.get(product_id, 0) + int(item.get('quantity', 0))
+    return {product_id: quantity for product_id, quantity in lines.items() if quantity > 0}
+
+def cached_level(stock_key):
+    entry = stock_cache.get(stock_key)
+    if entry is None or entry[0] <= clock():
+        return None
+    return entry[1]
+
+def remember(stock_key, available):
+    stock_cache[stock_key] = (clock() + CACHE_TTL_SECONDS, max(0, int(available)))
+
+def adjust(stock_key, delta):
+    with stock_cache_lock:
+        entry = stock_cache.get(stock_key)
+        if entry is not None:
+            stock_cache[stock_key] = (entry[0], max(0, entry[1] + delta))
+
+def cached_shortfall(lines):
+    """
+    Products the cache shows cannot cover their quantity; products with
+    any unknown stock row are assumed available
+    """
+    short = []
+    for product_id, quantity in lines.items():
+        levels = [cached_level(key) for key in stock_keys(product_id)]
+        if None not in levels and sum(levels) < quantity:
+            short.append(product_id)
+    return short
+
+def allocate(order_id, lines):
+    """
+    [(stock_key, units)] covering every line; hot SKUs start at the
+    order's shard and take from the next shards what the cache says it lacks
+    """
+    allocation = []
+    for product_id, quantity in lines.items():
+        keys = stock_keys(product_id)
+        if len(keys) == 1:
+            allocation.append((keys[0], quantity))
+            continue
+        start = zlib.crc32(order_id.encode('utf-8')) % len(keys)
+        taken = {}
+        remaining = quantity
+        for offset in range(len(keys)):
+            key = keys[(start + offset) % len(keys)]
+            level = cached_level(key)
+            take = remaining if level is None else min(remaining, level)
+            if take > 0:
+                taken[key] = take
+                remaining -= take
+            if not remaining:
+                break
+        if remaining:
+            # The cache expired in between; let the condition decide
+            taken[keys[start]] = taken.get(keys[start], 0) + remaining
+        allocation.extend(taken.items())
+    return allocation
+
+def chunk_lines(lines):
+    """
+    Split the lines so each chunk fits one transaction even when every hot
+    SKU spreads over all of its shards; almost every order is one chunk
+    """
+    chunks = [{}]
+    size = 0
+    for product_id in sorted(lines):
+        cost = len(stock_keys(product_id))
+        if size + cost > MAX_TRANSACT_ITEMS - 1 and chunks[-1]:
+            chunks.append({})
+            size = 0
+        chunks[-1][product_id] = lines[product_id]
+        size += cost
+    return chunks
+
+def reserve(dynamodb, order_id, version, items):
+    """
+    Reserve every line of an order. Returns {'reserved': bool,
+    'allocations': [[(stock_key, units), ...] per transaction],
+    'created': whether this call took the stock, 'short': product IDs,
+    'error': reason when not reserved}
+    """
+    lines = order_lines(items)
+    short = cached_shortfall(lines)
+    if short:
+        telemetry.metrics.count('InventoryFastFails')
+        logger.info("Order %s fails fast on cached stock of %s", order_id, short)
+        return {'reserved': False, 'allocations': [], 'created': False, 'short': short, 'error': ERROR_INSUFFICIENT}
+
+    allocations = []
+    created = False
+    with telemetry.metrics.timer('InventoryReservationLatency'):
+        for index, chunk in enumerate(chunk_lines(lines)):
+            result = reserve_chunk(dynamodb, order_id, version, index, chunk)
+            if not result['reserved']:
+                # Compensate for the chunks already reserved
+                release(dynamodb, order_id, version, {'allocations': allocations})
+                return {**result, 'allocations': [], 'created': False}
+            allocations.append(result['allocation'])
+            created = created or result['created']
+
+    telemetry.metrics.count('InventoryReservations')
+    return {'reserved': True, 'allocations': allocations, 'created': created, 'short': [], 'error': None}
+
+def reserve_chunk(dynamodb, order_id, version, index, lines):
+    marker = marker_key(order_id, version, index)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        allocation = allocate(order_id, lines)
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=reserve_actions(order_id, marker, allocation))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons') or []
+            if reasons and reasons[-1].get('Code') == 'ConditionalCheckFailed':
+                # An earlier delivery of this attempt already reserved the stock
+                return {'reserved': True, 'allocation': stored_allocation(dynamodb, marker), 'created': False}
+
+            for (key, _), reason in zip(allocation, reasons):
+                if reason.get('Code') == 'ConditionalCheckFailed':
+                    # A missing stock row has nothing available
+                    remember(key, reason.get('Item', {}).get('available', {}).get('N', 0))
+            telemetry.metrics.count('InventoryReservationConflicts')
+
+            short = cached_shortfall(lines)
+            if short:
+                logger.info("Order %s short of stock for %s", order_id, short)
+                return {'reserved': False, 'short': short, 'error': ERROR_INSUFFICIENT}
+            # Shards of a hot SKU ran low: read all of them before reallocating
+            refresh(dynamodb, [key for product_id in lines for key in stock_keys(product_id)
+                               if len(stock_keys(product_id)) > 1 and cached_level(key) is None])
+            logger.info("Retrying reservation of order %s (attempt %d)", order_id, attempt)
+            continue
+
+        for key, quantity in allocation:
+            adjust(key, -quantity)
+        return {'reserved': True, 'allocation': allocation, 'created': True}
+
+    return {'reserved': False, 'short': [], 'error': ERROR_CONTENDED}
+
+def reserve_actions(order_id, marker, allocation):
+    actions = [
+        {
+            'Update': {
+                'TableName': TABLE_NAME,
+                'Key': {'stock_key': {'S': key}},
+                'UpdateExpression': 'SET available = available - :quantity',
+                'ConditionExpression': 'attribute_exists(stock_key) AND available >= :quantity',
+                'ExpressionAttributeValues': {':quantity': {'N': str(quantity)}},
+                'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+            }
+        }
+        for key, quantity in allocation
+    ]
+    now = int(time.time())
+    actions.append({
+        'Put': {
+            'TableName': TABLE_NAME,
+            'Item': {
+                'stock_key': {'S': marker},
+                'order_id': {'S': order_id},
+                'allocation': {'L': [{'M': {'stock_key': {'S': key}, 'quantity': {'N': str(quantity)}}}
+                                     for key, quantity in allocation]},
+                'reserved_at': {'N': str(now)},
+                'expires_at': {'N': str(now + RESERVATION_TTL_SECONDS)}
+            },
+            'ConditionExpression': 'attribute_not_exists(stock_key)'
+        }
+    })
+    return actions
+
+def stored_allocation(dynamodb, marker):
+    item = dynamodb.Table(TABLE_NAME).get_item(Key={'stock_key': marker}, ConsistentRead=True).get('Item', {})
+    return [(entry['stock_key'], int(entry['quantity'])) for entry in item.get('allocation', [])]
+
+def refresh(dynamodb, keys):
+    """
+    Cache the current level of each stock row
+    """
+    if not keys:
+        return
+    response = dynamodb.batch_get_item(RequestItems={
+        TABLE_NAME: {'Keys': [{'stock_key': key} for key in keys[:100]], 'ConsistentRead': True}
+    })
+    found = {item['stock_key']: item.get('available', 0) for item in response.get('Responses', {}).get(TABLE_NAME, [])}
+    unprocessed = {key['stock_key'] for key in response.get('UnprocessedKeys', {}).get(TABLE_NAME, {}).get('Keys', [])}
+    for key in keys[:100]:
+        if key not in unprocessed:
+            remember(key, found.get(key, 0))
+
+def release(dynamodb, order_id, version, reservation):
+    """
+    Return a reservation's stock. A reservation that was already released
+    (its marker is gone) is left alone, so a release can be retried.
+    """
+    for index, allocation in enumerate(reservation.get('allocations') or []):
+        actions = [
+            {
+                'Update': {
+                    'TableName': TABLE_NAME,
+                    'Key': {'stock_key': {'S': key}},
+                    'UpdateExpression': 'ADD available :quantity',
+                    'ExpressionAttributeValues': {':quantity': {'N': str(quantity)}}
+                }
+            }
+            for key, quantity in allocation
+        ]
+        actions.append({
+            'Delete': {
+                'TableName': TABLE_NAME,
+                'Key': {'stock_key': {'S': marker_key(order_id, version, index)}},
+                'ConditionExpression': 'attribute_exists(stock_key)'
+            }
+        })
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=actions)
+        except ClientError as e:
+            reasons = e.response.get('CancellationReasons') or []
+            if reasons and reasons[-1].get('Code') == 'ConditionalCheckFailed':
+                logger.info("Reservation %s was already released", marker_key(order_id, version, index))
+                continue
+            raise
+        for key, quantity in allocation:
+            adjust(key, quantity)
+        telemetry.metrics.count('InventoryReleases')
+        logger.info("Released %d stock rows reserved for order %s", len(allocation), order_id)
+
+def stock_rows(product_id, available):
+    """
+    Stock table items holding available units of a product, split evenly
+    over the shards of a hot SKU
+    """
+    keys = stock_keys(product_id)
+    share, extra = divmod(int(available), len(keys))
+    return [{'stock_key': key, 'product_id': product_id, 'available': share + (1 if index < extra else 0)}
+            for index, key in enumerate(keys)]
@@ -1,123 +1,352 @@
 import json
-import boto3
 import os
 import logging
 import random
+import aws_clients
+import batch_writes
+import claim_check
+import order_codec
+import idempotency
+import inventory
+import order_index
+import order_repository
+import retry_scheduler
+import routing
+import telemetry
+import tracing
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from decimal import Decimal
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(telemetry.LOG_LEVEL)
 
-dynamodb = boto3.resource('dynamodb')
-sqs = boto3.client('sqs')
+# Records of a batch are processed on up to this many threads
+FULFILLMENT_CONCURRENCY = int(os.environ.get('FULFILLMENT_CONCURRENCY', '16'))
 
+# Worker threads each get their own DynamoDB resource
+dynamodb = aws_clients.resource('dynamodb', per_thread=True)
+sqs = aws_clients.client('sqs')
+
+# Created on first use and kept for the life of the container, so worker
+# threads and their resources are reused across invocations
+executor = None
+
+@telemetry.instrument('fulfill_order')
 def lambda_handler(event, context):
     """
-    Process orders from SQS queue and fulfill them
+    Process a batch of orders from SQS queue and fulfill them
+
+    Records are processed concurrently on up to FULFILLMENT_CONCURRENCY
+    threads, each isolated from the others' errors. Order status changes
+    are conditional partial updates. Ledger and failed-order writes are
+    grouped through BatchWriteItem, and only the records whose writes
+    could not be persisted are reported back in batchItemFailures, so SQS
+    redelivers those messages instead of the whole batch.
+
+    Failed attempts are re-enqueued with a backoff delay (see
+    retry_scheduler). The same handler runs the scheduled sweep of
+    retries that are due in the orders table's retry index.
     """
     
+    aws_clients.log_cold_start('fulfill_order')
+    
     orders_table_name = os.environ.get('ORDERS_TABLE_NAME')
     failed_orders_table_name = os.environ.get('FAILED_ORDERS_TABLE_NAME')
+    order_queue_url = os.environ.get('ORDER_QUEUE_URL')
+    
+    # EventBridge schedule: re-enqueue retries that have come due
+    if event.get('source') == 'aws.events':
+        return retry_scheduler.sweep(dynamodb.Table(orders_table_name), sqs, order_queue_url)
+    
+    records = event.get('Records', [])
+    
+    # Records run concurrently; their results are merged in record order,
+    # so for pending writes keyed by (table_name, key) the last write for a
+    # key in the batch still wins, as with the old sequential put_item
+    results = run_records(records, orders_table_name, failed_orders_table_name)
+    
+    pending_writes = {}
+    outcomes = {}
+    claimed_keys = {}
+    retry_message_ids = set()
+    pending_retries = []
+    
+    for result in results:
+        message_id = result['message_id']
+        # Redelivered records hold a claim too, which must be released
+        if result['claimed_key']:
+            claimed_keys[message_id] = result['claimed_key']
+        if result['redeliver']:
+            retry_message_ids.add(message_id)
+            continue
+        for table_name, item, key_attribute in result['writes']:
+            batch_writes.queue_write(pending_writes, table_name, item, message_id, key_attribute=key_attribute)
+        if result['retry']:
+            pending_retries.append(result['retry'])
+        outcomes[message_id] = result['outcome']
     
-    orders_table = dynamodb.Table(orders_table_name)
-    failed_orders_table = dynamodb.Table(failed_orders_table_name)
+    # Send failures are left to the retry sweep rather than redelivered
+    if pending_retries:
+        retry_scheduler.send_retries(sqs, order_queue_url, pending_retries)
+    
+    with telemetry.metrics.timer('BatchWriteLatency'):
+        unwritten_message_ids = batch_writes.write_all(dynamodb, pending_writes) | retry_message_ids
     
     processed_count = 0
     failed_count = 0
+    duplicate_count = 0
+    rejected_count = 0
+    batch_item_failures = []
     
-    for record in event['Records']:
-        try:
-            # Parse SQS message
-            message_body = json.loads(record['body'])
-            order_data = message_body if 'order_id' in message_body else json.loads(message_body)
-            
-            order_id = order_data['order_id']
-            logger.info(f"Processing order fulfillment for order_id: {order_id}")
-            
-            # Simulate fulfillment process
-            fulfillment_result = simulate_fulfillment(order_data)
-            
-            if fulfillment_result['success']:
-                # Update order status to FULFILLED
-                order_data.update({
-                    'status': 'FULFILLED',
-                    'fulfillment_timestamp': datetime.utcnow().isoformat(),
-                    'fulfillment_details': fulfillment_result['details'],
-                    'tracking_number': fulfillment_result.get('tracking_number'),
-                    'updated_at': datetime.utcnow().isoformat()
-                })
-                
-                # Convert floats to Decimal for DynamoDB
-                order_data = convert_floats_to_decimal(order_data)
-                
-                # Save fulfilled order
-                orders_table.put_item(Item=order_data)
-                
-                logger.info(f"Order {order_id} fulfilled successfully")
-                processed_count += 1
-                
-            else:
-                # Handle fulfillment failure
-                logger.error(f"Fulfillment failed for order {order_id}: {fulfillment_result['error']}")
-                
-                # Update order status to FULFILLMENT_FAILED
-                order_data.update({
-                    'status': 'FULFILLMENT_FAILED',
-                    'fulfillment_timestamp': datetime.utcnow().isoformat(),
-                    'error_message': fulfillment_result['error'],
-                    'retry_count': order_data.get('retry_count', 0) + 1,
-                    'updated_at': datetime.utcnow().isoformat()
-                })
-                
-                # Convert floats to Decimal for DynamoDB
-                order_data = convert_floats_to_decimal(order_data)
-                
-                # Move to failed orders table if max retries exceeded
-                if order_data['retry_count'] >= 3:
-                    failed_orders_table.put_item(Item=order_data)
-                    logger.info(f"Order {order_id} moved to failed orders table after {order_data['retry_count']} retries")
-                else:
-                    # Save back to orders table for potential retry
-                    orders_table.put_item(Item=order_data)
-                    logger.info(f"Order {order_id} marked as fulfillment failed, retry count: {order_data['retry_count']}")
-                
-                failed_count += 1
-                
-        except Exception as e:
-            logger.error(f"Error processing record {record.get('messageId', 'unknown')}: {str(e)}")
+    for record in records:
+        message_id = record.get('messageId', 'unknown')
+        if message_id in unwritten_message_ids:
+            batch_item_failures.append({'itemIdentifier': message_id})
+            # Let the redelivered message claim the attempt again; release
+            # also evicts the key from this container's recent keys
+            if message_id in claimed_keys:
+                idempotency.release(dynamodb, claimed_keys[message_id])
+        elif outcomes.get(message_id) == 'fulfilled':
+            processed_count += 1
+        elif outcomes.get(message_id) == 'duplicate':
+            duplicate_count += 1
+        elif outcomes.get(message_id) == 'rejected':
+            rejected_count += 1
+        else:
             failed_count += 1
-            
-            # Optionally save the problematic order to failed orders table
-            try:
-                failed_order = {
-                    'order_id': f"error-{record.get('messageId', 'unknown')}-{int(datetime.utcnow().timestamp())}",
-                    'original_record': record,
-                    'error_message': str(e),
-                    'failed_at': datetime.utcnow().isoformat(),
-                    'status': 'PROCESSING_ERROR'
-                }
-                failed_orders_table.put_item(Item=failed_order)
-            except:
-                logger.error("Failed to save error record to failed orders table")
     
-    logger.info(f"Fulfillment processing complete. Processed: {processed_count}, Failed: {failed_count}")
+    logger.info("Fulfillment processing complete. Processed: %d, Failed: %d, Duplicates: %d, Rejected: %d, Redelivered: %d",
+                processed_count, failed_count, duplicate_count, rejected_count, len(batch_item_failures))
+    
+    metrics = telemetry.metrics
+    metrics.count('OrderRecords', len(records))
+    metrics.count('FulfilledOrders', processed_count)
+    metrics.count('FailedOrders', failed_count)
+    metrics.count('DuplicateOrders', duplicate_count)
+    metrics.count('RedeliveredOrders', len(batch_item_failures))
+    if records:
+        metrics.gauge('DuplicateRate', round(100.0 * duplicate_count / len(records), 2), 'Percent')
     
     return {
         'statusCode': 200,
         'body': json.dumps({
             'processed_orders': processed_count,
             'failed_orders': failed_count,
-            'total_records': len(event['Records'])
-        })
+            'duplicate_orders': duplicate_count,
+            'rejected_transitions': rejected_count,
+            'redelivered_orders': len(batch_item_failures),
+            'scheduled_retries': len(pending_retries),
+            'total_records': len(records)
+        }),
+        'batchItemFailures': batch_item_failures
     }
 
+def run_records(records, orders_table_name, failed_orders_table_name):
+    """
+    process_record for every record on up to FULFILLMENT_CONCURRENCY
+    threads, so a batch takes about as long as its slowest record.
+    Results come back in record order.
+    """
+    global executor
+    
+    def process(record):
+        return process_record(record, orders_table_name, failed_orders_table_name)
+    
+    with telemetry.metrics.timer('RecordProcessingLatency'):
+        if FULFILLMENT_CONCURRENCY <= 1 or len(records) <= 1:
+            return [process(record) for record in records]
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=FULFILLMENT_CONCURRENCY, thread_name_prefix='fulfill')
+        return list(executor.map(process, records))
+
+def process_record(record, orders_table_name, failed_orders_table_name):
+    """
+    Fulfill one SQS record. Nothing shared is written here: the record's
+    outcome, the items it needs batch-written and its retry are returned
+    for the handler to merge, so records can run concurrently.
+    """
+    
+    message_id = record.get('messageId', 'unknown')
+    stage_started = tracing.started()
+    result = {'message_id': message_id, 'outcome': None, 'writes': [],
+              'claimed_key': None, 'redeliver': False, 'retry': None}
+    
+    try:
+        # Parse SQS message straight into DynamoDB-ready types; the state
+        # machine's SendToQueue wraps the order in order_data
+        order_data = order_codec.order_from_message(order_codec.parse_message_body(record['body']))
+        if order_data is None:
+            raise ValueError("Message does not carry an order")
+        
+        order_id = order_data['order_id']
+        
+        # Skip duplicate deliveries before any fulfillment work starts
+        if idempotency.is_enabled():
+            key = idempotency.idempotency_key(order_data)
+            try:
+                is_duplicate = idempotency.seen_recently(key) or not idempotency.claim(dynamodb, key, order_id)
+            except Exception as e:
+                # Ledger unavailable: have SQS redeliver rather than risk a double fulfillment
+                logger.error("Idempotency claim failed for order %s: %s", order_id, e)
+                result['redeliver'] = True
+                return result
+            if is_duplicate:
+                logger.info("Skipping duplicate delivery of order %s (%s)", order_id, key)
+                result['outcome'] = 'duplicate'
+                return result
+            result['claimed_key'] = key
+        
+        logger.info("Processing order fulfillment for order_id: %s", order_id)
+        
+        previous_retry_count = int(order_data.get('retry_count', 0))
+        
+        # Simulate fulfillment process
+        fulfillment_result = simulate_fulfillment(order_data)
+        reservation = fulfillment_result.get('reservation')
+        
+        if reservation and not fulfillment_result['success']:
+            # Compensate: the stock goes back before the failure is recorded
+            try:
+                inventory.release(dynamodb, order_id, previous_retry_count, reservation)
+            except Exception as e:
+                logger.error("Failed to release inventory of order %s: %s", order_id, e)
+                result['redeliver'] = True
+                return result
+        
+        if fulfillment_result['success']:
+            # Only the fulfillment attributes change; the stored order is not rewritten
+            new_status = order_repository.STATUS_FULFILLED
+            changes = {
+                'fulfillment_timestamp': datetime.utcnow().isoformat(),
+                'fulfillment_details': fulfillment_result['details'],
+                'tracking_number': fulfillment_result.get('tracking_number')
+            }
+            remove = retry_scheduler.SCHEDULE_ATTRIBUTES
+        else:
+            # Handle fulfillment failure
+            logger.error("Fulfillment failed for order %s: %s", order_id, fulfillment_result['error'])
+            
+            new_status = order_repository.STATUS_FULFILLMENT_FAILED
+            retry_count = previous_retry_count + 1
+            changes = {
+                'fulfillment_timestamp': datetime.utcnow().isoformat(),
+                'error_message': fulfillment_result['error'],
+                'retry_count': retry_count
+            }
+            if retry_scheduler.budget_exhausted(retry_count):
+                remove = retry_scheduler.SCHEDULE_ATTRIBUTES
+            else:
+                # Index entry first, so the sweep covers a retry that never gets sent
+                delay = retry_scheduler.backoff_delay(retry_count)
+                changes.update(retry_scheduler.schedule_attributes(order_id, delay))
+                remove = None
+        
+        # Conditional on the current status and retry_count, so a stale or
+        # duplicate delivery cannot overwrite a newer result
+        try:
+            applied = order_repository.transition(
+                dynamodb.Table(orders_table_name), order_id, new_status, changes,
+                expected_retry_count=previous_retry_count, remove=remove)
+        except Exception as e:
+            logger.error("Failed to update order %s: %s", order_id, e)
+            result['redeliver'] = True
+            return result
+        
+        # The attempt is settled only now; until here a redelivery must be
+        # able to claim it again
+        complete_claim(result)
+        
+        # Retries and the failed order carry this attempt in their trace
+        tracing.mark(order_data, 'fulfill' if previous_retry_count == 0 else 'fulfill_retry', stage_started)
+        
+        if not applied:
+            # A stale delivery must not hold stock it reserved itself
+            if reservation and reservation['created'] and fulfillment_result['success']:
+                try:
+                    inventory.release(dynamodb, order_id, previous_retry_count, reservation)
+                except Exception as e:
+                    logger.error("Failed to release inventory of rejected order %s: %s", order_id, e)
+            result['outcome'] = 'rejected'
+        elif fulfillment_result['success']:
+            result['outcome'] = 'fulfilled'
+            tracing.finish(order_data, 'Fulfillment')
+        else:
+            # Move to failed orders table once the retry budget is spent
+            if retry_scheduler.budget_exhausted(retry_count):
+                failed_at = datetime.utcnow().isoformat()
+                failed_order = {
+                    **order_data,
+                    **changes,
+                    'status': new_status,
+                    'failure_source': 'FULFILLMENT',
+                    'failed_at': failed_at,
+                    'failed_shard': order_index.failed_shard(new_status, order_id, failed_at),
+                    'updated_at': failed_at
+                }
+                failed_order.pop('status_shard', None)
+                result['writes'].append((failed_orders_table_name, failed_order, 'order_id'))
+                logger.info("Order %s moved to failed orders table after %d retries", order_id, retry_count)
+                tracing.finish(order_data, 'Failure')
+            elif retry_scheduler.uses_queue_delay(delay):
+                result['retry'] = (order_id, retry_scheduler.retry_body(order_data, retry_count), delay)
+                logger.info("Order %s retry %d scheduled in %ds", order_id, retry_count, delay)
+            else:
+                logger.info("Order %s retry %d due in %ds via the retry sweep", order_id, retry_count, delay)
+            
+            result['outcome'] = 'fulfillment_failed'
+            
+    except Exception as e:
+        logger.error("Error processing record %s: %s", message_id, e)
+        
+        # Save the problematic record to failed orders table
+        error_order_id = f"error-{message_id}-{int(datetime.utcnow().timestamp())}"
+        failed_at = datetime.utcnow().isoformat()
+        failed_order = {
+            'order_id': error_order_id,
+            'original_record': record,
+            'error_message': str(e),
+            'failed_at': failed_at,
+            'failed_shard': order_index.failed_shard('PROCESSING_ERROR', error_order_id, failed_at),
+            'failure_source': 'FULFILLMENT_PROCESSING',
+            'status': 'PROCESSING_ERROR'
+        }
+        result['writes'].append((failed_orders_table_name, failed_order, 'order_id'))
+        result['outcome'] = 'error'
+        complete_claim(result)
+    
+    return result
+
+def complete_claim(result):
+    """
+    Queue the ledger's completion item for a claimed attempt, in the same
+    BatchWriteItem as the record's other writes
+    """
+    key = result['claimed_key']
+    if key and not any(table_name == idempotency.LEDGER_TABLE_NAME for table_name, _, _ in result['writes']):
+        order_id = key.rpartition('#v')[0]
+        result['writes'].append((idempotency.LEDGER_TABLE_NAME, idempotency.completion_item(key, order_id),
+                                 'idempotency_key'))
+
 def simulate_fulfillment(order_data):
     """
     Simulate order fulfillment process
     Returns success/failure with details
+
+    With an inventory table the order's stock is reserved first, and the
+    result carries the reservation; the caller releases it if the
+    fulfillment fails.
     """
     
+    reservation = None
+    if inventory.is_enabled():
+        items = claim_check.check_out(order_data).get('items')
+        reservation = inventory.reserve(dynamodb, order_data['order_id'], int(order_data.get('retry_count', 0)), items)
+        if not reservation['reserved']:
+            return {
+                'success': False,
+                'error': reservation['error']
+            }
+    
     # Simulate random fulfillment success/failure (70% success rate)
     success_rate = 0.7
     is_successful = random.random() < success_rate
@@ -126,50 +355,35 @@ def simulate_fulfillment(order_data):
         # Generate tracking number
         tracking_number = f"TRACK{random.randint(100000, 999999)}"
         
+        # Nearest fulfillment center that can take the order
+        route = routing.route_order(order_data)
+        
         return {
             'success': True,
             'tracking_number': tracking_number,
             'details': {
-                'fulfillment_center': 'FC-01',
-                'estimated_delivery': get_estimated_delivery(),
+                'fulfillment_center': route['fulfillment_center'],
+                'estimated_delivery': route['estimated_delivery'],
+                'transit_days': route['transit_days'],
                 'shipping_method': 'STANDARD',
-                'items_fulfilled': len(order_data.get('items', []))
-            }
+                'items_fulfilled': claim_check.item_summary(order_data)[0]
+            },
+            'reservation': reservation
         }
     else:
-        # Simulate different failure reasons
+        # Simulate different failure reasons; with reservations, stock
+        # shortages come from the inventory table instead
         failure_reasons = [
-            'Insufficient inventory',
             'Payment authorization failed',
             'Invalid shipping address',
             'Product discontinued',
             'Fulfillment center unavailable'
         ]
+        if reservation is None:
+            failure_reasons.insert(0, 'Insufficient inventory')
         
         return {
             'success': False,
-            'error': random.choice(failure_reasons)
+            'error': random.choice(failure_reasons),
+            'reservation': reservation
         }
-
-def get_estimated_delivery():
-    """
-    Calculate estimated delivery date (3-7 business days)
-    """
-    from datetime import timedelta
-    
-    delivery_days = random.randint(3, 7)
-    estimated_date = datetime.utcnow() + timedelta(days=delivery_days)
-    return estimated_date.isoformat()
-
-def convert_floats_to_decimal(obj):
-    """
-    Convert float values to Decimal for DynamoDB compatibility
-    """
-    if isinstance(obj, list):
-        return [convert_floats_to_decimal(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {key: convert_floats_to_decimal(value) for key, value in obj.items()}
-    elif isinstance(obj, float):
-        return Decimal(str(obj))
-    else:
-        return obj
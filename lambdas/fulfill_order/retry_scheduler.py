@@ -0,0 +1,187 @@
+"""
+Backoff-scheduled fulfillment retries
+
+A failed fulfillment attempt is re-enqueued to the order queue with an
+exponentially growing DelaySeconds. Each delay is drawn uniformly from the
+upper half of its backoff window, so orders that failed together (e.g.
+during a fulfillment center outage) come back spread out, not in lockstep.
+
+Every scheduled retry is also written to the orders table's sparse
+retry-sweep-index (retry_shard, retry_sweep_at):
+
+  delay <= 15 minutes  SQS delivers the retry. The index entry is a safety
+                       net that comes due SWEEP_GRACE_SECONDS later, in
+                       case the send failed.
+  delay  > 15 minutes  SQS cannot delay that long, so the index entry comes
+                       due at the retry time and the scheduled sweep
+                       re-enqueues the order.
+
+Entries are cleared when the order reaches a terminal status. Orders go to
+failed_orders only once MAX_RETRIES attempts have failed.
+"""
+
+import os
+import logging
+import random
+import time
+import zlib
+import order_codec
+import telemetry
+import tracing
+
+logger = logging.getLogger()
+
+MAX_RETRIES = int(os.environ.get('FULFILLMENT_MAX_RETRIES', '3'))
+BASE_DELAY_SECONDS = int(os.environ.get('FULFILLMENT_RETRY_BASE_SECONDS', '30'))
+MAX_DELAY_SECONDS = int(os.environ.get('FULFILLMENT_RETRY_MAX_DELAY_SECONDS', '3600'))
+SWEEP_GRACE_SECONDS = int(os.environ.get('FULFILLMENT_RETRY_SWEEP_GRACE_SECONDS', '900'))
+SWEEP_MAX_ORDERS = int(os.environ.get('FULFILLMENT_RETRY_SWEEP_MAX_ORDERS', '500'))
+SHARD_COUNT = int(os.environ.get('FULFILLMENT_RETRY_SHARDS', '4'))
+
+# SQS limits
+SQS_MAX_DELAY_SECONDS = 900
+SEND_BATCH_MAX_ENTRIES = 10
+
+# Swept orders are released over this window rather than all at once
+SWEEP_SPREAD_SECONDS = 60
+
+SWEEP_INDEX_NAME = 'retry-sweep-index'
+SCHEDULE_ATTRIBUTES = ('retry_shard', 'retry_sweep_at')
+
+# Epoch seconds; replaceable so simulations can fast-forward
+clock = time.time
+
+def budget_exhausted(retry_count):
+    return retry_count >= MAX_RETRIES
+
+def backoff_delay(retry_count):
+    """
+    Seconds until the next attempt: uniform in [d/2, d] where
+    d = BASE_DELAY_SECONDS * 2^(retry_count - 1), capped at MAX_DELAY_SECONDS
+    """
+    ceiling = min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * 2 ** max(retry_count - 1, 0))
+    return int(random.uniform(ceiling / 2, ceiling))
+
+def shard_for(order_id):
+    """
+    Spread index entries over SHARD_COUNT partition keys
+    """
+    return f"RETRY#{zlib.crc32(order_id.encode('utf-8')) % SHARD_COUNT}"
+
+def schedule_attributes(order_id, delay, now=None):
+    """
+    Index attributes to set along with the FULFILLMENT_FAILED transition
+    """
+    now = clock() if now is None else now
+    sweep_at = now + delay
+    if delay <= SQS_MAX_DELAY_SECONDS:
+        sweep_at += SWEEP_GRACE_SECONDS
+    return {
+        'retry_shard': shard_for(order_id),
+        'retry_sweep_at': int(sweep_at),
+        'retry_delay_seconds': delay
+    }
+
+def uses_queue_delay(delay):
+    return delay <= SQS_MAX_DELAY_SECONDS
+
+def retry_body(order_data, retry_count):
+    """
+    Message for the next attempt; retry_count versions the idempotency key
+    """
+    body = {key: value for key, value in order_data.items() if key not in SCHEDULE_ATTRIBUTES}
+    body.update({'status': 'FULFILLMENT_FAILED', 'retry_count': retry_count})
+    return body
+
+def send_retries(sqs, queue_url, retries):
+    """
+    Send (order_id, body, delay_seconds) retries with SendMessageBatch.
+    Returns the order IDs that could not be sent; their index entries
+    make the sweep pick them up later.
+    """
+    unsent = set()
+    for start in range(0, len(retries), SEND_BATCH_MAX_ENTRIES):
+        chunk = retries[start:start + SEND_BATCH_MAX_ENTRIES]
+        entries = [
+            {
+                'Id': str(index),
+                'MessageBody': order_codec.encode_message(body),
+                'DelaySeconds': delay,
+                'MessageAttributes': {
+                    'order_id': {'StringValue': order_id, 'DataType': 'String'},
+                    'order_status': {'StringValue': body['status'], 'DataType': 'String'},
+                    'retry_count': {'StringValue': str(body['retry_count']), 'DataType': 'Number'},
+                    **tracing.message_attributes(body)
+                }
+            }
+            for index, (order_id, body, delay) in enumerate(chunk)
+        ]
+        try:
+            response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+            failed_indexes = [int(failure['Id']) for failure in response.get('Failed', [])]
+        except Exception as e:
+            logger.error("SendMessageBatch failed for %d retries: %s", len(entries), e)
+            failed_indexes = range(len(chunk))
+        for index in failed_indexes:
+            unsent.add(chunk[index][0])
+
+    telemetry.metrics.count('RetriesScheduled', len(retries) - len(unsent))
+    if unsent:
+        telemetry.metrics.count('RetrySendFailures', len(unsent))
+        logger.error("Could not enqueue retries for %d orders; left to the retry sweep", len(unsent))
+    return unsent
+
+def sweep(table, sqs, queue_url, now=None):
+    """
+    Re-enqueue orders whose retry_sweep_at has passed, shard by shard.
+    Each order is claimed first by moving its retry_sweep_at forward, so
+    concurrent sweeps don't enqueue it twice and a failed send is retried
+    after SWEEP_GRACE_SECONDS.
+    """
+    now = int(clock() if now is None else now)
+    swept = []
+
+    for shard in range(SHARD_COUNT):
+        query = {
+            'IndexName': SWEEP_INDEX_NAME,
+            'KeyConditionExpression': '#shard = :shard AND #sweep_at <= :now',
+            'ExpressionAttributeNames': {'#shard': 'retry_shard', '#sweep_at': 'retry_sweep_at'},
+            'ExpressionAttributeValues': {':shard': f"RETRY#{shard}", ':now': now},
+            'Limit': SWEEP_MAX_ORDERS - len(swept)
+        }
+        while len(swept) < SWEEP_MAX_ORDERS:
+            response = table.query(**query)
+            for order in response.get('Items', []):
+                if claim_for_sweep(table, order, now):
+                    swept.append((order['order_id'], retry_body(order, int(order.get('retry_count', 0))),
+                                  random.randint(0, SWEEP_SPREAD_SECONDS)))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            query['Limit'] = SWEEP_MAX_ORDERS - len(swept)
+
+    unsent = send_retries(sqs, queue_url, swept) if swept else set()
+    telemetry.metrics.count('RetriesSwept', len(swept))
+    logger.info("Retry sweep re-enqueued %d orders (%d unsent)", len(swept) - len(unsent), len(unsent))
+    return {'swept': len(swept), 'unsent': len(unsent)}
+
+def claim_for_sweep(table, order, now):
+    """
+    Push the order's retry_sweep_at forward if nobody else has touched it
+    """
+    try:
+        table.update_item(
+            Key={'order_id': order['order_id']},
+            UpdateExpression='SET #sweep_at = :next',
+            ConditionExpression='#sweep_at = :current AND #status = :failed',
+            ExpressionAttributeNames={'#sweep_at': 'retry_sweep_at', '#status': 'status'},
+            ExpressionAttributeValues={
+                ':next': now + SWEEP_GRACE_SECONDS,
+                ':current': order['retry_sweep_at'],
+                ':failed': 'FULFILLMENT_FAILED'
+            }
+        )
+        return True
+    except Exception as e:
+        logger.info("Skipping sweep of order %s: %s", order['order_id'], e)
+        return False
@@ -0,0 +1,118 @@
+"""
+Fulfillment-center routing by shipping address
+
+fulfillment_centers.json maps every 3-digit zip prefix to the centers that
+serve it, best first, each with its transit days:
+
+    "routes": {"071": "FC-01:1,FC-08:1,FC-02:3", ...}
+
+The file is parsed once per container into a dict of tuples, so routing an
+order is one dict lookup plus a walk over a few candidates. The first
+candidate that can take the order's units (a center's optional max_units)
+ships it. Prefixes missing from the file use its "default" route.
+
+The estimated delivery is the transit days, counted in business days, from
+the ship date: today before the center's cutoff_hour_utc, otherwise the
+next business day.
+
+Tunables (environment):
+    FULFILLMENT_CENTERS_FILE  routing data file, default fulfillment_centers.json
+                              next to this module
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import claim_check
+
+DATA_FILE = os.environ.get('FULFILLMENT_CENTERS_FILE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fulfillment_centers.json'))
+
+def parse_route(route):
+    """
+    "FC-01:1,FC-04:3" -> (('FC-01', 1), ('FC-04', 3))
+    """
+    candidates = []
+    for entry in route.split(','):
+        center_id, transit_days = entry.rsplit(':', 1)
+        candidates.append((center_id, int(transit_days)))
+    return tuple(candidates)
+
+class RoutingIndex:
+    """
+    Zip prefix -> ranked (center_id, transit_days) candidates
+    """
+
+    def __init__(self, data):
+        self.prefix_digits = int(data.get('prefix_digits', 3))
+        self.centers = data['centers']
+        self.max_units = {center_id: center.get('max_units') for center_id, center in self.centers.items()}
+        self.cutoffs = {center_id: center.get('cutoff_hour_utc', 24) for center_id, center in self.centers.items()}
+        self.routes = {prefix: parse_route(route) for prefix, route in data['routes'].items()}
+        self.default = parse_route(data['default'])
+        for candidates in (self.default, *self.routes.values()):
+            unknown = [center_id for center_id, _ in candidates if center_id not in self.centers]
+            if unknown:
+                raise ValueError(f"Routes refer to unknown fulfillment centers: {unknown}")
+
+    def candidates(self, zip_code):
+        if isinstance(zip_code, (int, Decimal)):
+            zip_code = f"{int(zip_code):05d}"
+        elif isinstance(zip_code, str):
+            zip_code = zip_code.strip()
+        else:
+            return self.default
+        return self.routes.get(zip_code[:self.prefix_digits], self.default)
+
+    def route(self, zip_code, units, now=None):
+        """
+        Center, transit days and estimated delivery date for an order of
+        units shipping to zip_code
+        """
+        candidates = self.candidates(zip_code)
+        center_id, transit_days = candidates[-1]
+        for candidate_id, candidate_days in candidates:
+            limit = self.max_units[candidate_id]
+            if limit is None or units <= limit:
+                center_id, transit_days = candidate_id, candidate_days
+                break
+
+        now = now or datetime.utcnow()
+        return {
+            'fulfillment_center': center_id,
+            'transit_days': transit_days,
+            'estimated_delivery': estimated_delivery(now.date(), now.hour >= self.cutoffs[center_id], transit_days)
+        }
+
+@lru_cache(maxsize=256)
+def estimated_delivery(today, after_cutoff, transit_days):
+    """
+    ISO date transit_days business days after the ship date
+    """
+    day = today + timedelta(days=1) if after_cutoff else today
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    remaining = transit_days
+    while remaining:
+        day += timedelta(days=1)
+        if day.weekday() < 5:
+            remaining -= 1
+    return day.isoformat()
+
+def load(path=DATA_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return RoutingIndex(json.load(f))
+
+# Loaded once per container, during init
+index = load()
+
+def route_order(order_data, now=None):
+    """
+    Route an order by its shipping_address.zip_code and total units
+    """
+    address = order_data.get('shipping_address')
+    zip_code = address.get('zip_code') if isinstance(address, dict) else None
+    return index.route(zip_code, claim_check.item_summary(order_data)[1], now)
@@ -0,0 +1,136 @@
+"""
+Order aggregates stream consumer
+
+Reads the DynamoDB streams of the orders and failed_orders tables and
+keeps the counters of the aggregates table (see order_aggregates in the
+shared layer) up to date: orders per status, orders created, fulfilled
+and failed plus revenue per hour, and failure reasons per hour.
+
+Each batch is coalesced to one update per bucket before anything is
+written. When a transaction fails, or the function is close to its
+timeout, the batch is reported as failed from its first unapplied
+record, so Lambda retries only what was not counted. Transactions carry
+a ClientRequestToken, so one resent after a lost response is not counted
+twice.
+
+The CLI prints the dashboard view, or rebuilds the counters from full
+scans of both tables (to count rows written before the stream consumer
+was deployed; run it while no orders are being written):
+
+    PYTHONPATH=lambdas/shared/python python lambdas/order_aggregates/lambda_function.py \
+        --since 2024-01-01T00:00:00 --until 2024-01-02T00:00:00
+    PYTHONPATH=lambdas/shared/python python lambdas/order_aggregates/lambda_function.py --rebuild
+"""
+
+import argparse
+import json
+import os
+import logging
+import time
+import aws_clients
+import order_aggregates
+import order_codec
+import telemetry
+
+logger = logging.getLogger()
+logger.setLevel(telemetry.LOG_LEVEL)
+
+dynamodb = aws_clients.resource('dynamodb')
+
+# No chunk is started with less time than this left, so the function
+# does not time out after applying part of a batch: 5 seconds, or a
+# tenth of the remaining time for short timeouts
+TIME_MARGIN_SECONDS = 5
+
+@telemetry.instrument('order_aggregates')
+def lambda_handler(event, context):
+    """
+    Apply a batch of orders / failed_orders stream records to the
+    aggregates table
+    """
+    
+    aws_clients.log_cold_start('order_aggregates')
+    
+    aggregates_table_name = os.environ.get('ORDER_AGGREGATES_TABLE_NAME')
+    failed_orders_table_name = os.environ.get('FAILED_ORDERS_TABLE_NAME')
+    
+    remaining = context.get_remaining_time_in_millis() / 1000.0
+    deadline = time.monotonic() + remaining - min(TIME_MARGIN_SECONDS, remaining / 10)
+    
+    records = event.get('Records', [])
+    chunks = order_aggregates.coalesce(records, failed_orders_table_name)
+    
+    telemetry.metrics.count('AggregateRecords', len(records))
+    telemetry.metrics.count('AggregateBuckets', sum(len(deltas) for _, _, deltas in chunks))
+    
+    for start, end, deltas in chunks:
+        # Earlier chunks are applied; Lambda retries from this record on
+        failure = {'batchItemFailures': [{'itemIdentifier': records[start]['dynamodb']['SequenceNumber']}]}
+        if time.monotonic() >= deadline:
+            logger.warning("Close to the timeout; leaving %d stream records for the retry", len(records) - start)
+            return failure
+        try:
+            order_aggregates.apply(dynamodb.meta.client, aggregates_table_name, deltas,
+                                   token=order_aggregates.request_token(records[start], records[end]),
+                                   updated_at=order_aggregates.changed_at(records[end]))
+        except Exception as e:
+            logger.error("Failed to apply %d aggregate buckets: %s", len(deltas), e)
+            return failure
+    
+    logger.info("Applied %d stream records as %d bucket updates",
+                len(records), sum(len(deltas) for _, _, deltas in chunks))
+    return {'batchItemFailures': []}
+
+def scan_all(table):
+    kwargs = {}
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get('Items', [])
+        if not response.get('LastEvaluatedKey'):
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def rebuild(aggregates_table, orders_table, failed_orders_table):
+    """
+    Overwrite every bucket with its total from full scans; buckets no row
+    contributes to any more are deleted
+    """
+    counters = order_aggregates.totals(scan_all(orders_table), scan_all(failed_orders_table))
+    stale = [(item['aggregate'], item['bucket']) for item in scan_all(aggregates_table)
+             if (item['aggregate'], item['bucket']) not in counters]
+    
+    with aggregates_table.batch_writer() as writer:
+        for (aggregate, bucket), fields in counters.items():
+            writer.put_item(Item={'aggregate': aggregate, 'bucket': bucket, **fields})
+        for aggregate, bucket in stale:
+            writer.delete_item(Key={'aggregate': aggregate, 'bucket': bucket})
+    return {'buckets': len(counters), 'deleted': len(stale)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Show or rebuild the order aggregates')
+    parser.add_argument('--table', help='aggregates table (default ORDER_AGGREGATES_TABLE_NAME)')
+    parser.add_argument('--since', help='first hour, ISO 8601 (default a day before --until)')
+    parser.add_argument('--until', help='last hour, ISO 8601 (default now)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='recount from full scans of ORDERS_TABLE_NAME and FAILED_ORDERS_TABLE_NAME')
+    args = parser.parse_args()
+    
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    
+    table_name = args.table or os.environ.get('ORDER_AGGREGATES_TABLE_NAME')
+    if not table_name:
+        parser.error('--table (or ORDER_AGGREGATES_TABLE_NAME) is needed')
+    
+    if args.rebuild:
+        if not os.environ.get('ORDERS_TABLE_NAME') or not os.environ.get('FAILED_ORDERS_TABLE_NAME'):
+            parser.error('--rebuild needs ORDERS_TABLE_NAME and FAILED_ORDERS_TABLE_NAME')
+        result = rebuild(dynamodb.Table(table_name), dynamodb.Table(os.environ['ORDERS_TABLE_NAME']),
+                         dynamodb.Table(os.environ['FAILED_ORDERS_TABLE_NAME']))
+        print(json.dumps(result))
+        return 0
+    
+    print(order_codec.dumps(order_aggregates.query(dynamodb.Table(table_name), args.since, args.until)))
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
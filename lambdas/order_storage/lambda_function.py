@@ -1,23 +1,35 @@
-import json
-import boto3
 import os
 import logging
+import aws_clients
+import claim_check
+import order_codec
+import order_repository
+import telemetry
+import tracing
 from datetime import datetime
-from decimal import Decimal
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(telemetry.LOG_LEVEL)
 
-dynamodb = boto3.resource('dynamodb')
-sqs = boto3.client('sqs')
+dynamodb = aws_clients.resource('dynamodb')
+sqs = aws_clients.client('sqs')
 
+@telemetry.instrument('order_storage')
 def lambda_handler(event, context):
     """
     Store validated order in DynamoDB and send to SQS for fulfillment
     """
     
+    aws_clients.log_cold_start('order_storage')
+    stage_started = tracing.started()
+    
+    # stored is set once this invocation's own write of the order went through
+    stored = False
+    duplicate = False
+    
     try:
-        logger.info(f"Processing order storage: {json.dumps(event, default=str)}")
+        telemetry.log_payload("Processing order storage", event)
         
         # Get environment variables
         orders_table_name = os.environ.get('ORDERS_TABLE_NAME')
@@ -35,27 +47,32 @@ def lambda_handler(event, context):
         order_data = prepare_order_for_storage(event)
         
         # Convert floats to Decimal for DynamoDB compatibility
-        order_data = convert_floats_to_decimal(order_data)
+        order_data = order_codec.to_dynamo(order_data)
         
         # Store order in DynamoDB
-        logger.info(f"Storing order {order_data['order_id']} in DynamoDB table {orders_table_name}")
+        logger.info("Storing order %s in DynamoDB table %s", order_data['order_id'], orders_table_name)
         
-        response = orders_table.put_item(
-            Item=order_data,
-            ConditionExpression='attribute_not_exists(order_id)'
-        )
+        try:
+            with telemetry.metrics.timer('OrderPutLatency'):
+                order_repository.create_order(orders_table, order_data)
+        except ClientError as e:
+            # Already stored (a retried StoreOrder, or a repeated order_id)
+            duplicate = e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+            raise
+        stored = True
         
-        logger.info(f"Order {order_data['order_id']} stored successfully in DynamoDB")
+        logger.info("Order %s stored successfully in DynamoDB", order_data['order_id'])
         
-        # Send order to SQS queue for fulfillment
-        logger.info(f"Sending order {order_data['order_id']} to SQS queue for fulfillment")
+        # The queue message carries the trace up to the end of this stage
+        tracing.mark(order_data, 'store', stage_started)
         
-        # Convert Decimal back to float for SQS message
-        sqs_message = convert_decimal_to_float(order_data)
+        # Send order to SQS queue for fulfillment
+        logger.info("Sending order %s to SQS queue for fulfillment", order_data['order_id'])
         
+        # Decimals are encoded directly, no float copy of the order is needed
         sqs_response = sqs.send_message(
             QueueUrl=order_queue_url,
-            MessageBody=json.dumps(sqs_message),
+            MessageBody=order_codec.encode_message(order_data),
             MessageAttributes={
                 'order_id': {
                     'StringValue': order_data['order_id'],
@@ -64,11 +81,13 @@ def lambda_handler(event, context):
                 'order_status': {
                     'StringValue': order_data['status'],
                     'DataType': 'String'
-                }
+                },
+                **tracing.message_attributes(order_data)
             }
         )
         
-        logger.info(f"Order {order_data['order_id']} sent to SQS queue. MessageId: {sqs_response['MessageId']}")
+        logger.info("Order %s sent to SQS queue. MessageId: %s", order_data['order_id'], sqs_response['MessageId'])
+        telemetry.metrics.count('OrdersStored')
         
         # Return the stored order data for Step Functions
         return {
@@ -78,24 +97,26 @@ def lambda_handler(event, context):
         }
         
     except Exception as e:
-        logger.error(f"Error storing order: {str(e)}")
-        
-        # Update order status to indicate storage failure
-        error_order = {
-            **event,
-            'status': 'STORAGE_FAILED',
-            'error_message': str(e),
-            'storage_timestamp': datetime.utcnow().isoformat(),
-            'updated_at': datetime.utcnow().isoformat()
-        }
+        logger.error("Error storing order: %s", e)
+        telemetry.metrics.count('StorageFailures')
         
-        # Still try to store the failed order for debugging
+        # Still try to record the failure. A duplicate leaves the existing
+        # order alone; an order this invocation stored but could not queue
+        # is marked failed
         try:
-            if orders_table_name:
-                failed_orders_table = dynamodb.Table(orders_table_name)
-                failed_orders_table.put_item(Item=convert_floats_to_decimal(error_order))
-        except:
-            logger.error("Failed to store error order in DynamoDB")
+            if duplicate:
+                logger.warning("Order %s already exists; leaving it unchanged", event.get('order_id'))
+            elif stored:
+                if not order_repository.record_send_failure(orders_table, order_data, str(e)):
+                    logger.warning("Order %s changed since it was stored; its send failure was not recorded",
+                                   order_data['order_id'])
+            elif orders_table_name and event.get('order_id'):
+                if not order_repository.record_storage_failure(
+                        dynamodb.Table(orders_table_name), order_codec.to_dynamo(event), str(e)):
+                    logger.warning("Order %s is past storage; its storage failure was not recorded",
+                                   event['order_id'])
+        except Exception as record_error:
+            logger.error("Failed to store error order in DynamoDB: %s", record_error)
         
         raise
 
@@ -125,10 +146,9 @@ def prepare_order_for_storage(order_data):
             'version': '1.0'
         }
     
-    # Calculate order summary
-    if 'items' in storage_order:
-        total_items = len(storage_order['items'])
-        total_quantity = sum(item.get('quantity', 0) for item in storage_order['items'])
+    # Calculate order summary; checked-in orders carry it in their reference
+    if 'items' in storage_order or claim_check.is_checked_in(storage_order):
+        total_items, total_quantity = claim_check.item_summary(storage_order)
         
         storage_order['order_summary'] = {
             'total_items': total_items,
@@ -137,29 +157,3 @@ def prepare_order_for_storage(order_data):
         }
     
     return storage_order
-
-def convert_floats_to_decimal(obj):
-    """
-    Convert float values to Decimal for DynamoDB compatibility
-    """
-    if isinstance(obj, list):
-        return [convert_floats_to_decimal(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {key: convert_floats_to_decimal(value) for key, value in obj.items()}
-    elif isinstance(obj, float):
-        return Decimal(str(obj))
-    else:
-        return obj
-
-def convert_decimal_to_float(obj):
-    """
-    Convert Decimal values back to float for JSON serialization
-    """
-    if isinstance(obj, list):
-        return [convert_decimal_to_float(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {key: convert_decimal_to_float(value) for key, value in obj.items()}
-    elif isinstance(obj, Decimal):
-        return float(obj)
-    else:
-        return obj
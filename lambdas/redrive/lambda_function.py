@@ -0,0 +1,483 @@
+"""
+Rate-controlled redrive of the failed_orders table
+
+Streams failed_orders rows with a paginated, optionally parallel-segment
+scan, filtered by status, failure source and failure time, and re-injects
+each row's original order payload:
+
+  FULFILLMENT_FAILED              order row            -> order queue
+  PROCESSING_ERROR                original SQS body    -> order queue
+  DLQ_PROCESSING_FAILED           state machine failure -> state machine
+  DLQ_PROCESSOR_FAILED            order queue message  -> order queue
+
+Queue messages go out with SendMessageBatch. All sends share one token
+bucket (messages per second), and sending pauses while the order queue is
+deeper than max_queue_depth, so a replay cannot swamp fulfillment.
+
+Progress is checkpointed per scan segment after every page. The Lambda
+stops before its timeout and returns the checkpoint; invoke it again with
+{"checkpoint": ...} to resume. The CLI keeps the checkpoint in a file:
+
+    PYTHONPATH=lambdas/shared/python python lambdas/redrive/lambda_function.py \
+        --table dofs-failed-orders-dev --queue-url <order-queue-url> \
+        --status FULFILLMENT_FAILED --since 2024-01-01T00:00:00 --rate 20 \
+        --checkpoint-file redrive.json
+"""
+
+import argparse
+import json
+import os
+import logging
+import threading
+import time
+import uuid
+import aws_clients
+import order_codec
+import telemetry
+import tracing
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+logger.setLevel(telemetry.LOG_LEVEL)
+
+dynamodb = aws_clients.resource('dynamodb')
+sqs = aws_clients.client('sqs')
+stepfunctions = aws_clients.client('stepfunctions')
+
+TARGET_AUTO = 'auto'
+TARGET_QUEUE = 'queue'
+TARGET_STATE_MACHINE = 'state_machine'
+
+REPLAYABLE_STATUSES = ('FULFILLMENT_FAILED', 'PROCESSING_ERROR', 'DLQ_PROCESSING_FAILED', 'DLQ_PROCESSOR_FAILED')
+
+DEFAULT_RATE = float(os.environ.get('REDRIVE_MESSAGES_PER_SECOND', '20'))
+DEFAULT_SEGMENTS = int(os.environ.get('REDRIVE_SEGMENTS', '4'))
+DEFAULT_MAX_QUEUE_DEPTH = int(os.environ.get('REDRIVE_MAX_QUEUE_DEPTH', '1000'))
+
+PAGE_SIZE = 100
+SEND_BATCH_MAX_ENTRIES = 10
+DEPTH_CHECK_SECONDS = 5
+
+# Stop early enough to hand back a checkpoint before the Lambda times out:
+# 30 seconds, or a tenth of the remaining time for short timeouts
+TIME_MARGIN_SECONDS = 30
+
+# Failure bookkeeping on a FULFILLMENT_FAILED row that is not part of the order
+FAILURE_FIELDS = frozenset({
+    'error_message', 'failed_at', 'failed_shard', 'failure_source', 'fulfillment_timestamp',
+    'status_shard', 'updated_at'
+})
+
+cached_state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
+
+@telemetry.instrument('redrive')
+def lambda_handler(event, context):
+    """
+    Redrive failed orders until done or close to the Lambda timeout.
+    The response carries the checkpoint to resume from.
+    """
+    
+    aws_clients.log_cold_start('redrive')
+    
+    options = build_options(event, os.environ)
+    if options['target'] != TARGET_QUEUE:
+        options['state_machine_arn'] = options['state_machine_arn'] or get_state_machine_arn(context)
+    
+    remaining = context.get_remaining_time_in_millis() / 1000.0
+    deadline = time.monotonic() + remaining - min(TIME_MARGIN_SECONDS, remaining / 10)
+    result = Redrive(dynamodb.Table(options['table']), options, event.get('checkpoint'), deadline).run()
+    
+    logger.info("Redrive %s: %s", 'complete' if result['complete'] else 'paused', json.dumps(result['stats']))
+    return result
+
+def build_options(raw, environ):
+    """
+    Redrive options from a Lambda event or CLI arguments, with defaults
+    from the environment. A checkpoint pins the scan filters and segments
+    it was taken with.
+    """
+    checkpoint_options = (raw.get('checkpoint') or {}).get('options', {})
+
+    def pick(name, default=None):
+        if name in checkpoint_options:
+            return checkpoint_options[name]
+        value = raw.get(name)
+        return default if value is None else value
+    
+    options = {
+        'table': raw.get('table') or environ.get('FAILED_ORDERS_TABLE_NAME'),
+        'queue_url': raw.get('queue_url') or environ.get('ORDER_QUEUE_URL'),
+        'state_machine_arn': raw.get('state_machine_arn') or cached_state_machine_arn,
+        'statuses': list(pick('statuses') or REPLAYABLE_STATUSES),
+        'sources': list(pick('sources') or []),
+        'since': pick('since'),
+        'until': pick('until'),
+        'target': pick('target', TARGET_AUTO),
+        'segments': int(pick('segments', DEFAULT_SEGMENTS)),
+        'rate': float(raw.get('rate') or DEFAULT_RATE),
+        'max_queue_depth': int(raw.get('max_queue_depth', DEFAULT_MAX_QUEUE_DEPTH)),
+        'dry_run': bool(raw.get('dry_run', False))
+    }
+    
+    if not options['table']:
+        raise ValueError("FAILED_ORDERS_TABLE_NAME environment variable not set")
+    if not options['queue_url']:
+        raise ValueError("ORDER_QUEUE_URL environment variable not set")
+    if options['target'] not in (TARGET_AUTO, TARGET_QUEUE, TARGET_STATE_MACHINE):
+        raise ValueError(f"Unknown redrive target: {options['target']}")
+    unknown = set(options['statuses']) - set(REPLAYABLE_STATUSES)
+    if unknown:
+        raise ValueError(f"Statuses cannot be redriven: {', '.join(sorted(unknown))}")
+    if options['rate'] <= 0 or options['segments'] < 1:
+        raise ValueError("rate must be positive and segments at least 1")
+    return options
+
+def get_state_machine_arn(context):
+    """
+    Get Step Function ARN from environment or construct it once per container
+    """
+    global cached_state_machine_arn
+    if cached_state_machine_arn is None:
+        project_name = os.environ.get('PROJECT_NAME', 'dofs')
+        environment = os.environ.get('ENVIRONMENT', 'dev')
+        region = os.environ.get('AWS_DEFAULT_REGION', context.invoked_function_arn.split(':')[3])
+        account_id = context.invoked_function_arn.split(':')[4]
+        cached_state_machine_arn = f"arn:aws:states:{region}:{account_id}:stateMachine:{project_name}-order-processor-{environment}"
+    
+    return cached_state_machine_arn
+
+def build_filter(options):
+    """
+    Scan filter for the status, failure source and failure time options.
+    Rows without failed_at fall back to updated_at.
+    """
+    names = {'#status': 'status'}
+    values = {}
+    
+    placeholders = []
+    for index, status in enumerate(options['statuses']):
+        values[f":status{index}"] = status
+        placeholders.append(f":status{index}")
+    clauses = [f"#status IN ({', '.join(placeholders)})"]
+    
+    if options['sources']:
+        names['#source'] = 'failure_source'
+        placeholders = []
+        for index, source in enumerate(options['sources']):
+            values[f":source{index}"] = source
+            placeholders.append(f":source{index}")
+        clauses.append(f"#source IN ({', '.join(placeholders)})")
+    
+    for option, operator in (('since', '>='), ('until', '<=')):
+        if options[option]:
+            names.update({'#failed_at': 'failed_at', '#updated_at': 'updated_at'})
+            values[f":{option}"] = options[option]
+            clauses.append(f"(#failed_at {operator} :{option} OR "
+                           f"(attribute_not_exists(#failed_at) AND #updated_at {operator} :{option}))")
+    
+    return {
+        'FilterExpression': ' AND '.join(clauses),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+def replay_message(row, target=TARGET_AUTO):
+    """
+    (destination, payload) for a failed_orders row, or None when the row
+    holds nothing that can be replayed. payload is an order dict, or the
+    raw message body for records that never parsed.
+    """
+    status = row.get('status')
+    if status == 'FULFILLMENT_FAILED':
+        replay = (TARGET_QUEUE, {key: value for key, value in row.items() if key not in FAILURE_FIELDS})
+    elif status == 'PROCESSING_ERROR':
+        body = (row.get('original_record') or {}).get('body')
+        replay = (TARGET_QUEUE, body) if body else None
+    elif status == 'DLQ_PROCESSOR_FAILED':
+        body = (row.get('original_record') or {}).get('body')
+        replay = from_dlq_message(order_codec.parse_message_body(body)) if body else None
+    else:
+        replay = from_dlq_message(row.get('original_message'))
+    
+    if replay is None or target == TARGET_AUTO:
+        return replay
+    if target == TARGET_STATE_MACHINE and not isinstance(replay[1], dict):
+        return None
+    return (target, replay[1])
+
+def from_dlq_message(message):
+    """
+    State machine failures carry the order that entered the state machine;
+    anything else came from the order queue and is replayed as it was
+    """
+    if isinstance(message, dict) and isinstance(message.get('original_order'), dict):
+        order = {key: value for key, value in message['original_order'].items() if key != 'error'}
+        return (TARGET_STATE_MACHINE, order)
+    if message:
+        return (TARGET_QUEUE, message)
+    return None
+
+class RateLimiter:
+    """
+    Token bucket shared by all segment workers
+    """
+
+    def __init__(self, rate, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(rate, SEND_BATCH_MAX_ENTRIES)
+        self.tokens = 0.0
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+                wait = (count - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Redrive:
+    """
+    One redrive run over all (remaining) scan segments
+    """
+
+    def __init__(self, table, options, checkpoint=None, deadline=None, on_checkpoint=None):
+        self.table = table
+        self.options = options
+        self.deadline = deadline
+        self.on_checkpoint = on_checkpoint
+        self.limiter = RateLimiter(options['rate'])
+        self.scan_filter = build_filter(options)
+        
+        pinned = ('statuses', 'sources', 'since', 'until', 'target', 'segments')
+        self.checkpoint = checkpoint or {
+            'options': {name: options[name] for name in pinned},
+            'segments': {
+                str(segment): {'start_key': None, 'page_sent': [], 'done': False}
+                for segment in range(options['segments'])
+            }
+        }
+        self.stats = {'scanned': 0, 'queued': 0, 'started': 0, 'skipped': 0, 'failed': 0}
+        self._lock = threading.Lock()
+        self._depth = None
+        self._depth_checked = 0.0
+
+    def out_of_time(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def run(self):
+        pending = [int(segment) for segment, state in self.checkpoint['segments'].items() if not state['done']]
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                list(executor.map(self.redrive_segment, pending))
+        
+        metrics = telemetry.metrics
+        metrics.count('RedriveScanned', self.stats['scanned'])
+        metrics.count('RedriveSent', self.stats['queued'] + self.stats['started'])
+        metrics.count('RedriveSkipped', self.stats['skipped'])
+        metrics.count('RedriveFailed', self.stats['failed'])
+        
+        return {
+            'complete': all(state['done'] for state in self.checkpoint['segments'].values()),
+            'stats': dict(self.stats),
+            'checkpoint': self.checkpoint
+        }
+
+    def redrive_segment(self, segment):
+        state = self.checkpoint['segments'][str(segment)]
+        scan_kwargs = {**self.scan_filter, 'Limit': PAGE_SIZE}
+        if self.options['segments'] > 1:
+            scan_kwargs.update({'Segment': segment, 'TotalSegments': self.options['segments']})
+        
+        while not self.out_of_time():
+            if state['start_key']:
+                scan_kwargs['ExclusiveStartKey'] = state['start_key']
+            response = self.table.scan(**scan_kwargs)
+            rows = response.get('Items', [])
+            self.count('scanned', len(rows) - len(state['page_sent']))
+            
+            if not self.send_rows(rows, state):
+                # Out of time mid-page; resume re-reads the page and skips
+                # the rows listed in page_sent
+                return
+            
+            self.save(state, start_key=response.get('LastEvaluatedKey'), page_sent=[],
+                      done='LastEvaluatedKey' not in response)
+            if state['done']:
+                return
+    
+    def save(self, state, sent=(), **changes):
+        with self._lock:
+            state.update(changes)
+            if sent:
+                state['page_sent'] = sorted(set(state['page_sent']).union(sent))
+            if self.on_checkpoint:
+                self.on_checkpoint(self.checkpoint)
+    
+    def send_rows(self, rows, state):
+        """
+        Replay the rows of one page not yet in page_sent; False if the
+        deadline stopped it
+        """
+        already_sent = set(state['page_sent'])
+        queue_batch = []
+        for index, row in enumerate(rows):
+            if index in already_sent:
+                continue
+            replay = replay_message(row, self.options['target'])
+            if replay is None:
+                logger.warning("Nothing to redrive for failed order %s", row.get('order_id'))
+                self.count('skipped')
+                continue
+            
+            destination, payload = replay
+            # The replay's latency is measured from now, under the same trace ID
+            tracing.restart(payload, 'redrive')
+            if destination == TARGET_QUEUE:
+                queue_batch.append((index, row.get('order_id', 'unknown'), payload))
+                if len(queue_batch) == SEND_BATCH_MAX_ENTRIES:
+                    if not self.send_to_queue(queue_batch, state):
+                        return False
+                    queue_batch = []
+            elif not self.start_execution(index, row.get('order_id', 'unknown'), payload, state):
+                return False
+        
+        return self.send_to_queue(queue_batch, state) if queue_batch else True
+    
+    def wait_for_capacity(self, count):
+        """
+        Hold sends while the order queue is backed up, then take tokens
+        """
+        while self.options['max_queue_depth'] and self.queue_depth() > self.options['max_queue_depth']:
+            if self.out_of_time():
+                return False
+            time.sleep(DEPTH_CHECK_SECONDS)
+        if self.out_of_time():
+            return False
+        self.limiter.acquire(count)
+        return True
+
+    def queue_depth(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._depth is None or now - self._depth_checked >= DEPTH_CHECK_SECONDS:
+                response = sqs.get_queue_attributes(
+                    QueueUrl=self.options['queue_url'],
+                    AttributeNames=['ApproximateNumberOfMessages']
+                )
+                self._depth = int(response['Attributes']['ApproximateNumberOfMessages'])
+                self._depth_checked = now
+            return self._depth
+
+    def send_to_queue(self, batch, state):
+        if not self.wait_for_capacity(len(batch)):
+            return False
+        if self.options['dry_run']:
+            self.count('queued', len(batch))
+            self.save(state, sent=[index for index, _, _ in batch])
+            return True
+        
+        entries = [
+            {
+                'Id': str(index),
+                'MessageBody': payload if isinstance(payload, str) else order_codec.encode_message(payload),
+                'MessageAttributes': {
+                    'order_id': {'StringValue': str(order_id), 'DataType': 'String'},
+                    'redrive': {'StringValue': 'true', 'DataType': 'String'},
+                    **tracing.message_attributes(payload)
+                }
+            }
+            for index, (_, order_id, payload) in enumerate(batch)
+        ]
+        try:
+            response = sqs.send_message_batch(QueueUrl=self.options['queue_url'], Entries=entries)
+            failed = response.get('Failed', [])
+        except Exception as e:
+            logger.error("SendMessageBatch failed for %d redriven orders: %s", len(entries), e)
+            failed = [{'Id': entry['Id'], 'Message': str(e)} for entry in entries]
+        
+        for failure in failed:
+            logger.error("Could not redrive order %s: %s", batch[int(failure['Id'])][1], failure.get('Message'))
+        self.count('queued', len(entries) - len(failed))
+        self.count('failed', len(failed))
+        # Failed sends are counted, not retried on resume
+        self.save(state, sent=[index for index, _, _ in batch])
+        return True
+
+    def start_execution(self, index, order_id, order, state):
+        if not self.wait_for_capacity(1):
+            return False
+        if self.options['dry_run']:
+            self.count('started')
+            self.save(state, sent=[index])
+            return True
+        
+        try:
+            stepfunctions.start_execution(
+                stateMachineArn=self.options['state_machine_arn'],
+                name=f"redrive-{order_id}-{uuid.uuid4().hex[:8]}"[:80],
+                input=order_codec.dumps(order)
+            )
+            self.count('started')
+        except Exception as e:
+            logger.error("Could not restart order %s: %s", order_id, e)
+            self.count('failed')
+        self.save(state, sent=[index])
+        return True
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+def main():
+    parser = argparse.ArgumentParser(description='Redrive failed orders at a controlled rate')
+    parser.add_argument('--table', help='failed orders table (default FAILED_ORDERS_TABLE_NAME)')
+    parser.add_argument('--queue-url', help='order queue URL (default ORDER_QUEUE_URL)')
+    parser.add_argument('--state-machine-arn', help='order processing state machine (default STATE_MACHINE_ARN)')
+    parser.add_argument('--status', dest='statuses', action='append', choices=REPLAYABLE_STATUSES,
+                        help='row status to redrive (repeatable, default all)')
+    parser.add_argument('--source', dest='sources', action='append', help='failure_source to redrive (repeatable)')
+    parser.add_argument('--since', help='earliest failed_at, ISO 8601')
+    parser.add_argument('--until', help='latest failed_at, ISO 8601')
+    parser.add_argument('--target', choices=[TARGET_AUTO, TARGET_QUEUE, TARGET_STATE_MACHINE], default=TARGET_AUTO)
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS, help='parallel scan segments')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='messages per second across all segments')
+    parser.add_argument('--max-queue-depth', type=int, default=DEFAULT_MAX_QUEUE_DEPTH,
+                        help='pause while the order queue holds more messages (0 = never)')
+    parser.add_argument('--checkpoint-file', help='resume from and save progress to this file')
+    parser.add_argument('--dry-run', action='store_true', help='scan and count without sending')
+    args = parser.parse_args()
+    
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    
+    raw = vars(args)
+    checkpoint = None
+    if args.checkpoint_file and os.path.exists(args.checkpoint_file):
+        with open(args.checkpoint_file) as f:
+            checkpoint = json.load(f)
+        raw['checkpoint'] = checkpoint
+        logger.info("Resuming from %s", args.checkpoint_file)
+    
+    options = build_options(raw, os.environ)
+    if options['target'] != TARGET_QUEUE and not options['state_machine_arn']:
+        parser.error('--state-machine-arn (or STATE_MACHINE_ARN) is needed unless --target queue')
+
+    def save(state):
+        temporary_path = f"{args.checkpoint_file}.tmp"
+        with open(temporary_path, 'w') as f:
+            f.write(order_codec.dumps(state))
+        os.replace(temporary_path, args.checkpoint_file)
+    
+    result = Redrive(dynamodb.Table(options['table']), options, checkpoint,
+                     on_checkpoint=save if args.checkpoint_file else None).run()
+    print(json.dumps(result['stats']))
+    return 0 if result['complete'] else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,203 @@
+"""
+Shared boto3 bootstrap for the DOFS Lambdas (deployed as a layer)
+
+Clients and resources are created on first use and cached for the life of
+the container, so a handler only pays for the services it actually calls.
+All of them share one session and one tuned botocore Config: TCP
+keep-alive, a connection pool sized for concurrent callers, short
+connect/read timeouts and adaptive retries.
+
+Tunables (environment):
+    CLIENT_CONNECT_TIMEOUT      seconds, default 2
+    CLIENT_READ_TIMEOUT         seconds, default 5
+    CLIENT_MAX_ATTEMPTS         total attempts incl. retries, default 5
+    CLIENT_MAX_POOL_CONNECTIONS per client, default 25
+"""
+
+import time
+
+# Taken when the layer is first imported, i.e. early in the function's init phase
+INIT_STARTED = time.perf_counter()
+
+import json
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger()
+
+REGION = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION')
+
+CONNECT_TIMEOUT = float(os.environ.get('CLIENT_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('CLIENT_READ_TIMEOUT', '5'))
+MAX_ATTEMPTS = int(os.environ.get('CLIENT_MAX_ATTEMPTS', '5'))
+MAX_POOL_CONNECTIONS = int(os.environ.get('CLIENT_MAX_POOL_CONNECTIONS', '25'))
+
+BASE_CONFIG = Config(
+    region_name=REGION,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+    retries={'max_attempts': MAX_ATTEMPTS, 'mode': 'adaptive'},
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True
+)
+
+_session = None
+_cache = {}
+_lock = threading.RLock()
+
+# Seconds spent creating each client/resource, for the cold-start report
+creation_times = {}
+
+def session():
+    """
+    One boto3 session per container, so credentials and the service model
+    loader are resolved once and shared by every client
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session(region_name=REGION)
+    return _session
+
+def _config(overrides):
+    return BASE_CONFIG.merge(Config(**overrides)) if overrides else BASE_CONFIG
+
+def _cache_key(kind, service, overrides):
+    return (kind, service, tuple(sorted((key, repr(value)) for key, value in overrides.items())))
+
+def _create(kind, service, overrides):
+    with _lock:
+        started = time.perf_counter()
+        factory = session().client if kind == 'client' else session().resource
+        instance = factory(service, config=_config(overrides))
+        creation_times[f"{kind}:{service}"] = time.perf_counter() - started
+    return instance
+
+def _get(kind, service, overrides):
+    key = _cache_key(kind, service, overrides)
+    instance = _cache.get(key)
+    if instance is None:
+        with _lock:
+            instance = _cache.get(key)
+            if instance is None:
+                instance = _create(kind, service, overrides)
+                _cache[key] = instance
+    return instance
+
+def get_client(service, **overrides):
+    """
+    Cached low-level client; keyword arguments override the base Config
+    """
+    return _get('client', service, overrides)
+
+def get_resource(service, **overrides):
+    """
+    Cached resource; keyword arguments override the base Config
+    """
+    return _get('resource', service, overrides)
+
+class LazyClient:
+    """
+    Module-level stand-in for a client that is only created on first
+    attribute access, e.g. `sqs = aws_clients.client('sqs')`
+    """
+
+    def __init__(self, kind, service, overrides):
+        self._kind = kind
+        self._service = service
+        self._overrides = overrides
+        self._instance = None
+
+    def _resolve(self):
+        if self._instance is None:
+            self._instance = _get(self._kind, self._service, self._overrides)
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+class LazyResource(LazyClient):
+    """
+    Lazy resource that also caches Table/Queue/... objects by name, since
+    building a resource instance goes through boto3's resource factory.
+
+    boto3 resources are not thread safe. With per_thread, every thread that
+    uses the resource gets its own instance (and Table objects), created on
+    its first call and kept for the life of the thread.
+    """
+
+    def __init__(self, service, overrides, per_thread=False):
+        super().__init__('resource', service, overrides)
+        self._per_thread = per_thread
+        self._local = threading.local()
+        self._shared_children = {}
+
+    def _resolve(self):
+        if not self._per_thread:
+            return super()._resolve()
+        instance = getattr(self._local, 'instance', None)
+        if instance is None:
+            instance = self._local.instance = _create(self._kind, self._service, self._overrides)
+            self._local.children = {}
+        return instance
+
+    def _children(self):
+        return self._local.children if self._per_thread else self._shared_children
+
+    def __getattr__(self, name):
+        attribute = getattr(self._resolve(), name)
+        if name[:1].isupper() and callable(attribute):
+            children = self._children()
+            def cached(identifier, *args, **kwargs):
+                key = (name, identifier) + args
+                if kwargs or key not in children:
+                    instance = attribute(identifier, *args, **kwargs)
+                    if kwargs:
+                        return instance
+                    children[key] = instance
+                return children[key]
+            return cached
+        return attribute
+
+def client(service, **overrides):
+    """
+    Lazy cached client for module-level use
+    """
+    return LazyClient('client', service, overrides)
+
+def resource(service, per_thread=False, **overrides):
+    """
+    Lazy cached resource for module-level use; per_thread for resources
+    used from worker threads
+    """
+    return LazyResource(service, overrides, per_thread)
+
+def warm(*services):
+    """
+    Create clients up front in the init phase instead of on the first request
+    """
+    for service in services:
+        get_client(service)
+
+_cold_start_logged = False
+
+def log_cold_start(handler_name):
+    """
+    Log this container's bootstrap costs once, on its first invocation:
+    time from layer import to first request and per-client creation time
+    """
+    global _cold_start_logged
+    if _cold_start_logged:
+        return
+    _cold_start_logged = True
+    logger.info(json.dumps({
+        'cold_start': True,
+        'function': handler_name,
+        'init_to_first_request_ms': round((time.perf_counter() - INIT_STARTED) * 1000, 2),
+        'client_creation_ms': {name: round(seconds * 1000, 2) for name, seconds in creation_times.items()}
+    }))
@@ -0,0 +1,92 @@
+"""
+Batched DynamoDB puts on behalf of SQS records
+
+Handlers queue the items each SQS message needs written, then write them
+all with BatchWriteItem in chunks of 25. UnprocessedItems are retried with
+jittered exponential backoff. The result is the set of message IDs whose
+items could not be written, ready to report as batchItemFailures.
+"""
+
+import os
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+
+logger = logging.getLogger()
+
+# BatchWriteItem accepts at most 25 put requests per call
+MAX_ITEMS = 25
+MAX_ATTEMPTS = int(os.environ.get('BATCH_WRITE_MAX_ATTEMPTS', '5'))
+BASE_DELAY = 0.05
+
+def queue_write(pending_writes, table_name, item, message_id, key_attribute='order_id'):
+    """
+    Queue an item for the batched write, tracking which messages depend on
+    it. The last write for a key wins, since one BatchWriteItem call may
+    not contain the same key twice.
+    """
+    key = (table_name, item[key_attribute])
+    message_ids = pending_writes[key]['message_ids'] if key in pending_writes else []
+    message_ids.append(message_id)
+    pending_writes[key] = {'item': item, 'message_ids': message_ids, 'key_attribute': key_attribute}
+
+def write_all(dynamodb, pending_writes, max_attempts=None, workers=1):
+    """
+    Write queued items in chunks of 25, up to workers chunks at a time.
+    Returns the set of message IDs whose items could not be written.
+    """
+    writes = list(pending_writes.items())
+    chunks = [dict(writes[start:start + MAX_ITEMS]) for start in range(0, len(writes), MAX_ITEMS)]
+    max_attempts = max_attempts or MAX_ATTEMPTS
+
+    unwritten_message_ids = set()
+    if workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            for unwritten in executor.map(lambda chunk: write_chunk(dynamodb, chunk, max_attempts), chunks):
+                unwritten_message_ids |= unwritten
+    else:
+        for chunk in chunks:
+            unwritten_message_ids |= write_chunk(dynamodb, chunk, max_attempts)
+    return unwritten_message_ids
+
+def write_chunk(dynamodb, chunk, max_attempts):
+    """
+    One BatchWriteItem call plus UnprocessedItems retries
+    """
+    request_items = {}
+    key_attributes = {}
+    for (table_name, _), write in chunk.items():
+        request_items.setdefault(table_name, []).append({'PutRequest': {'Item': write['item']}})
+        key_attributes[table_name] = write['key_attribute']
+
+    attempt = 0
+    while request_items:
+        try:
+            response = dynamodb.batch_write_item(RequestItems=request_items)
+        except Exception as e:
+            logger.error("BatchWriteItem failed for %d items: %s", sum(len(r) for r in request_items.values()), e)
+            break
+
+        request_items = response.get('UnprocessedItems') or {}
+        if not request_items:
+            break
+
+        attempt += 1
+        telemetry.metrics.count('BatchWriteRetries')
+        if attempt >= max_attempts:
+            logger.error("Giving up on %d unprocessed items after %d attempts", sum(len(r) for r in request_items.values()), attempt)
+            break
+
+        # Full jitter so concurrent containers don't retry in lockstep
+        time.sleep(random.uniform(0, BASE_DELAY * (2 ** attempt)))
+
+    # Whatever is left in request_items was never written
+    unwritten_message_ids = set()
+    for table_name, requests in request_items.items():
+        for request in requests:
+            key = (table_name, request['PutRequest']['Item'][key_attributes[table_name]])
+            unwritten_message_ids.update(chunk[key]['message_ids'])
+    return unwritten_message_ids
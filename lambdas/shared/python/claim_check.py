@@ -0,0 +1,183 @@
+"""
+Claim-check storage for large orders
+
+An order whose encoded size exceeds THRESHOLD_BYTES is checked in when the
+API handler receives it. Its line items are written once, gzip-compressed,
+to a blob store. The order that travels through Step Functions, SQS and
+DynamoDB keeps every other field plus a payload_ref:
+
+    {'store': 's3', 'bucket': ..., 'key': 'orders/<order_id>/<sha256>.json.gz',
+     'bytes': <uncompressed size>, 'item_count': n, 'total_quantity': q}
+
+Stages that only need counts read them from the reference. A stage that
+needs the items themselves (the validator) calls check_out, which fetches
+the blob on first use.
+
+Stores (environment):
+    CLAIM_CHECK_BUCKET           S3 bucket; claim checks are off when unset
+    CLAIM_CHECK_DIR              local directory used instead of S3 (tests and
+                                 local runs)
+    CLAIM_CHECK_THRESHOLD_BYTES  encoded order size that triggers a check-in,
+                                 default 65536
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import order_codec
+import telemetry
+
+logger = logging.getLogger()
+
+BUCKET = os.environ.get('CLAIM_CHECK_BUCKET')
+LOCAL_DIR = os.environ.get('CLAIM_CHECK_DIR')
+THRESHOLD_BYTES = int(os.environ.get('CLAIM_CHECK_THRESHOLD_BYTES', '65536'))
+
+REF_FIELD = 'payload_ref'
+ITEMS_FIELD = 'items'
+KEY_PREFIX = 'orders'
+
+# Blobs fetched by this container, so an inline pipeline reads each once
+FETCHED_MAX = 32
+fetched = OrderedDict()
+fetched_lock = threading.Lock()
+
+def s3_client():
+    """
+    Imported on first use, so stages that never touch S3 (the validator
+    with small orders) do not load boto3 at cold start
+    """
+    import aws_clients
+    return aws_clients.get_client('s3')
+
+class S3Store:
+    """
+    Blobs as objects in an S3 bucket
+    """
+
+    def __init__(self, bucket):
+        self.name = 's3'
+        self.bucket = bucket
+
+    def put(self, key, data):
+        s3_client().put_object(Bucket=self.bucket, Key=key, Body=data, ContentEncoding='gzip',
+                               ContentType='application/json')
+        return {'store': self.name, 'bucket': self.bucket, 'key': key}
+
+    def get(self, ref):
+        return s3_client().get_object(Bucket=ref['bucket'], Key=ref['key'])['Body'].read()
+
+class FileStore:
+    """
+    Blobs as files under a local directory, standing in for S3
+    """
+
+    def __init__(self, directory):
+        self.name = 'file'
+        self.directory = directory
+
+    def put(self, key, data):
+        path = os.path.join(self.directory, *key.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a partial blob
+        with open(path + '.tmp', 'wb') as blob:
+            blob.write(data)
+        os.replace(path + '.tmp', path)
+        return {'store': self.name, 'key': key}
+
+    def get(self, ref):
+        with open(os.path.join(self.directory, *ref['key'].split('/')), 'rb') as blob:
+            return blob.read()
+
+def configured_store():
+    if LOCAL_DIR:
+        return FileStore(LOCAL_DIR)
+    if BUCKET:
+        return S3Store(BUCKET)
+    return None
+
+# Replaceable so harnesses can point every stage at one store
+store = configured_store()
+
+def is_checked_in(order):
+    return isinstance(order, dict) and REF_FIELD in order
+
+def check_in(order, encoded_size=None):
+    """
+    The order itself when it is small or claim checks are off, otherwise a
+    copy with its items moved to the blob store and a payload_ref added
+    """
+    if store is None or not isinstance(order, dict) or not isinstance(order.get(ITEMS_FIELD), list):
+        return order
+    if encoded_size is None:
+        encoded_size = len(order_codec.dumps(order, lenient=True).encode('utf-8'))
+    if encoded_size <= THRESHOLD_BYTES:
+        return order
+
+    items = order[ITEMS_FIELD]
+    encoded = order_codec.dumps(items, lenient=True).encode('utf-8')
+    digest = hashlib.sha256(encoded).hexdigest()
+    # Content-addressed, so a retried request rewrites the same object
+    key = f"{KEY_PREFIX}/{order.get('order_id', 'unknown')}/{digest}.json.gz"
+
+    with telemetry.metrics.timer('ClaimCheckPutLatency'):
+        ref = store.put(key, gzip.compress(encoded, compresslevel=6))
+    ref.update({
+        'bytes': len(encoded),
+        'item_count': len(items),
+        'total_quantity': sum(item.get('quantity', 0) for item in items if isinstance(item, dict))
+    })
+    telemetry.metrics.count('ClaimChecksStored')
+    logger.info("Checked in %d items (%d bytes) of order %s as %s", len(items), len(encoded), order.get('order_id'), key)
+
+    slim = {name: value for name, value in order.items() if name != ITEMS_FIELD}
+    slim[REF_FIELD] = ref
+    return slim
+
+def check_out(order):
+    """
+    The order with its items restored from the blob store; orders that were
+    never checked in are returned as they are
+    """
+    if not is_checked_in(order):
+        return order
+    ref = order[REF_FIELD]
+    with fetched_lock:
+        items = fetched.get(ref['key'])
+        if items is not None:
+            fetched.move_to_end(ref['key'])
+    if items is None:
+        with telemetry.metrics.timer('ClaimCheckGetLatency'):
+            data = blob_store(ref).get(ref)
+        # Plain floats, as the Lambda runtime would have passed the items
+        items = json.loads(gzip.decompress(data))
+        telemetry.metrics.count('ClaimChecksFetched')
+        with fetched_lock:
+            fetched[ref['key']] = items
+            while len(fetched) > FETCHED_MAX:
+                fetched.popitem(last=False)
+    full = {name: value for name, value in order.items() if name != REF_FIELD}
+    full[ITEMS_FIELD] = items
+    return full
+
+def blob_store(ref):
+    if store is not None and store.name == ref.get('store'):
+        return store
+    if ref.get('store') == 's3':
+        return S3Store(ref['bucket'])
+    raise ValueError(f"Claim check store {ref.get('store')} is not available")
+
+def item_summary(order):
+    """
+    (item_count, total_quantity) without fetching a checked-in payload
+    """
+    if is_checked_in(order):
+        ref = order[REF_FIELD]
+        return ref.get('item_count', 0), ref.get('total_quantity', 0)
+    items = order.get(ITEMS_FIELD) or []
+    return len(items), sum(item.get('quantity', 0) for item in items if isinstance(item, dict))
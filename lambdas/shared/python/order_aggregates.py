@@ -0,0 +1,304 @@
+"""
+Pre-aggregated order counters, maintained from the DynamoDB streams of the
+orders and failed_orders tables
+
+Every row contributes fixed amounts to a few buckets of the aggregates
+table (aggregate / bucket):
+
+    STATUS / <status>                 orders                 orders rows
+    HOUR / <YYYY-MM-DDTHH>            orders_created         orders, by created_at
+                                      orders_fulfilled,      FULFILLED orders, by
+                                      revenue                fulfillment_timestamp
+                                      orders_failed          failed_orders, by failed_at
+    FAILURE_REASON / <hour>#<reason>  orders_failed          failed_orders, by failed_at
+
+A stream record changes the counters by what its new image contributes
+minus what its old image did, so the table always holds what a full scan
+of both tables would add up to: an order moving from STORED to FULFILLED
+is -1 STORED, +1 FULFILLED and its revenue in the fulfillment hour, and a
+retry that leaves the status alone changes nothing.
+
+The records of a stream batch are coalesced into one delta per bucket and
+written with a single TransactWriteItems of ADD updates, so a batch is
+applied all or nothing. A batch touching more than 100 buckets is split
+into several transactions.
+
+ADD is not idempotent, so each transaction carries a ClientRequestToken
+derived from the stream and the first and last SequenceNumber of its
+chunk. A transaction resent after its response was lost (by botocore's
+retries, or by a Lambda retry of the same records) is ignored by
+DynamoDB instead of counted again. That only holds within DynamoDB's
+10 minute token window and for a chunk that spans the same records: a
+chunk retried later, or split differently after a bisected batch, can
+still be counted twice, which a rebuild from full scans corrects.
+
+Dashboards read the counters with one Query per aggregate, which costs
+O(buckets) however many orders there are.
+
+Tunables (environment):
+    ORDER_AGGREGATES_TABLE_NAME  aggregates table; reads are off when unset
+"""
+
+import os
+import hashlib
+import logging
+import random
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import order_index
+import order_repository
+import telemetry
+
+logger = logging.getLogger()
+
+TABLE_NAME = os.environ.get('ORDER_AGGREGATES_TABLE_NAME')
+
+AGGREGATE_STATUS = 'STATUS'
+AGGREGATE_HOUR = 'HOUR'
+AGGREGATE_FAILURE_REASON = 'FAILURE_REASON'
+
+HOUR_FIELDS = ('orders_created', 'orders_fulfilled', 'revenue', 'orders_failed')
+
+# Failure reasons become bucket keys; keep them short
+MAX_REASON_LENGTH = 100
+
+MAX_TRANSACT_ITEMS = 100
+MAX_ATTEMPTS = 3
+
+# ClientRequestToken is at most 36 characters
+MAX_TOKEN_LENGTH = 36
+
+deserializer = TypeDeserializer()
+
+def is_enabled():
+    return bool(TABLE_NAME)
+
+def source_table(record):
+    """
+    Table name of a stream record, from its eventSourceARN
+    (arn:aws:dynamodb:<region>:<account>:table/<name>/stream/<label>)
+    """
+    return record.get('eventSourceARN', '').partition(':table/')[2].partition('/')[0]
+
+def image(record, name):
+    raw = record.get('dynamodb', {}).get(name)
+    if not raw:
+        return None
+    return {field: deserializer.deserialize(value) for field, value in raw.items()}
+
+def hour_of(timestamp):
+    return str(timestamp or '')[:13] or None
+
+def order_revenue(row):
+    """
+    The validated total of an order, which is kept for claim-checked
+    orders too
+    """
+    total = row.get('calculated_total_amount', row.get('total_amount'))
+    return total if isinstance(total, Decimal) else Decimal(str(total or 0))
+
+def failure_reason(row):
+    """
+    The fulfillment error of a failed order, or where it failed (with the
+    state machine's error type for DLQ rows). Free-form exception text is
+    left out, so the reasons stay a small set.
+    """
+    source = str(row.get('failure_source') or row.get('status') or 'UNKNOWN')
+    if source == 'FULFILLMENT' and row.get('error_message'):
+        return str(row['error_message'])[:MAX_REASON_LENGTH]
+    details = (row.get('original_message') or {}).get('error_details') if isinstance(row.get('original_message'), dict) else None
+    error = details.get('Error') if isinstance(details, dict) else None
+    return f"{source}: {error}"[:MAX_REASON_LENGTH] if error else source
+
+def contributions(failed, row):
+    """
+    {(aggregate, bucket): {field: amount}} that one orders row (or
+    failed_orders row when failed) adds to the counters
+    """
+    result = {}
+    if not row:
+        return result
+
+    if failed:
+        hour = hour_of(row.get('failed_at'))
+        if hour:
+            result[(AGGREGATE_HOUR, hour)] = {'orders_failed': 1}
+            result[(AGGREGATE_FAILURE_REASON, f"{hour}#{failure_reason(row)}")] = {'orders_failed': 1}
+        return result
+
+    status = row.get('status')
+    if status:
+        result[(AGGREGATE_STATUS, str(status))] = {'orders': 1}
+    created_hour = hour_of(row.get('created_at'))
+    if created_hour:
+        result[(AGGREGATE_HOUR, created_hour)] = {'orders_created': 1}
+    if status == order_repository.STATUS_FULFILLED:
+        fulfilled_hour = hour_of(row.get('fulfillment_timestamp')) or created_hour
+        if fulfilled_hour:
+            counters = result.setdefault((AGGREGATE_HOUR, fulfilled_hour), {})
+            counters['orders_fulfilled'] = 1
+            counters['revenue'] = order_revenue(row)
+    return result
+
+def merge(deltas, amounts, sign=1):
+    for bucket, fields in amounts.items():
+        counters = deltas.setdefault(bucket, {})
+        for field, amount in fields.items():
+            counters[field] = counters.get(field, 0) + sign * amount
+    return deltas
+
+def prune(deltas):
+    """
+    Drop the fields, and then the buckets, whose changes cancel out
+    """
+    pruned = {}
+    for bucket, fields in deltas.items():
+        changed = {field: amount for field, amount in fields.items() if amount}
+        if changed:
+            pruned[bucket] = changed
+    return pruned
+
+def record_delta(record, failed_orders_table_name):
+    failed = source_table(record) == failed_orders_table_name
+    delta = merge({}, contributions(failed, image(record, 'NewImage')))
+    return prune(merge(delta, contributions(failed, image(record, 'OldImage')), sign=-1))
+
+def coalesce(records, failed_orders_table_name):
+    """
+    Net change per bucket over a stream batch, as [(index of the first
+    record, index of the last record, deltas)] chunks that each fit one
+    transaction
+    """
+    chunks = []
+    current, start, end = {}, 0, 0
+    for index, record in enumerate(records):
+        delta = record_delta(record, failed_orders_table_name)
+        if not delta:
+            continue
+        if current and len(current.keys() | delta.keys()) > MAX_TRANSACT_ITEMS:
+            chunks.append((start, end, prune(current)))
+            current, start = {}, index
+        merge(current, delta)
+        end = index
+    current = prune(current)
+    if current:
+        chunks.append((start, end, current))
+    return chunks
+
+def request_token(first, last):
+    """
+    ClientRequestToken of the chunk spanning the stream records first to
+    last, the same for every retry of those records
+    """
+    span = '\n'.join((first.get('eventSourceARN', ''), first['dynamodb']['SequenceNumber'],
+                      last['dynamodb']['SequenceNumber']))
+    return hashlib.sha256(span.encode('utf-8')).hexdigest()[:MAX_TOKEN_LENGTH]
+
+def changed_at(record):
+    """
+    When a stream record's change was made, so a resent transaction is
+    identical to the first
+    """
+    created = record.get('dynamodb', {}).get('ApproximateCreationDateTime')
+    if created is None:
+        return datetime.utcnow().isoformat()
+    return datetime.utcfromtimestamp(float(created)).isoformat()
+
+def update_action(table_name, bucket, fields, updated_at):
+    aggregate, key = bucket
+    names = {f"#f{index}": field for index, field in enumerate(fields)}
+    values = {f":f{index}": {'N': str(amount)} for index, amount in enumerate(fields.values())}
+    return {
+        'Update': {
+            'TableName': table_name,
+            'Key': {'aggregate': {'S': aggregate}, 'bucket': {'S': key}},
+            'UpdateExpression': 'ADD ' + ', '.join(f"#f{index} :f{index}" for index in range(len(fields)))
+                                + ' SET updated_at = :updated_at',
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': {**values, ':updated_at': {'S': updated_at}}
+        }
+    }
+
+def apply(client, table_name, deltas, token=None, updated_at=None):
+    """
+    Add one chunk of deltas in a single transaction. Transactions that
+    collide on a bucket with another shard's are retried with jitter.
+    With a token (see request_token) a repeat of a transaction that went
+    through changes nothing; updated_at must then be the same on every
+    repeat.
+    """
+    updated_at = updated_at or datetime.utcnow().isoformat()
+    actions = [update_action(table_name, bucket, fields, updated_at) for bucket, fields in sorted(deltas.items())]
+    request = {'ClientRequestToken': token} if token else {}
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            client.transact_write_items(TransactItems=actions, **request)
+            break
+        except ClientError as e:
+            codes = {reason.get('Code') for reason in e.response.get('CancellationReasons') or []}
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException' \
+                    or not codes & {'TransactionConflict', 'ThrottlingError'} or attempt == MAX_ATTEMPTS:
+                raise
+            telemetry.metrics.count('AggregateTransactionConflicts')
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+    telemetry.metrics.count('AggregateBucketUpdates', len(actions))
+
+def totals(orders_rows, failed_orders_rows):
+    """
+    Counters computed from full table contents, for rebuilds and checks
+    """
+    result = {}
+    for failed, rows in ((False, orders_rows), (True, failed_orders_rows)):
+        for row in rows:
+            merge(result, contributions(failed, row))
+    return prune(result)
+
+def query_all(table, **kwargs):
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get('Items', []))
+        if not response.get('LastEvaluatedKey'):
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def query(table, since=None, until=None):
+    """
+    Dashboard view: current orders per status, and per-hour counters and
+    failure reasons for since <= hour <= until (the last day by default)
+    """
+    until = until or datetime.utcnow().isoformat()
+    since = since or (datetime.fromisoformat(until) - order_index.DEFAULT_WINDOW).isoformat()
+    if since > until:
+        raise ValueError("since must not be after until")
+    if (datetime.fromisoformat(until[:10]) - datetime.fromisoformat(since[:10])).days >= order_index.MAX_QUERY_DAYS:
+        raise ValueError(f"Aggregate window is limited to {order_index.MAX_QUERY_DAYS} days")
+    first_hour, last_hour = hour_of(since), hour_of(until)
+
+    statuses = query_all(table, KeyConditionExpression=Key('aggregate').eq(AGGREGATE_STATUS))
+    hours = query_all(table, KeyConditionExpression=Key('aggregate').eq(AGGREGATE_HOUR)
+                      & Key('bucket').between(first_hour, last_hour))
+    # '$' sorts right after '#', so this takes every reason of the last hour
+    reasons = query_all(table, KeyConditionExpression=Key('aggregate').eq(AGGREGATE_FAILURE_REASON)
+                        & Key('bucket').between(first_hour, f"{last_hour}$"))
+
+    failure_reasons = {}
+    for item in reasons:
+        reason = item['bucket'].partition('#')[2]
+        failure_reasons[reason] = failure_reasons.get(reason, 0) + int(item.get('orders_failed', 0))
+
+    hour_rows = [{'hour': item['bucket'], **{field: item.get(field, 0) for field in HOUR_FIELDS}} for item in hours]
+    return {
+        'since': since,
+        'until': until,
+        'statuses': {item['bucket']: int(item['orders']) for item in statuses if item.get('orders')},
+        'totals': {field: sum(row[field] for row in hour_rows) for field in HOUR_FIELDS},
+        'hours': hour_rows,
+        'failure_reasons': dict(sorted(failure_reasons.items(), key=lambda entry: -entry[1]))
+    }
@@ -0,0 +1,197 @@
+"""
+Write-sharded time indexes on the orders and failed_orders tables
+
+A GSI keyed on status alone puts every in-flight order on a handful of
+partition keys. Instead each row carries a shard key
+
+    <status>#<YYYY-MM-DD>#<bucket>
+
+built from its status, the day of its timestamp and a stable hash bucket
+of its order_id, with the timestamp itself as the range key:
+
+    orders         status_shard / updated_at  (status-shard-updated_at-index)
+    failed_orders  failed_shard / failed_at   (failed-shard-failed_at-index)
+
+Every status change sets updated_at, so orders are listed by when they
+entered their current status, not by when they were created.
+
+A listing walks the days of the requested window newest first. For each
+day it queries every bucket in parallel, newest first, and merges the
+results by timestamp. The opaque cursor records the day and each bucket's
+position, so a page never re-reads or skips rows. The bucket queries run on
+one executor per container; callers pass a per-thread DynamoDB resource
+(aws_clients.resource('dynamodb', per_thread=True)), so each worker thread
+queries through its own Table.
+
+Tunables (environment):
+    ORDER_INDEX_SHARDS       buckets per status and day, default 8. Changing
+                             it strands rows written with the old count.
+    ORDER_QUERY_MAX_DAYS     widest listing window in days, default 31
+"""
+
+import base64
+import heapq
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SHARDS = int(os.environ.get('ORDER_INDEX_SHARDS', '8'))
+MAX_QUERY_DAYS = int(os.environ.get('ORDER_QUERY_MAX_DAYS', '31'))
+
+DEFAULT_WINDOW = timedelta(days=1)
+MAX_PAGE_SIZE = 100
+
+# Created on first use and kept for the life of the container, so worker
+# threads and their resources are reused across requests
+executor = None
+
+class ShardedIndex:
+    """
+    One sharded GSI: shard key attribute plus timestamp range key
+    """
+
+    def __init__(self, index_name, shard_attribute, time_attribute, shards=SHARDS):
+        self.index_name = index_name
+        self.shard_attribute = shard_attribute
+        self.time_attribute = time_attribute
+        self.shards = shards
+
+    def shard_key(self, status, order_id, timestamp):
+        bucket = zlib.crc32(str(order_id).encode('utf-8')) % self.shards
+        return f"{status}#{timestamp[:10]}#{bucket}"
+
+    def query(self, dynamodb, table_name, status, since=None, until=None, limit=50, cursor=None):
+        """
+        One page of rows of table_name with this status and
+        since <= timestamp <= until, newest first. Returns
+        (rows, next_cursor); next_cursor is None on the last page.
+        """
+        global executor
+
+        if cursor:
+            state = decode_cursor(cursor)
+            if (state['status'], state['since'], state['until']) != (status, since or state['since'], until or state['until']):
+                raise ValueError("Cursor does not match the query")
+            since, until = state['since'], state['until']
+        else:
+            until = until or datetime.utcnow().isoformat()
+            since = since or (datetime.fromisoformat(until) - DEFAULT_WINDOW).isoformat()
+            if since > until:
+                raise ValueError("since must not be after until")
+            state = {'status': status, 'since': since, 'until': until, 'day': until[:10], 'positions': {}}
+
+        first_day = datetime.fromisoformat(since[:10])
+        if (datetime.fromisoformat(until[:10]) - first_day).days >= MAX_QUERY_DAYS:
+            raise ValueError(f"Listing window is limited to {MAX_QUERY_DAYS} days")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=SHARDS, thread_name_prefix='order-index')
+
+        rows = []
+        while len(rows) < limit and state['day'] >= since[:10]:
+            rows.extend(self.query_day(dynamodb, table_name, state, since, until, limit - len(rows)))
+            if all(position == 'done' for position in state['positions'].values()) and \
+                    len(state['positions']) == self.shards:
+                # Day exhausted: continue with the previous day
+                state['day'] = (datetime.fromisoformat(state['day']) - timedelta(days=1)).date().isoformat()
+                state['positions'] = {}
+
+        next_cursor = encode_cursor(state) if state['day'] >= since[:10] else None
+        return rows, next_cursor
+
+    def query_day(self, dynamodb, table_name, state, since, until, need):
+        """
+        Query every unfinished bucket of state['day'] for up to need rows
+        and take the newest rows that are certainly in order, updating
+        each bucket's position
+        """
+        buckets = [bucket for bucket in range(self.shards) if state['positions'].get(str(bucket)) != 'done']
+
+        def query_bucket(bucket):
+            kwargs = {
+                'IndexName': self.index_name,
+                'KeyConditionExpression': '#shard = :shard AND #time BETWEEN :since AND :until',
+                'ExpressionAttributeNames': {'#shard': self.shard_attribute, '#time': self.time_attribute},
+                'ExpressionAttributeValues': {
+                    ':shard': f"{state['status']}#{state['day']}#{bucket}",
+                    ':since': since,
+                    ':until': until
+                },
+                'ScanIndexForward': False,
+                'Limit': need
+            }
+            position = state['positions'].get(str(bucket))
+            if position:
+                kwargs['ExclusiveStartKey'] = position
+            return dynamodb.Table(table_name).query(**kwargs)
+
+        responses = dict(zip(buckets, executor.map(query_bucket, buckets)))
+
+        # Rows older than the oldest row read from a bucket that has more
+        # may not be the newest overall yet
+        frontier = max(
+            (self.sort_key(response['Items'][-1]) for response in responses.values()
+             if response.get('LastEvaluatedKey') and response.get('Items')),
+            default=None
+        )
+
+        def tagged(bucket):
+            for item in responses[bucket].get('Items', []):
+                yield self.sort_key(item), bucket, item
+
+        taken = {bucket: 0 for bucket in buckets}
+        rows = []
+        for key, bucket, item in heapq.merge(*(tagged(bucket) for bucket in buckets), reverse=True):
+            if len(rows) == need or (frontier is not None and key < frontier):
+                break
+            rows.append(item)
+            taken[bucket] += 1
+
+        for bucket, response in responses.items():
+            items = response.get('Items', [])
+            if taken[bucket] == len(items):
+                state['positions'][str(bucket)] = response.get('LastEvaluatedKey') or 'done'
+            elif taken[bucket]:
+                state['positions'][str(bucket)] = self.index_key(items[taken[bucket] - 1])
+        return rows
+
+    def sort_key(self, item):
+        return (item.get(self.time_attribute, ''), item.get('order_id', ''))
+
+    def index_key(self, item):
+        return {name: item[name] for name in (self.shard_attribute, self.time_attribute, 'order_id')}
+
+STATUS_INDEX = ShardedIndex('status-shard-updated_at-index', 'status_shard', 'updated_at')
+FAILED_INDEX = ShardedIndex('failed-shard-failed_at-index', 'failed_shard', 'failed_at')
+
+def status_shard(status, order_id, updated_at):
+    return STATUS_INDEX.shard_key(status, order_id, updated_at)
+
+def failed_shard(status, order_id, failed_at):
+    return FAILED_INDEX.shard_key(status, order_id, failed_at)
+
+def list_orders(dynamodb, table_name, status, **kwargs):
+    """
+    Orders with this status updated in the window, newest first
+    """
+    return STATUS_INDEX.query(dynamodb, table_name, status, **kwargs)
+
+def list_failed_orders(dynamodb, table_name, status, **kwargs):
+    """
+    failed_orders rows with this status that failed in the window, newest first
+    """
+    return FAILED_INDEX.query(dynamodb, table_name, status, **kwargs)
+
+def encode_cursor(state):
+    data = zlib.compress(json.dumps(state, separators=(',', ':')).encode('utf-8'))
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(zlib.decompress(base64.urlsafe_b64decode(padded)))
+    except Exception:
+        raise ValueError("Invalid cursor")
@@ -0,0 +1,155 @@
+"""
+In-process runner for the order_processor state machine
+
+Runs the validator and order_storage handlers directly, with the same
+state outputs and failure routing as the Step Functions definition in
+terraform/modules/stepfunctions/main.tf:
+
+    ValidateOrder -> StoreOrder -> SendToQueue -> OrderProcessingComplete
+    any task error (ResultPath $.error) -> SendToDLQ -> OrderProcessingComplete
+
+Used by api_handler when PIPELINE_MODE=inline and by local harnesses.
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import sys
+import traceback
+from datetime import datetime
+
+import order_codec
+import tracing
+
+logger = logging.getLogger()
+
+PIPELINE_MODE_STEPFUNCTIONS = 'stepfunctions'
+PIPELINE_MODE_INLINE = 'inline'
+
+def load_stage_module(stage_name, search_paths):
+    """
+    Import a stage's lambda_function module from the first existing path.
+    Each stage gets its own module name since all handlers share a file name.
+    """
+    for path in search_paths:
+        if os.path.isfile(path):
+            spec = importlib.util.spec_from_file_location(f"pipeline_stage_{stage_name}", path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module
+            spec.loader.exec_module(module)
+            return module
+    raise ImportError(f"Pipeline stage '{stage_name}' not found in: {', '.join(search_paths)}")
+
+def stage_search_paths(handler_dir, stage_name):
+    """
+    Stage locations: bundled into the deployment package under
+    pipeline_stages/, or the sibling Lambda directory in the repository
+    """
+    return [
+        os.path.join(handler_dir, 'pipeline_stages', f"{stage_name}.py"),
+        os.path.join(handler_dir, '..', stage_name, 'lambda_function.py')
+    ]
+
+def state_entered_time():
+    """
+    Timestamp in the format of $$.State.EnteredTime
+    """
+    return datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+
+def task_error(exc):
+    """
+    Shape an exception the way Step Functions reports a failed Lambda task
+    """
+    error_type = type(exc).__name__
+    return {
+        'Error': error_type,
+        'Cause': json.dumps({
+            'errorMessage': str(exc),
+            'errorType': error_type,
+            'stackTrace': traceback.format_tb(exc.__traceback__)
+        })
+    }
+
+class OrderPipeline:
+    """
+    In-process equivalent of the order_processor state machine
+    """
+
+    def __init__(self, validate_handler, store_handler, sqs_client, order_queue_url, dlq_url):
+        self.tasks = (
+            ('ValidateOrder', validate_handler),
+            ('StoreOrder', store_handler),
+        )
+        self.sqs = sqs_client
+        self.order_queue_url = order_queue_url
+        self.dlq_url = dlq_url
+
+    def run(self, order_data, context=None):
+        """
+        Run one order through the pipeline.
+        Returns a dict with 'status' (SUCCEEDED or FAILED), the final
+        'output' state and, on failure, the failing 'state' and 'error'.
+        """
+        state = order_data
+
+        for state_name, handler in self.tasks:
+            try:
+                state = handler(state, context)
+            except Exception as e:
+                error = task_error(e)
+                logger.error("Inline pipeline state %s failed for order %s: %s", state_name, state.get('order_id'), e)
+                failed_state = {**state, 'error': error}
+                dlq_message_id = self.send_to_dlq(failed_state)
+                return {
+                    'status': 'FAILED',
+                    'state': state_name,
+                    'error': error,
+                    'output': failed_state,
+                    'dlq_message_id': dlq_message_id
+                }
+
+        queue_message_id = self.send_to_queue(state)
+
+        return {
+            'status': 'SUCCEEDED',
+            'output': state,
+            'queue_message_id': queue_message_id
+        }
+
+    def send_to_queue(self, state):
+        """
+        SendToQueue: failures are ignored, the order is already stored
+        """
+        try:
+            response = self.sqs.send_message(
+                QueueUrl=self.order_queue_url,
+                MessageBody=order_codec.encode_message({
+                    'order_id': state.get('order_id'),
+                    'status': 'VALIDATED_AND_STORED',
+                    'timestamp': state_entered_time(),
+                    'order_data': state
+                }),
+                MessageAttributes=tracing.message_attributes(state)
+            )
+            return response.get('MessageId')
+        except Exception as e:
+            logger.error("SendToQueue failed for order %s: %s", state.get('order_id'), e)
+            return None
+
+    def send_to_dlq(self, failed_state):
+        """
+        SendToDLQ: route the failed order and its error details to the DLQ
+        """
+        response = self.sqs.send_message(
+            QueueUrl=self.dlq_url,
+            MessageBody=order_codec.encode_message({
+                'order_id': failed_state.get('order_id'),
+                'status': 'FAILED',
+                'error_details': failed_state['error'],
+                'original_order': failed_state,
+                'timestamp': state_entered_time()
+            }, lenient=True),
+            MessageAttributes=tracing.message_attributes(failed_state)
+        )
+        return response.get('MessageId')
@@ -0,0 +1,188 @@
+"""
+Order status writes for the orders table
+
+Orders are created once with a conditional put. Every later change is an
+update_item that sets only the changed attributes. A condition expression
+checks that the order is in a status the new status may follow, so a stale
+or duplicate writer cannot move an order backwards or overwrite a newer
+result:
+
+    RECEIVED -> VALIDATED -> STORED -> FULFILLED
+                                    -> FULFILLMENT_FAILED -> FULFILLED
+                                                          -> FULFILLMENT_FAILED (retry)
+    RECEIVED / VALIDATED -> STORAGE_FAILED
+
+STORED -> STORAGE_FAILED is not in the table: only the order_storage
+invocation that wrote the row may take it (record_send_failure), when its
+queue message could not be sent. The update is guarded on that attempt's
+storage_timestamp, so a duplicate or retried store never fails a live
+order.
+
+Every write also keeps the order's status_shard (see order_index) in step
+with its status. Rejected transitions are counted per container and as a
+metric.
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+import order_index
+import telemetry
+
+logger = logging.getLogger()
+
+STATUS_RECEIVED = 'RECEIVED'
+STATUS_VALIDATED = 'VALIDATED'
+STATUS_STORED = 'STORED'
+STATUS_STORAGE_FAILED = 'STORAGE_FAILED'
+STATUS_FULFILLED = 'FULFILLED'
+STATUS_FULFILLMENT_FAILED = 'FULFILLMENT_FAILED'
+
+ALLOWED_TRANSITIONS = {
+    STATUS_RECEIVED: {STATUS_VALIDATED, STATUS_STORAGE_FAILED},
+    STATUS_VALIDATED: {STATUS_STORED, STATUS_STORAGE_FAILED},
+    STATUS_STORED: {STATUS_FULFILLED, STATUS_FULFILLMENT_FAILED},
+    STATUS_FULFILLMENT_FAILED: {STATUS_FULFILLED, STATUS_FULFILLMENT_FAILED},
+}
+
+# Statuses each target status may be entered from, sorted for stable expressions
+ALLOWED_SOURCES = {
+    target: sorted(source for source, targets in ALLOWED_TRANSITIONS.items() if target in targets)
+    for target in set().union(*ALLOWED_TRANSITIONS.values())
+}
+
+# Rejected transitions seen by this container, keyed "FROM->TO"
+rejected_transitions = {}
+rejected_transitions_lock = threading.Lock()
+
+def create_order(table, order):
+    """
+    First write of an order; fails if the order_id already exists
+    """
+    if 'updated_at' in order:
+        order = {**order, 'status_shard': order_index.status_shard(order['status'], order['order_id'], order['updated_at'])}
+    return table.put_item(
+        Item=order,
+        ConditionExpression='attribute_not_exists(order_id)'
+    )
+
+def record_storage_failure(table, order, error_message):
+    """
+    Record a storage failure: the full order if it was never written,
+    otherwise only the failure attributes, and never over a stored order.
+    Returns whether it was recorded.
+    """
+    now = datetime.utcnow().isoformat()
+    failure = {
+        'error_message': error_message,
+        'storage_timestamp': now
+    }
+    try:
+        create_order(table, {**order, **failure, 'status': STATUS_STORAGE_FAILED, 'updated_at': now})
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+    return transition(table, order['order_id'], STATUS_STORAGE_FAILED, failure)
+
+def record_send_failure(table, order, error_message):
+    """
+    Move an order this invocation stored to STORAGE_FAILED after its queue
+    message could not be sent. Only the row written with the order's
+    storage_timestamp qualifies. Returns whether it was recorded.
+    """
+    return transition(table, order['order_id'], STATUS_STORAGE_FAILED, {'error_message': error_message},
+                      stored_at=order['storage_timestamp'])
+
+def build_transition(order_id, to_status, changes=None, expected_retry_count=None, remove=None, stored_at=None):
+    """
+    update_item arguments for moving an order to to_status, setting only
+    the attributes in changes and dropping the attributes in remove.
+    The new updated_at also moves the order to its new status_shard.
+    stored_at instead moves a STORED order whose storage_timestamp it is
+    (see record_send_failure).
+    """
+    sources = [STATUS_STORED] if stored_at is not None else ALLOWED_SOURCES.get(to_status)
+    if not sources:
+        raise ValueError(f"No transition leads to status {to_status}")
+
+    updated_at = datetime.utcnow().isoformat()
+    attributes = {
+        'status': to_status,
+        'updated_at': updated_at,
+        'status_shard': order_index.status_shard(to_status, order_id, updated_at),
+        **(changes or {})
+    }
+
+    names = {'#status': 'status'}
+    values = {}
+    assignments = []
+    for index, (name, value) in enumerate(attributes.items()):
+        placeholder = '#status' if name == 'status' else f"#a{index}"
+        names[placeholder] = name
+        values[f":a{index}"] = value
+        assignments.append(f"{placeholder} = :a{index}")
+    update_expression = 'SET ' + ', '.join(assignments)
+
+    if remove:
+        removals = []
+        for index, name in enumerate(remove):
+            names[f"#r{index}"] = name
+            removals.append(f"#r{index}")
+        update_expression += ' REMOVE ' + ', '.join(removals)
+
+    source_placeholders = []
+    for index, source in enumerate(sources):
+        values[f":from{index}"] = source
+        source_placeholders.append(f":from{index}")
+    condition = f"#status IN ({', '.join(source_placeholders)})"
+
+    # Only the attempt that stored the order
+    if stored_at is not None:
+        names['#storage_timestamp'] = 'storage_timestamp'
+        values[':stored_at'] = stored_at
+        condition += " AND #storage_timestamp = :stored_at"
+
+    # Guard against stale deliveries of an earlier attempt
+    if expected_retry_count is not None:
+        names['#retry_count'] = 'retry_count'
+        values[':expected_retry_count'] = expected_retry_count
+        if expected_retry_count == 0:
+            condition += " AND (attribute_not_exists(#retry_count) OR #retry_count = :expected_retry_count)"
+        else:
+            condition += " AND #retry_count = :expected_retry_count"
+
+    return {
+        'Key': {'order_id': order_id},
+        'UpdateExpression': update_expression,
+        'ConditionExpression': condition,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+        'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+    }
+
+def transition(table, order_id, to_status, changes=None, expected_retry_count=None, remove=None, stored_at=None):
+    """
+    Move an order to to_status. Returns True when applied and False when
+    the order's current status (or retry_count) does not allow it; other
+    errors are raised.
+    """
+    try:
+        table.update_item(**build_transition(order_id, to_status, changes, expected_retry_count, remove, stored_at))
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        current_status = e.response.get('Item', {}).get('status', {}).get('S', 'MISSING')
+        record_rejection(order_id, current_status, to_status)
+        return False
+
+def record_rejection(order_id, from_status, to_status):
+    key = f"{from_status}->{to_status}"
+    with rejected_transitions_lock:
+        rejected_transitions[key] = rejected_transitions.get(key, 0) + 1
+    telemetry.metrics.count('RejectedTransitions')
+    logger.warning("Rejected status transition %s for order %s", key, order_id)
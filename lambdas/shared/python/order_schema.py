@@ -0,0 +1,254 @@
+"""
+Declarative order schema compiled once per container into a validation plan
+
+The plan validates an order in a single pass over its items, accumulating
+the calculated total as it goes, and can either stop at the first error
+(the validator's historical behaviour) or collect every error at once.
+"""
+
+from decimal import Decimal
+from operator import itemgetter
+
+NUMBER_TYPES = (int, float, Decimal)
+
+_MISSING = object()
+
+# Exact types accepted by the fast path; bool and other subclasses fall
+# back to the isinstance-based checks
+_NUMBER_TYPE_SET = frozenset(NUMBER_TYPES)
+
+# Order of entries defines the order errors are reported in
+ORDER_SCHEMA = {
+    'required': ['order_id', 'customer_name', 'customer_email', 'items'],
+    'fields': [
+        ('customer_email', 'email', "Invalid email format"),
+        ('items', 'non_empty_list', "Items must be a non-empty list"),
+        ('total_amount', 'positive_number', "Total amount must be a positive number"),
+    ],
+    'items': {
+        'field': 'items',
+        'required': ['product_id', 'quantity'],
+        'quantity': 'quantity',
+        'price': ['price', 'unit_price'],
+    }
+}
+
+def _is_email(value):
+    return isinstance(value, str) and '@' in value and '.' in value
+
+def _is_non_empty_list(value):
+    return isinstance(value, list) and len(value) > 0
+
+def _is_positive_number(value):
+    return isinstance(value, NUMBER_TYPES) and value > 0
+
+RULES = {
+    'email': _is_email,
+    'non_empty_list': _is_non_empty_list,
+    'positive_number': _is_positive_number,
+}
+
+def _first_present(fields):
+    """
+    Build a getter returning the first of fields present in a dict,
+    raising KeyError when none is
+    """
+    if len(fields) == 1:
+        return itemgetter(fields[0])
+
+    def get_first(item):
+        for field in fields:
+            if field in item:
+                return item[field]
+        raise KeyError(fields)
+
+    return get_first
+
+class ValidationPlan:
+    """
+    Compiled form of an order schema; build with compile_schema()
+    """
+
+    def __init__(self, required, field_checks, items_field, item_required, quantity_field, price_fields):
+        self.required = tuple(required)
+        self._required_set = frozenset(required)
+        self.field_checks = tuple(field_checks)
+        self.items_field = items_field
+        self.item_required = tuple(item_required)
+        self.quantity_field = quantity_field
+        self.price_fields = tuple(price_fields)
+        self._get_required = itemgetter(*self.item_required)
+        self._get_fallback_price = _first_present(self.price_fields[1:])
+        self.missing_price_message = "missing price field (must have {})".format(
+            ' or '.join(f"'{name}'" for name in self.price_fields)
+        )
+
+    def validate(self, order, collect_all=True):
+        """
+        Validate one order.
+        Returns (errors, calculated_total_amount); the total is None when
+        the items could not be priced.
+        """
+        errors = []
+
+        if not isinstance(order, dict):
+            return ["Order must be an object"], None
+
+        for field in self.required:
+            if field not in order or not order[field]:
+                errors.append(f"Missing or empty required field: {field}")
+                if not collect_all:
+                    return errors, None
+
+        calculated_total = None
+
+        for field, rule, message in self.field_checks:
+            if field not in order or (field in self._required_set and not order[field]):
+                continue
+            if not rule(order[field]):
+                errors.append(message)
+                if not collect_all:
+                    return errors, None
+                continue
+            if field == self.items_field:
+                calculated_total = self._validate_items(order[field], errors, collect_all)
+                if errors and not collect_all:
+                    return errors, None
+
+        return errors, (calculated_total if not errors else None)
+
+    def _validate_items(self, items, errors, collect_all):
+        """
+        Single pass over items: validate each line and accumulate the total.
+        Well-formed lines take a fast path built from C-level operations;
+        the first suspicious line hands over to the detailed checks.
+        """
+        get_required = self._get_required
+        primary_price = self.price_fields[0]
+        get_fallback_price = self._get_fallback_price
+        quantity_field = self.quantity_field
+        number_types = _NUMBER_TYPE_SET
+        total = 0
+
+        for item in items:
+            try:
+                get_required(item)
+                price = item[primary_price] if primary_price in item else get_fallback_price(item)
+                quantity = item[quantity_field]
+            except (KeyError, TypeError):
+                return self._check_items(items, errors, collect_all)
+            if (type(quantity) in number_types and quantity > 0
+                    and type(price) in number_types and price > 0):
+                total += quantity * price
+            else:
+                return self._check_items(items, errors, collect_all)
+
+        return total
+
+    def _check_items(self, items, errors, collect_all):
+        """
+        Detailed per-line checks that report every problem with an item
+        """
+        item_required = self.item_required
+        quantity_field = self.quantity_field
+        price_fields = self.price_fields
+        missing_price_message = self.missing_price_message
+        is_positive = _is_positive_number
+        total = 0
+
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append(f"Item {index} must be an object")
+                if not collect_all:
+                    return None
+                continue
+
+            item_ok = True
+            for field in item_required:
+                if field not in item:
+                    errors.append(f"Item {index} missing required field: {field}")
+                    item_ok = False
+                    if not collect_all:
+                        return None
+
+            price = _MISSING
+            for field in price_fields:
+                if field in item:
+                    price = item[field]
+                    break
+            else:
+                errors.append(f"Item {index} {missing_price_message}")
+                item_ok = False
+                if not collect_all:
+                    return None
+
+            quantity = item.get(quantity_field, _MISSING)
+            if quantity is not _MISSING and not is_positive(quantity):
+                errors.append(f"Item {index} quantity must be a positive number")
+                item_ok = False
+                if not collect_all:
+                    return None
+
+            if price is not _MISSING and not is_positive(price):
+                errors.append(f"Item {index} price must be a positive number")
+                item_ok = False
+                if not collect_all:
+                    return None
+
+            if item_ok:
+                total += quantity * price
+
+        return total
+
+    def validate_many(self, orders, collect_all=True):
+        """
+        Validate a batch of orders with the same compiled plan.
+        Returns one result dict per order, in input order.
+        """
+        results = []
+        for order in orders:
+            errors, calculated_total = self.validate(order, collect_all)
+            results.append({
+                'valid': not errors,
+                'errors': errors,
+                'calculated_total_amount': calculated_total
+            })
+        return results
+
+def compile_schema(schema):
+    """
+    Compile a declarative order schema into a ValidationPlan
+    """
+    field_checks = []
+    for field, rule_name, message in schema['fields']:
+        if rule_name not in RULES:
+            raise ValueError(f"Unknown validation rule '{rule_name}' for field {field}")
+        field_checks.append((field, RULES[rule_name], message))
+
+    item_schema = schema['items']
+    if not any(field == item_schema['field'] for field, _, _ in field_checks):
+        raise ValueError(f"Schema must declare a check for the items field '{item_schema['field']}'")
+
+    return ValidationPlan(
+        required=schema['required'],
+        field_checks=field_checks,
+        items_field=item_schema['field'],
+        item_required=item_schema['required'],
+        quantity_field=item_schema['quantity'],
+        price_fields=item_schema['price']
+    )
+
+# Compiled once at cold start and reused by every invocation
+ORDER_PLAN = compile_schema(ORDER_SCHEMA)
+
+def validate_order(order, collect_all=True):
+    """
+    Validate one order against the default order schema
+    """
+    return ORDER_PLAN.validate(order, collect_all)
+
+def validate_many(orders, collect_all=True):
+    """
+    Validate a batch of orders against the default order schema
+    """
+    return ORDER_PLAN.validate_many(orders, collect_all)
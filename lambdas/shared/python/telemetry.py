@@ -0,0 +1,196 @@
+"""
+Low-overhead logging and CloudWatch Embedded Metric Format (EMF) metrics
+shared by the DOFS Lambdas (deployed as a layer)
+
+Log messages use logging's lazy %-style arguments, so nothing is formatted
+when the level drops them. Full payloads are only logged for a sampled
+fraction of invocations, with personal fields redacted. Counters, gauges
+and timers are collected in memory and written as a single EMF line per
+invocation on stdout, where CloudWatch picks them up. A metric with more
+than the 100 values an EMF document allows is continued on further lines.
+
+Tunables (environment):
+    LOG_LEVEL                 default INFO
+    LOG_PAYLOAD_SAMPLE_RATE   fraction of payloads logged, default 0.01
+    LOG_REDACT_FIELDS         comma-separated keys to mask in payloads
+    METRICS_NAMESPACE         default DOFS
+"""
+
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger()
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))
+
+REDACT_FIELDS = frozenset(
+    field.strip() for field in os.environ.get(
+        'LOG_REDACT_FIELDS',
+        'customer_name,customer_email,shipping_address,billing_address,phone,payment'
+    ).split(',') if field.strip()
+)
+REDACTED = '***'
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DOFS')
+
+# EMF allows at most 100 values per metric in one document; flush splits
+# longer metrics over several documents
+MAX_VALUES_PER_METRIC = 100
+
+def redact(payload):
+    """
+    Copy of payload with REDACT_FIELDS masked at any depth
+    """
+    if isinstance(payload, dict):
+        return {
+            key: REDACTED if key in REDACT_FIELDS else redact(value)
+            for key, value in payload.items()
+        }
+    if isinstance(payload, list):
+        return [redact(item) for item in payload]
+    return payload
+
+def should_sample(rate=None):
+    rate = PAYLOAD_SAMPLE_RATE if rate is None else rate
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+def log_payload(message, payload, level=logging.INFO, rate=None):
+    """
+    Log a redacted JSON payload for a sampled fraction of calls; the
+    payload is only walked and serialized when it is actually logged
+    """
+    if logger.isEnabledFor(level) and should_sample(rate):
+        logger.log(level, '%s: %s', message, json.dumps(redact(payload), default=str))
+
+class Metrics:
+    """
+    Per-invocation metric buffer flushed as EMF documents
+    """
+
+    def __init__(self, namespace=METRICS_NAMESPACE):
+        self.namespace = namespace
+        self.dimensions = {}
+        self.values = {}
+        self.units = {}
+        self._lock = threading.Lock()
+
+    def _add(self, name, value, unit):
+        with self._lock:
+            self.units.setdefault(name, unit)
+            self.values.setdefault(name, []).append(value)
+
+    def count(self, name, value=1):
+        """
+        Add to a counter; counters are summed within the invocation
+        """
+        with self._lock:
+            self.units.setdefault(name, 'Count')
+            values = self.values.setdefault(name, [0])
+            values[0] += value
+
+    def gauge(self, name, value, unit='None'):
+        """
+        Record a value as-is, e.g. a rate or size
+        """
+        self._add(name, value, unit)
+
+    def timer(self, name):
+        """
+        Context manager recording elapsed milliseconds
+        """
+        return _Timer(self, name)
+
+    def set_dimension(self, name, value):
+        self.dimensions[name] = str(value)
+
+    def flush(self):
+        """
+        Print the buffered metrics as EMF lines and reset the buffer.
+        Usually that is one line; a metric with more values than one
+        document takes is spread over as many lines as it needs, with the
+        other metrics in the first. Returns the lines printed.
+        """
+        with self._lock:
+            values, units = self.values, self.units
+            self.values, self.units = {}, {}
+        if not values:
+            return None
+
+        timestamp = int(time.time() * 1000)
+        lines = []
+        for offset in range(0, max(len(metric_values) for metric_values in values.values()), MAX_VALUES_PER_METRIC):
+            chunk = {name: metric_values[offset:offset + MAX_VALUES_PER_METRIC]
+                     for name, metric_values in values.items() if len(metric_values) > offset}
+            document = {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': self.namespace,
+                        'Dimensions': [sorted(self.dimensions)],
+                        'Metrics': [{'Name': name, 'Unit': units[name]} for name in chunk]
+                    }]
+                },
+                **self.dimensions
+            }
+            for name, metric_values in chunk.items():
+                document[name] = metric_values[0] if len(metric_values) == 1 else metric_values
+
+            line = json.dumps(document, separators=(',', ':'))
+            print(line)
+            lines.append(line)
+        return lines
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.gauge(self.name, round((time.perf_counter() - self.started) * 1000, 3), 'Milliseconds')
+
+metrics = Metrics()
+
+_cold_start = True
+_active_handlers = 0
+_active_lock = threading.Lock()
+
+def instrument(function_name, namespace=None):
+    """
+    Handler decorator: tags metrics with FunctionName, records ColdStart
+    and flushes the invocation's metrics once, even when the handler raises.
+    Handlers called in-process by another handler (PIPELINE_MODE=inline)
+    add to the outer invocation's batch instead of flushing their own.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _cold_start, _active_handlers
+            with _active_lock:
+                outermost = _active_handlers == 0
+                _active_handlers += 1
+            if outermost:
+                metrics.namespace = namespace or METRICS_NAMESPACE
+                metrics.set_dimension('FunctionName', os.environ.get('AWS_LAMBDA_FUNCTION_NAME', function_name))
+                if _cold_start:
+                    metrics.count('ColdStart')
+                    _cold_start = False
+            try:
+                return handler(event, context)
+            finally:
+                with _active_lock:
+                    _active_handlers -= 1
+                if outermost:
+                    metrics.flush()
+        return wrapper
+    return decorator
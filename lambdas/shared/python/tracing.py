@@ -0,0 +1,155 @@
+"""
+Per-order trace context and stage latency breakdowns (deployed as a layer)
+
+api_handler starts a trace for every order it accepts. The trace travels
+in the order payload under "trace", so Step Functions passes it between
+tasks and the order queue message carries it in its body (and its ID in a
+trace_id message attribute):
+
+    "trace": {"trace_id": "9f0c...", "marks": [["api", 1718000000123456, 1718000000131789], ...]}
+
+Each stage appends [stage, started_us, ended_us] in epoch microseconds.
+The start comes from the wall clock, which is the only clock the hops
+share; the duration comes from the stage's monotonic clock, so compute
+times are exact and only the waits between hosts carry clock skew. Waits
+that skew makes negative count as zero.
+
+When the order is done (fulfill_order, or the DLQ processor for failed
+orders) finish() turns the marks into latencies, in milliseconds:
+
+    <Stage>ComputeLatency       time inside a stage
+    <Stage>WaitLatency          previous stage's end to this stage's start:
+                                Step Functions transitions, the SQS wait,
+                                retry backoff
+    OrderToFulfillmentLatency   first mark to the end, for fulfilled orders
+    OrderToFailureLatency       the same for orders that failed for good
+
+They are recorded as EMF metric values, which CloudWatch keeps as
+distributions, so every hop has its own p50/p99. A fraction of finished
+traces (PAYLOAD_SAMPLE_RATE, picked by trace ID) is also logged whole.
+"""
+
+import json
+import logging
+import time
+import uuid
+import zlib
+
+import telemetry
+
+logger = logging.getLogger()
+
+FIELD = 'trace'
+
+# Epoch seconds; replaceable so simulations can fast-forward
+clock = time.time
+
+# Finished breakdowns are appended here when set (local harnesses)
+sink = None
+
+def started():
+    """
+    Start of a stage: (epoch microseconds, monotonic seconds)
+    """
+    return int(clock() * 1e6), time.perf_counter()
+
+def start(trace_id=None):
+    """
+    New trace context for an order
+    """
+    return {'trace_id': trace_id or uuid.uuid4().hex, 'marks': []}
+
+def trace_of(payload):
+    trace = payload.get(FIELD) if isinstance(payload, dict) else None
+    if isinstance(trace, dict) and isinstance(trace.get('marks'), list):
+        return trace
+    return None
+
+def message_attributes(payload):
+    """
+    SQS message attributes naming the payload's trace, if it has one
+    """
+    trace = trace_of(payload)
+    if trace is None:
+        return {}
+    return {'trace_id': {'StringValue': str(trace['trace_id']), 'DataType': 'String'}}
+
+def mark(payload, stage, stage_started):
+    """
+    Add a stage that began at stage_started (from started()) and ends now
+    to the payload's trace. The trace is replaced, not changed in place,
+    so an earlier stage's copy of the payload keeps its own marks.
+    """
+    trace = trace_of(payload)
+    if trace is None:
+        return
+    started_us, started_perf = stage_started
+    ended_us = started_us + int((time.perf_counter() - started_perf) * 1e6)
+    payload[FIELD] = {**trace, 'marks': [*trace['marks'], [stage, started_us, ended_us]]}
+
+def restart(payload, stage):
+    """
+    Start a replayed order's trace over with a stage mark at now; the
+    trace ID is kept
+    """
+    trace = trace_of(payload)
+    if trace is None:
+        return
+    now_us = int(clock() * 1e6)
+    payload[FIELD] = {**trace, 'marks': [[stage, now_us, now_us]]}
+
+def sampled(trace_id):
+    """
+    Whether a trace is logged; decided by its ID, so it does not draw on
+    the random module
+    """
+    rate = telemetry.PAYLOAD_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and zlib.crc32(trace_id.encode('utf-8')) / 2 ** 32 < rate)
+
+def metric_prefix(stage):
+    return ''.join(part.title() for part in str(stage).split('_'))
+
+def breakdown(trace):
+    """
+    ([(metric name, milliseconds), ...] in stage order, total milliseconds)
+    """
+    hops = []
+    first = previous_end = None
+    for stage, started_us, ended_us in trace['marks']:
+        started_us, ended_us = int(started_us), int(ended_us)
+        prefix = metric_prefix(stage)
+        if previous_end is None:
+            first = started_us
+        else:
+            hops.append((f"{prefix}WaitLatency", max(0, started_us - previous_end) / 1000))
+        hops.append((f"{prefix}ComputeLatency", (ended_us - started_us) / 1000))
+        previous_end = max(previous_end or ended_us, ended_us)
+    total = (previous_end - first) / 1000 if first is not None else 0.0
+    return hops, total
+
+def finish(payload, outcome):
+    """
+    Record the breakdown of a finished order's trace; outcome is
+    'Fulfillment' or 'Failure'
+    """
+    trace = trace_of(payload)
+    if trace is None or not trace['marks']:
+        return None
+
+    hops, total = breakdown(trace)
+    for name, milliseconds in hops:
+        telemetry.metrics.gauge(name, round(milliseconds, 3), 'Milliseconds')
+    telemetry.metrics.gauge(f"OrderTo{outcome}Latency", round(total, 3), 'Milliseconds')
+
+    result = {
+        'trace_id': str(trace['trace_id']),
+        'order_id': payload.get('order_id'),
+        'outcome': outcome,
+        'total_ms': round(total, 3),
+        'hops': [[name, round(milliseconds, 3)] for name, milliseconds in hops]
+    }
+    if sampled(result['trace_id']):
+        logger.info("Order trace: %s", json.dumps(result))
+    if sink is not None:
+        sink.append(result)
+    return result
@@ -47,12 +47,69 @@ resource "aws_s3_bucket_server_side_encryption_configuration" "lambda_artifacts"
   }
 }
 
+# Claim-check store for the line items of large orders (see claim_check.py)
+resource "aws_s3_bucket" "claim_check" {
+  bucket = "${var.project_name}-claim-check-${var.environment}-${random_string.bucket_suffix.result}"
+}
+
+resource "aws_s3_bucket_server_side_encryption_configuration" "claim_check" {
+  bucket = aws_s3_bucket.claim_check.id
+
+  rule {
+    apply_server_side_encryption_by_default {
+      sse_algorithm = "AES256"
+    }
+  }
+}
+
+resource "aws_s3_bucket_public_access_block" "claim_check" {
+  bucket = aws_s3_bucket.claim_check.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "claim_check" {
+  bucket = aws_s3_bucket.claim_check.id
+
+  rule {
+    id     = "expire-claim-checks"
+    status = "Enabled"
+
+    filter {
+      prefix = "orders/"
+    }
+
+    expiration {
+      days = var.claim_check_retention_days
+    }
+  }
+}
+
 resource "random_string" "bucket_suffix" {
   length  = 8
   special = false
   upper   = false
 }
 
+# Shared Python modules for every Lambda, published as a layer (/opt/python)
+data "archive_file" "shared_layer" {
+  type        = "zip"
+  source_dir  = "${path.module}/../lambdas/shared"
+  output_path = "${path.module}/shared_layer.zip"
+  excludes    = ["python/__pycache__"]
+}
+
+resource "aws_lambda_layer_version" "shared" {
+  layer_name          = "${var.project_name}-shared-${var.environment}"
+  description         = "DOFS shared Python modules"
+  filename            = data.archive_file.shared_layer.output_path
+  source_code_hash    = data.archive_file.shared_layer.output_base64sha256
+  compatible_runtimes = [var.lambda_runtime]
+}
+
 # DynamoDB Module
 module "dynamodb" {
   source = "./modules/dynamodb"
@@ -65,11 +122,17 @@ module "dynamodb" {
 module "sqs" {
   source = "./modules/sqs"
   
-  project_name               = var.project_name
-  environment                = var.environment
-  visibility_timeout_seconds = var.visibility_timeout_seconds
-  max_receive_count          = var.max_receive_count
-  failed_orders_table_name   = module.dynamodb.failed_orders_table_name
+  project_name                = var.project_name
+  environment                 = var.environment
+  visibility_timeout_seconds  = var.visibility_timeout_seconds
+  max_receive_count           = var.max_receive_count
+  failed_orders_table_name    = module.dynamodb.failed_orders_table_name
+  shared_layer_arn            = aws_lambda_layer_version.shared.arn
+  log_level                   = var.log_level
+  dlq_batch_size              = var.dlq_batch_size
+  dlq_batching_window_seconds = var.dlq_batching_window_seconds
+  dlq_max_concurrency         = var.dlq_max_concurrency
+  dlq_write_workers           = var.dlq_write_workers
 }
 
 # Lambda Module
@@ -82,13 +145,57 @@ module "lambdas" {
   lambda_timeout      = var.lambda_timeout
   lambda_memory_size  = var.lambda_memory_size
 
+  fulfillment_batch_size              = var.fulfillment_batch_size
+  fulfillment_batching_window_seconds = var.fulfillment_batching_window_seconds
+  fulfillment_concurrency             = var.fulfillment_concurrency
+  aggregates_batch_size               = var.aggregates_batch_size
+  aggregates_batching_window_seconds  = var.aggregates_batching_window_seconds
+  aggregates_max_retry_attempts       = var.aggregates_max_retry_attempts
+  batch_write_max_attempts            = var.batch_write_max_attempts
+  batch_max_orders                    = var.batch_max_orders
+  batch_max_workers                   = var.batch_max_workers
+  visibility_timeout_seconds          = var.visibility_timeout_seconds
+  pipeline_mode                       = var.pipeline_mode
+  admission_client_rate               = var.admission_client_rate
+  admission_client_burst              = var.admission_client_burst
+  admission_max_queue_depth           = var.admission_max_queue_depth
+  admission_max_dlq_growth            = var.admission_max_dlq_growth
+  idempotency_key_ttl_seconds         = var.idempotency_key_ttl_seconds
+  order_cache_ttl_seconds             = var.order_cache_ttl_seconds
+  claim_check_threshold_bytes         = var.claim_check_threshold_bytes
+  inventory_reservations_enabled      = var.inventory_reservations_enabled
+  inventory_hot_skus                  = var.inventory_hot_skus
+  inventory_hot_sku_shards            = var.inventory_hot_sku_shards
+  inventory_cache_ttl_seconds         = var.inventory_cache_ttl_seconds
+  order_message_format                = var.order_message_format
+  fulfillment_max_retries             = var.fulfillment_max_retries
+  fulfillment_retry_base_seconds      = var.fulfillment_retry_base_seconds
+  fulfillment_retry_max_delay_seconds = var.fulfillment_retry_max_delay_seconds
+  retry_sweep_schedule                = var.retry_sweep_schedule
+  redrive_messages_per_second         = var.redrive_messages_per_second
+  redrive_segments                    = var.redrive_segments
+  redrive_max_queue_depth             = var.redrive_max_queue_depth
+  redrive_timeout                     = var.redrive_timeout
+  log_level                           = var.log_level
+  log_payload_sample_rate             = var.log_payload_sample_rate
+
   # Required dependencies
-  orders_table_name        = module.dynamodb.orders_table_name
-  failed_orders_table_name = module.dynamodb.failed_orders_table_name
-  lambda_artifacts_bucket  = aws_s3_bucket.lambda_artifacts.bucket
-  order_queue_url          = module.sqs.order_queue_url
-  order_queue_arn          = module.sqs.order_queue_arn
-  dlq_arn                  = module.sqs.dlq_arn
+  orders_table_name              = module.dynamodb.orders_table_name
+  failed_orders_table_name       = module.dynamodb.failed_orders_table_name
+  fulfillment_ledger_table_name  = module.dynamodb.fulfillment_ledger_table_name
+  inventory_table_name           = module.dynamodb.inventory_table_name
+  order_idempotency_table_name   = module.dynamodb.order_idempotency_table_name
+  order_aggregates_table_name    = module.dynamodb.order_aggregates_table_name
+  orders_table_stream_arn        = module.dynamodb.orders_table_stream_arn
+  failed_orders_table_stream_arn = module.dynamodb.failed_orders_table_stream_arn
+  lambda_artifacts_bucket        = aws_s3_bucket.lambda_artifacts.bucket
+  claim_check_bucket             = aws_s3_bucket.claim_check.bucket
+  order_queue_url                = module.sqs.order_queue_url
+  order_queue_arn                = module.sqs.order_queue_arn
+  dlq_url                        = module.sqs.dlq_url
+  dlq_arn                        = module.sqs.dlq_arn
+  aggregates_failure_queue_arn   = module.sqs.aggregates_failure_queue_arn
+  shared_layer_arn               = aws_lambda_layer_version.shared.arn
 }
 
 # Step Functions Module
@@ -86,10 +86,183 @@ resource "aws_api_gateway_integration_response" "order_options_integration_respo
   }
 }
 
+# Bulk order submission: POST /orders/batch
+resource "aws_api_gateway_resource" "orders_resource" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  parent_id   = aws_api_gateway_rest_api.dofs_api.root_resource_id
+  path_part   = "orders"
+}
+
+resource "aws_api_gateway_resource" "orders_batch_resource" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  parent_id   = aws_api_gateway_resource.orders_resource.id
+  path_part   = "batch"
+}
+
+resource "aws_api_gateway_method" "orders_batch_post" {
+  rest_api_id   = aws_api_gateway_rest_api.dofs_api.id
+  resource_id   = aws_api_gateway_resource.orders_batch_resource.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_method" "orders_batch_options" {
+  rest_api_id   = aws_api_gateway_rest_api.dofs_api.id
+  resource_id   = aws_api_gateway_resource.orders_batch_resource.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "orders_batch_post_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.orders_batch_resource.id
+  http_method = aws_api_gateway_method.orders_batch_post.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = var.api_handler_lambda_arn
+}
+
+resource "aws_api_gateway_integration" "orders_batch_options_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.orders_batch_resource.id
+  http_method = aws_api_gateway_method.orders_batch_options.http_method
+
+  type = "MOCK"
+  request_templates = {
+    "application/json" = "{\"statusCode\": 200}"
+  }
+}
+
+resource "aws_api_gateway_method_response" "orders_batch_options_200" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.orders_batch_resource.id
+  http_method = aws_api_gateway_method.orders_batch_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "orders_batch_options_integration_response" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.orders_batch_resource.id
+  http_method = aws_api_gateway_method.orders_batch_options.http_method
+  status_code = aws_api_gateway_method_response.orders_batch_options_200.status_code
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'"
+    "method.response.header.Access-Control-Allow-Methods" = "'POST,OPTIONS'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+}
+
+# Order listing: GET /orders and GET /orders/failed
+resource "aws_api_gateway_method" "orders_get" {
+  rest_api_id   = aws_api_gateway_rest_api.dofs_api.id
+  resource_id   = aws_api_gateway_resource.orders_resource.id
+  http_method   = "GET"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "orders_get_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.orders_resource.id
+  http_method = aws_api_gateway_method.orders_get.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = var.api_handler_lambda_arn
+}
+
+resource "aws_api_gateway_resource" "orders_failed_resource" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  parent_id   = aws_api_gateway_resource.orders_resource.id
+  path_part   = "failed"
+}
+
+resource "aws_api_gateway_method" "orders_failed_get" {
+  rest_api_id   = aws_api_gateway_rest_api.dofs_api.id
+  resource_id   = aws_api_gateway_resource.orders_failed_resource.id
+  http_method   = "GET"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "orders_failed_get_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.orders_failed_resource.id
+  http_method = aws_api_gateway_method.orders_failed_get.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = var.api_handler_lambda_arn
+}
+
+# Dashboard counters: GET /orders/stats
+resource "aws_api_gateway_resource" "orders_stats_resource" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  parent_id   = aws_api_gateway_resource.orders_resource.id
+  path_part   = "stats"
+}
+
+resource "aws_api_gateway_method" "orders_stats_get" {
+  rest_api_id   = aws_api_gateway_rest_api.dofs_api.id
+  resource_id   = aws_api_gateway_resource.orders_stats_resource.id
+  http_method   = "GET"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "orders_stats_get_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.orders_stats_resource.id
+  http_method = aws_api_gateway_method.orders_stats_get.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = var.api_handler_lambda_arn
+}
+
+# Order lookup: GET /orders/{order_id}
+resource "aws_api_gateway_resource" "order_id_resource" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  parent_id   = aws_api_gateway_resource.orders_resource.id
+  path_part   = "{order_id}"
+}
+
+resource "aws_api_gateway_method" "order_id_get" {
+  rest_api_id   = aws_api_gateway_rest_api.dofs_api.id
+  resource_id   = aws_api_gateway_resource.order_id_resource.id
+  http_method   = "GET"
+  authorization = "NONE"
+
+  request_parameters = {
+    "method.request.path.order_id" = true
+  }
+}
+
+resource "aws_api_gateway_integration" "order_id_get_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dofs_api.id
+  resource_id = aws_api_gateway_resource.order_id_resource.id
+  http_method = aws_api_gateway_method.order_id_get.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = var.api_handler_lambda_arn
+}
+
 resource "aws_api_gateway_deployment" "dofs_api_deployment" {
   depends_on = [
     aws_api_gateway_integration.order_post_integration,
     aws_api_gateway_integration.order_options_integration,
+    aws_api_gateway_integration.orders_batch_post_integration,
+    aws_api_gateway_integration.orders_batch_options_integration,
+    aws_api_gateway_integration.orders_get_integration,
+    aws_api_gateway_integration.orders_failed_get_integration,
+    aws_api_gateway_integration.orders_stats_get_integration,
+    aws_api_gateway_integration.order_id_get_integration,
   ]
 
   rest_api_id = aws_api_gateway_rest_api.dofs_api.id
@@ -101,6 +274,22 @@ resource "aws_api_gateway_deployment" "dofs_api_deployment" {
       aws_api_gateway_method.order_options.id,
       aws_api_gateway_integration.order_post_integration.id,
       aws_api_gateway_integration.order_options_integration.id,
+      aws_api_gateway_resource.orders_batch_resource.id,
+      aws_api_gateway_method.orders_batch_post.id,
+      aws_api_gateway_method.orders_batch_options.id,
+      aws_api_gateway_integration.orders_batch_post_integration.id,
+      aws_api_gateway_integration.orders_batch_options_integration.id,
+      aws_api_gateway_method.orders_get.id,
+      aws_api_gateway_integration.orders_get_integration.id,
+      aws_api_gateway_resource.orders_failed_resource.id,
+      aws_api_gateway_method.orders_failed_get.id,
+      aws_api_gateway_integration.orders_failed_get_integration.id,
+      aws_api_gateway_resource.orders_stats_resource.id,
+      aws_api_gateway_method.orders_stats_get.id,
+      aws_api_gateway_integration.orders_stats_get_integration.id,
+      aws_api_gateway_resource.order_id_resource.id,
+      aws_api_gateway_method.order_id_get.id,
+      aws_api_gateway_integration.order_id_get_integration.id,
     ]))
   }
 
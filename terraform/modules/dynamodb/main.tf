@@ -3,25 +3,48 @@ resource "aws_dynamodb_table" "orders" {
   billing_mode   = "PAY_PER_REQUEST"
   hash_key       = "order_id"
 
+  # Read by the order_aggregates Lambda
+  stream_enabled   = true
+  stream_view_type = "NEW_AND_OLD_IMAGES"
+
   attribute {
     name = "order_id"
     type = "S"
   }
 
   attribute {
-    name = "status"
+    name = "status_shard"
+    type = "S"
+  }
+
+  attribute {
+    name = "updated_at"
     type = "S"
   }
 
   attribute {
-    name = "created_at"
+    name = "retry_shard"
     type = "S"
   }
 
+  attribute {
+    name = "retry_sweep_at"
+    type = "N"
+  }
+
+  # Write-sharded listing index: status#day#bucket, see order_index.py
+  global_secondary_index {
+    name      = "status-shard-updated_at-index"
+    hash_key  = "status_shard"
+    range_key = "updated_at"
+    projection_type = "ALL"
+  }
+
+  # Sparse index of scheduled fulfillment retries, swept by fulfill_order
   global_secondary_index {
-    name     = "status-created_at-index"
-    hash_key = "status"
-    range_key = "created_at"
+    name      = "retry-sweep-index"
+    hash_key  = "retry_shard"
+    range_key = "retry_sweep_at"
     projection_type = "ALL"
   }
 
@@ -44,19 +67,29 @@ resource "aws_dynamodb_table" "failed_orders" {
   billing_mode   = "PAY_PER_REQUEST"
   hash_key       = "order_id"
 
+  # Read by the order_aggregates Lambda
+  stream_enabled   = true
+  stream_view_type = "NEW_AND_OLD_IMAGES"
+
   attribute {
     name = "order_id"
     type = "S"
   }
 
+  attribute {
+    name = "failed_shard"
+    type = "S"
+  }
+
   attribute {
     name = "failed_at"
     type = "S"
   }
 
   global_secondary_index {
-    name      = "failed_at-index"
-    hash_key  = "failed_at"
+    name      = "failed-shard-failed_at-index"
+    hash_key  = "failed_shard"
+    range_key = "failed_at"
     projection_type = "ALL"
   }
 
@@ -72,4 +105,114 @@ resource "aws_dynamodb_table" "failed_orders" {
   server_side_encryption {
     enabled = true
   }
-}
\ No newline at end of file
+}
+
+# Idempotency ledger for fulfillment attempts (order_id + processing version)
+resource "aws_dynamodb_table" "fulfillment_ledger" {
+  name           = "${var.project_name}-fulfillment-ledger-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "idempotency_key"
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-fulfillment-ledger-${var.environment}"
+    Environment = var.environment
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+}
+
+# Idempotency keys of order submissions (hashed Idempotency-Key header or
+# client order_id) with the response to replay
+resource "aws_dynamodb_table" "order_idempotency" {
+  name           = "${var.project_name}-order-idempotency-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "idempotency_key"
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-order-idempotency-${var.environment}"
+    Environment = var.environment
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+}
+
+# Stock rows (stock_key = product_id, or product_id#shard for hot SKUs) and
+# reservation markers (stock_key = RESERVATION#order_id#version#chunk)
+resource "aws_dynamodb_table" "inventory" {
+  name           = "${var.project_name}-inventory-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "stock_key"
+
+  attribute {
+    name = "stock_key"
+    type = "S"
+  }
+
+  # Only reservation markers carry expires_at
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-inventory-${var.environment}"
+    Environment = var.environment
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+}
+
+# Order counters maintained from the orders and failed_orders streams:
+# aggregate = STATUS / HOUR / FAILURE_REASON, bucket = status, hour or
+# hour#reason (see order_aggregates.py)
+resource "aws_dynamodb_table" "order_aggregates" {
+  name           = "${var.project_name}-order-aggregates-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "aggregate"
+  range_key      = "bucket"
+
+  attribute {
+    name = "aggregate"
+    type = "S"
+  }
+
+  attribute {
+    name = "bucket"
+    type = "S"
+  }
+
+  tags = {
+    Name        = "${var.project_name}-order-aggregates-${var.environment}"
+    Environment = var.environment
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+}
@@ -17,3 +17,33 @@ output "failed_orders_table_arn" {
   description = "Failed orders table ARN"
   value       = aws_dynamodb_table.failed_orders.arn
 }
+
+output "fulfillment_ledger_table_name" {
+  description = "Fulfillment idempotency ledger table name"
+  value       = aws_dynamodb_table.fulfillment_ledger.name
+}
+
+output "order_idempotency_table_name" {
+  description = "Order submission idempotency key table name"
+  value       = aws_dynamodb_table.order_idempotency.name
+}
+
+output "inventory_table_name" {
+  description = "Inventory table name (stock rows and reservation markers)"
+  value       = aws_dynamodb_table.inventory.name
+}
+
+output "orders_table_stream_arn" {
+  description = "Orders table stream ARN"
+  value       = aws_dynamodb_table.orders.stream_arn
+}
+
+output "failed_orders_table_stream_arn" {
+  description = "Failed orders table stream ARN"
+  value       = aws_dynamodb_table.failed_orders.stream_arn
+}
+
+output "order_aggregates_table_name" {
+  description = "Order aggregates table name (counters by status, hour and failure reason)"
+  value       = aws_dynamodb_table.order_aggregates.name
+}
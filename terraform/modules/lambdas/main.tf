@@ -31,21 +31,43 @@ data "aws_iam_policy_document" "lambda_policy" {
       "dynamodb:GetItem",
       "dynamodb:PutItem",
       "dynamodb:UpdateItem",
+      "dynamodb:DeleteItem",
       "dynamodb:Query",
       "dynamodb:Scan",
       "dynamodb:BatchWriteItem",
       "dynamodb:BatchGetItem",
+      "dynamodb:TransactWriteItems",
       "dynamodb:DescribeTable"
     ]
     
     resources = [
       "arn:aws:dynamodb:*:*:table/${var.orders_table_name}",
       "arn:aws:dynamodb:*:*:table/${var.failed_orders_table_name}",
+      "arn:aws:dynamodb:*:*:table/${var.fulfillment_ledger_table_name}",
+      "arn:aws:dynamodb:*:*:table/${var.inventory_table_name}",
+      "arn:aws:dynamodb:*:*:table/${var.order_idempotency_table_name}",
+      "arn:aws:dynamodb:*:*:table/${var.order_aggregates_table_name}",
       "arn:aws:dynamodb:*:*:table/${var.orders_table_name}/index/*",
       "arn:aws:dynamodb:*:*:table/${var.failed_orders_table_name}/index/*"
     ]
   }
 
+  statement {
+    effect = "Allow"
+    
+    actions = [
+      "dynamodb:DescribeStream",
+      "dynamodb:GetRecords",
+      "dynamodb:GetShardIterator",
+      "dynamodb:ListStreams"
+    ]
+    
+    resources = [
+      var.orders_table_stream_arn,
+      var.failed_orders_table_stream_arn
+    ]
+  }
+
   statement {
     effect = "Allow"
     
@@ -58,7 +80,21 @@ data "aws_iam_policy_document" "lambda_policy" {
     
     resources = [
       var.order_queue_arn,
-      var.dlq_arn
+      var.dlq_arn,
+      var.aggregates_failure_queue_arn
+    ]
+  }
+
+  statement {
+    effect = "Allow"
+    
+    actions = [
+      "s3:PutObject",
+      "s3:GetObject"
+    ]
+    
+    resources = [
+      "arn:aws:s3:::${var.claim_check_bucket}/orders/*"
     ]
   }
 
@@ -99,14 +135,38 @@ resource "aws_lambda_function" "api_handler" {
   runtime       = var.lambda_runtime
   timeout       = var.lambda_timeout
   memory_size   = var.lambda_memory_size
+  layers        = [var.shared_layer_arn]
 
   s3_bucket = var.lambda_artifacts_bucket
   s3_key    = "api_handler/deployment.zip"
 
   environment {
     variables = {
+      LOG_LEVEL = var.log_level
+      LOG_PAYLOAD_SAMPLE_RATE = var.log_payload_sample_rate
+      ORDER_MESSAGE_FORMAT = var.order_message_format
       ENVIRONMENT = var.environment
       PROJECT_NAME = var.project_name
+      BATCH_MAX_ORDERS = var.batch_max_orders
+      BATCH_MAX_WORKERS = var.batch_max_workers
+      PIPELINE_MODE = var.pipeline_mode
+      ORDER_CACHE_TTL_SECONDS = var.order_cache_ttl_seconds
+      ADMISSION_CLIENT_RATE = var.admission_client_rate
+      ADMISSION_CLIENT_BURST = var.admission_client_burst
+      ADMISSION_MAX_QUEUE_DEPTH = var.admission_max_queue_depth
+      ADMISSION_MAX_DLQ_GROWTH = var.admission_max_dlq_growth
+      IDEMPOTENCY_TABLE_NAME = var.order_idempotency_table_name
+      IDEMPOTENCY_KEY_TTL_SECONDS = var.idempotency_key_ttl_seconds
+      ORDER_AGGREGATES_TABLE_NAME = var.order_aggregates_table_name
+      CLAIM_CHECK_BUCKET = var.claim_check_bucket
+      CLAIM_CHECK_THRESHOLD_BYTES = var.claim_check_threshold_bytes
+      # Read by order listings and lookups, by admission control (queue
+      # depths) and by the in-process validator/order_storage stages when
+      # PIPELINE_MODE=inline
+      ORDERS_TABLE_NAME = var.orders_table_name
+      FAILED_ORDERS_TABLE_NAME = var.failed_orders_table_name
+      ORDER_QUEUE_URL = var.order_queue_url
+      DLQ_URL = var.dlq_url
     }
   }
 
@@ -121,13 +181,18 @@ resource "aws_lambda_function" "validator" {
   runtime       = var.lambda_runtime
   timeout       = var.lambda_timeout
   memory_size   = var.lambda_memory_size
+  layers        = [var.shared_layer_arn]
 
   s3_bucket = var.lambda_artifacts_bucket
   s3_key    = "validator/deployment.zip"
 
   environment {
     variables = {
+      LOG_LEVEL = var.log_level
+      LOG_PAYLOAD_SAMPLE_RATE = var.log_payload_sample_rate
       ENVIRONMENT = var.environment
+      # Items of claim-checked orders are fetched from here for validation
+      CLAIM_CHECK_BUCKET = var.claim_check_bucket
     }
   }
 
@@ -148,12 +213,16 @@ resource "aws_lambda_function" "order_storage" {
   runtime       = var.lambda_runtime
   timeout       = var.lambda_timeout
   memory_size   = var.lambda_memory_size
+  layers        = [var.shared_layer_arn]
 
   s3_bucket = var.lambda_artifacts_bucket
   s3_key    = "order_storage/deployment.zip"
 
   environment {
     variables = {
+      LOG_LEVEL = var.log_level
+      LOG_PAYLOAD_SAMPLE_RATE = var.log_payload_sample_rate
+      ORDER_MESSAGE_FORMAT = var.order_message_format
       ORDERS_TABLE_NAME = var.orders_table_name
       ORDER_QUEUE_URL = var.order_queue_url
       ENVIRONMENT = var.environment
@@ -174,27 +243,176 @@ resource "aws_lambda_function" "fulfill_order" {
   runtime       = var.lambda_runtime
   timeout       = var.lambda_timeout
   memory_size   = var.lambda_memory_size
+  layers        = [var.shared_layer_arn]
 
   s3_bucket = var.lambda_artifacts_bucket
   s3_key    = "fulfill_order/deployment.zip"
 
   environment {
     variables = {
+      LOG_LEVEL = var.log_level
+      LOG_PAYLOAD_SAMPLE_RATE = var.log_payload_sample_rate
+      ORDER_MESSAGE_FORMAT = var.order_message_format
       ORDERS_TABLE_NAME = var.orders_table_name
       FAILED_ORDERS_TABLE_NAME = var.failed_orders_table_name
       ENVIRONMENT = var.environment
+      BATCH_WRITE_MAX_ATTEMPTS = var.batch_write_max_attempts
+      FULFILLMENT_LEDGER_TABLE_NAME = var.fulfillment_ledger_table_name
+      FULFILLMENT_CONCURRENCY = var.fulfillment_concurrency
+      IDEMPOTENCY_LEASE_SECONDS = var.visibility_timeout_seconds
+      ORDER_QUEUE_URL = var.order_queue_url
+      FULFILLMENT_MAX_RETRIES = var.fulfillment_max_retries
+      FULFILLMENT_RETRY_BASE_SECONDS = var.fulfillment_retry_base_seconds
+      FULFILLMENT_RETRY_MAX_DELAY_SECONDS = var.fulfillment_retry_max_delay_seconds
+      # Reservations are off while the table name is empty
+      INVENTORY_TABLE_NAME = var.inventory_reservations_enabled ? var.inventory_table_name : ""
+      INVENTORY_HOT_SKUS = join(",", var.inventory_hot_skus)
+      INVENTORY_HOT_SKU_SHARDS = var.inventory_hot_sku_shards
+      INVENTORY_CACHE_TTL_SECONDS = var.inventory_cache_ttl_seconds
+    }
+  }
+
+  depends_on = [aws_iam_role_policy_attachment.lambda_basic_execution]
+}
+
+# Failed order redrive Lambda (invoked on demand)
+resource "aws_lambda_function" "redrive" {
+  function_name = "${var.project_name}-redrive-${var.environment}"
+  role          = aws_iam_role.lambda_execution_role.arn
+  handler       = "lambda_function.lambda_handler"
+  runtime       = var.lambda_runtime
+  timeout       = var.redrive_timeout
+  memory_size   = var.lambda_memory_size
+  layers        = [var.shared_layer_arn]
+
+  s3_bucket = var.lambda_artifacts_bucket
+  s3_key    = "redrive/deployment.zip"
+
+  environment {
+    variables = {
+      LOG_LEVEL = var.log_level
+      ORDER_MESSAGE_FORMAT = var.order_message_format
+      ENVIRONMENT = var.environment
+      PROJECT_NAME = var.project_name
+      FAILED_ORDERS_TABLE_NAME = var.failed_orders_table_name
+      ORDER_QUEUE_URL = var.order_queue_url
+      REDRIVE_MESSAGES_PER_SECOND = var.redrive_messages_per_second
+      REDRIVE_SEGMENTS = var.redrive_segments
+      REDRIVE_MAX_QUEUE_DEPTH = var.redrive_max_queue_depth
     }
   }
 
   depends_on = [aws_iam_role_policy_attachment.lambda_basic_execution]
 }
 
+# Order aggregates Lambda (fed by the orders and failed_orders streams)
+resource "aws_lambda_function" "order_aggregates" {
+  function_name = "${var.project_name}-order-aggregates-${var.environment}"
+  role          = aws_iam_role.lambda_execution_role.arn
+  handler       = "lambda_function.lambda_handler"
+  runtime       = var.lambda_runtime
+  timeout       = var.lambda_timeout
+  memory_size   = var.lambda_memory_size
+  layers        = [var.shared_layer_arn]
+
+  s3_bucket = var.lambda_artifacts_bucket
+  s3_key    = "order_aggregates/deployment.zip"
+
+  environment {
+    variables = {
+      LOG_LEVEL = var.log_level
+      ENVIRONMENT = var.environment
+      ORDER_AGGREGATES_TABLE_NAME = var.order_aggregates_table_name
+      # Stream records from this table count as failed orders
+      FAILED_ORDERS_TABLE_NAME = var.failed_orders_table_name
+    }
+  }
+
+  depends_on = [aws_iam_role_policy_attachment.lambda_basic_execution]
+}
+
+# Stream triggers for the order aggregates lambda. Larger batches coalesce
+# into fewer counter updates.
+resource "aws_lambda_event_source_mapping" "orders_stream_trigger" {
+  event_source_arn  = var.orders_table_stream_arn
+  function_name     = aws_lambda_function.order_aggregates.arn
+  starting_position = "LATEST"
+  batch_size        = var.aggregates_batch_size
+
+  maximum_batching_window_in_seconds = var.aggregates_batching_window_seconds
+
+  # A failed batch is retried from its first unapplied record
+  function_response_types = ["ReportBatchItemFailures"]
+
+  # A record that keeps failing must not block its shard: a failing batch
+  # is split to isolate it, and after the retries it is recorded in the
+  # failure queue and skipped
+  maximum_retry_attempts         = var.aggregates_max_retry_attempts
+  bisect_batch_on_function_error = true
+
+  destination_config {
+    on_failure {
+      destination_arn = var.aggregates_failure_queue_arn
+    }
+  }
+
+  depends_on = [aws_iam_role_policy.lambda_policy]
+}
+
+resource "aws_lambda_event_source_mapping" "failed_orders_stream_trigger" {
+  event_source_arn  = var.failed_orders_table_stream_arn
+  function_name     = aws_lambda_function.order_aggregates.arn
+  starting_position = "LATEST"
+  batch_size        = var.aggregates_batch_size
+
+  maximum_batching_window_in_seconds = var.aggregates_batching_window_seconds
+
+  function_response_types = ["ReportBatchItemFailures"]
+
+  maximum_retry_attempts         = var.aggregates_max_retry_attempts
+  bisect_batch_on_function_error = true
+
+  destination_config {
+    on_failure {
+      destination_arn = var.aggregates_failure_queue_arn
+    }
+  }
+
+  depends_on = [aws_iam_role_policy.lambda_policy]
+}
+
 # SQS trigger for fulfill order lambda
 resource "aws_lambda_event_source_mapping" "sqs_trigger" {
   event_source_arn = var.order_queue_arn
   function_name    = aws_lambda_function.fulfill_order.arn
-  batch_size       = 1
+  batch_size       = var.fulfillment_batch_size
   enabled          = true
 
+  # Batches larger than 10 require a batching window
+  maximum_batching_window_in_seconds = var.fulfillment_batching_window_seconds
+
+  # Only failed messages are returned to the queue, not the whole batch
+  function_response_types = ["ReportBatchItemFailures"]
+
   depends_on = [aws_iam_role_policy.lambda_policy]
+}
+
+# Scheduled sweep of fulfillment retries that are due in the retry index
+resource "aws_cloudwatch_event_rule" "retry_sweep" {
+  name                = "${var.project_name}-retry-sweep-${var.environment}"
+  description         = "Re-enqueue due fulfillment retries"
+  schedule_expression = var.retry_sweep_schedule
+}
+
+resource "aws_cloudwatch_event_target" "retry_sweep" {
+  rule = aws_cloudwatch_event_rule.retry_sweep.name
+  arn  = aws_lambda_function.fulfill_order.arn
+}
+
+resource "aws_lambda_permission" "retry_sweep" {
+  statement_id  = "AllowRetrySweepSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.fulfill_order.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.retry_sweep.arn
 }
\ No newline at end of file
@@ -40,6 +40,16 @@ output "fulfill_order_function_name" {
   value       = aws_lambda_function.fulfill_order.function_name
 }
 
+output "redrive_function_name" {
+  description = "Failed order redrive Lambda function name"
+  value       = aws_lambda_function.redrive.function_name
+}
+
+output "order_aggregates_function_name" {
+  description = "Order aggregates stream consumer Lambda function name"
+  value       = aws_lambda_function.order_aggregates.function_name
+}
+
 # Direct Lambda ARNs for Step Functions (not API Gateway integration ARNs)
 output "validator_lambda_function_arn" {
   description = "Validator Lambda function ARN (direct, not API Gateway)"
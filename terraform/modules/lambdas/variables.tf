@@ -13,6 +13,11 @@ variable "lambda_artifacts_bucket" {
   type        = string
 }
 
+variable "claim_check_bucket" {
+  description = "S3 bucket holding the items of claim-checked orders"
+  type        = string
+}
+
 variable "orders_table_name" {
   description = "DynamoDB orders table name"
   type        = string
@@ -23,6 +28,36 @@ variable "failed_orders_table_name" {
   type        = string
 }
 
+variable "fulfillment_ledger_table_name" {
+  description = "DynamoDB fulfillment idempotency ledger table name"
+  type        = string
+}
+
+variable "order_idempotency_table_name" {
+  description = "DynamoDB order submission idempotency key table name"
+  type        = string
+}
+
+variable "order_aggregates_table_name" {
+  description = "DynamoDB order aggregates table name"
+  type        = string
+}
+
+variable "orders_table_stream_arn" {
+  description = "Orders table stream ARN, read by the order aggregates Lambda"
+  type        = string
+}
+
+variable "failed_orders_table_stream_arn" {
+  description = "Failed orders table stream ARN, read by the order aggregates Lambda"
+  type        = string
+}
+
+variable "inventory_table_name" {
+  description = "DynamoDB inventory (stock and reservations) table name"
+  type        = string
+}
+
 variable "order_queue_url" {
   description = "SQS order queue URL"
   type        = string
@@ -33,6 +68,16 @@ variable "order_queue_arn" {
   type        = string
 }
 
+variable "dlq_url" {
+  description = "SQS dead letter queue URL"
+  type        = string
+}
+
+variable "aggregates_failure_queue_arn" {
+  description = "SQS queue that receives order aggregates stream batches that still fail after their retries"
+  type        = string
+}
+
 variable "dlq_arn" {
   description = "SQS dead letter queue ARN"
   type        = string
@@ -55,3 +100,213 @@ variable "lambda_memory_size" {
   type        = number
   default     = 256
 }
+
+# SQS batching for the fulfill order lambda
+variable "fulfillment_batch_size" {
+  description = "Maximum number of order messages delivered to fulfill order per invocation"
+  type        = number
+  default     = 100
+}
+
+variable "fulfillment_batching_window_seconds" {
+  description = "Maximum time to gather a fulfillment batch before invoking"
+  type        = number
+  default     = 5
+}
+
+variable "aggregates_batch_size" {
+  description = "Maximum number of stream records delivered to order aggregates per invocation"
+  type        = number
+  default     = 500
+}
+
+variable "aggregates_batching_window_seconds" {
+  description = "Maximum time to gather a stream batch for order aggregates before invoking"
+  type        = number
+  default     = 5
+}
+
+variable "aggregates_max_retry_attempts" {
+  description = "Retries of a failing order aggregates stream batch before it goes to the failure queue"
+  type        = number
+  default     = 5
+}
+
+variable "fulfillment_concurrency" {
+  description = "Threads fulfill order processes the records of a batch on (1 = one at a time)"
+  type        = number
+  default     = 16
+}
+
+variable "batch_write_max_attempts" {
+  description = "BatchWriteItem attempts before unprocessed items are redelivered"
+  type        = number
+  default     = 5
+}
+
+# Bulk order submission in the API handler
+variable "batch_max_orders" {
+  description = "Maximum number of orders accepted in one bulk submission"
+  type        = number
+  default     = 500
+}
+
+variable "batch_max_workers" {
+  description = "Concurrent StartExecution calls per bulk submission"
+  type        = number
+  default     = 16
+}
+
+variable "order_message_format" {
+  description = "Order queue message body format: envelope (versioned, compressed) or json"
+  type        = string
+  default     = "envelope"
+
+  validation {
+    condition     = contains(["envelope", "json"], var.order_message_format)
+    error_message = "order_message_format must be \"envelope\" or \"json\"."
+  }
+}
+
+variable "claim_check_threshold_bytes" {
+  description = "Encoded order size above which the order's items are stored in the claim-check bucket"
+  type        = number
+  default     = 65536
+}
+
+variable "inventory_reservations_enabled" {
+  description = "Reserve stock in the inventory table before fulfilling orders; load stock first, since a product without a stock row has none"
+  type        = bool
+  default     = false
+}
+
+variable "inventory_hot_skus" {
+  description = "Product IDs whose stock is split over several rows to spread reservation writes"
+  type        = list(string)
+  default     = []
+}
+
+variable "inventory_hot_sku_shards" {
+  description = "Stock rows per hot SKU; changing it requires reloading the hot SKUs' stock"
+  type        = number
+  default     = 8
+}
+
+variable "inventory_cache_ttl_seconds" {
+  description = "Seconds fulfill_order caches stock levels to fail out-of-stock orders without a write"
+  type        = number
+  default     = 2
+}
+
+variable "admission_client_rate" {
+  description = "Orders per second each client (API key or source IP) may submit per API handler container (0 = no limit)"
+  type        = number
+  default     = 50
+}
+
+variable "admission_client_burst" {
+  description = "Orders a client may submit at once before its rate applies (0 = twice the rate)"
+  type        = number
+  default     = 0
+}
+
+variable "admission_max_queue_depth" {
+  description = "Order queue depth above which the API handler sheds new orders with 429 (0 = never)"
+  type        = number
+  default     = 5000
+}
+
+variable "admission_max_dlq_growth" {
+  description = "DLQ growth in messages per second above which the API handler sheds new orders with 429 (0 = never)"
+  type        = number
+  default     = 5
+}
+
+variable "idempotency_key_ttl_seconds" {
+  description = "Seconds a submission's Idempotency-Key (or client order_id) replays its first response"
+  type        = number
+  default     = 86400
+}
+
+variable "order_cache_ttl_seconds" {
+  description = "Seconds the API handler caches an in-flight order's status for GET /orders/{order_id}"
+  type        = number
+  default     = 2
+}
+
+variable "shared_layer_arn" {
+  description = "ARN of the shared Python modules Lambda layer"
+  type        = string
+}
+
+variable "visibility_timeout_seconds" {
+  description = "Order queue visibility timeout, used as the idempotency claim lease"
+  type        = number
+  default     = 300
+}
+
+variable "pipeline_mode" {
+  description = "Order pipeline used by the API handler: stepfunctions or inline"
+  type        = string
+  default     = "stepfunctions"
+}
+
+variable "fulfillment_max_retries" {
+  description = "Failed fulfillment attempts before an order moves to the failed orders table"
+  type        = number
+  default     = 3
+}
+
+variable "fulfillment_retry_base_seconds" {
+  description = "Backoff delay before the first fulfillment retry, doubled per attempt"
+  type        = number
+  default     = 30
+}
+
+variable "fulfillment_retry_max_delay_seconds" {
+  description = "Upper bound on the fulfillment retry delay; delays over 900s go through the retry sweep"
+  type        = number
+  default     = 3600
+}
+
+variable "retry_sweep_schedule" {
+  description = "EventBridge schedule for the sweep of due fulfillment retries"
+  type        = string
+  default     = "rate(1 minute)"
+}
+
+variable "redrive_messages_per_second" {
+  description = "Default send rate of the failed order redrive"
+  type        = number
+  default     = 20
+}
+
+variable "redrive_segments" {
+  description = "Default number of parallel scan segments for the failed order redrive"
+  type        = number
+  default     = 4
+}
+
+variable "redrive_max_queue_depth" {
+  description = "Order queue depth above which the redrive pauses (0 = never)"
+  type        = number
+  default     = 1000
+}
+
+variable "redrive_timeout" {
+  description = "Timeout of the redrive Lambda in seconds; it returns a checkpoint before timing out"
+  type        = number
+  default     = 900
+}
+
+variable "log_level" {
+  description = "Log level for the Lambda functions"
+  type        = string
+  default     = "INFO"
+}
+
+variable "log_payload_sample_rate" {
+  description = "Fraction of invocations that log their full (redacted) order payload"
+  type        = number
+  default     = 0.01
+}
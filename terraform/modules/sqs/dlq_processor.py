@@ -1,20 +1,37 @@
 import json
-import boto3
 import os
 import logging
+import aws_clients
+import batch_writes
+import order_codec
+import order_index
+import telemetry
+import tracing
 from datetime import datetime
 from decimal import Decimal
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(telemetry.LOG_LEVEL)
 
-dynamodb = boto3.resource('dynamodb')
+# BatchWriteItem chunks run on worker threads, each with its own resource
+dynamodb = aws_clients.resource('dynamodb', per_thread=True)
 
+PROCESSOR_VERSION = '1.2'
+
+# BatchWriteItem chunks written concurrently per invocation
+WRITE_WORKERS = int(os.environ.get('DLQ_WRITE_WORKERS', '4'))
+
+@telemetry.instrument('dlq_processor')
 def lambda_handler(event, context):
     """
     Process messages from Dead Letter Queue and save to failed_orders table
+
+    Records are written with BatchWriteItem; messages whose record could
+    not be written are returned in batchItemFailures for redelivery.
     """
     
+    aws_clients.log_cold_start('dlq_processor')
+    
     try:
         failed_orders_table_name = os.environ.get('FAILED_ORDERS_TABLE_NAME')
         environment = os.environ.get('ENVIRONMENT', 'dev')
@@ -23,117 +40,62 @@ def lambda_handler(event, context):
             logger.error("FAILED_ORDERS_TABLE_NAME environment variable not set")
             raise ValueError("FAILED_ORDERS_TABLE_NAME environment variable not set")
         
-        failed_orders_table = dynamodb.Table(failed_orders_table_name)
-        
-        processed_count = 0
-        error_count = 0
+        records = event.get('Records', [])
+        logger.info("Processing %d DLQ messages", len(records))
         
-        logger.info(f"Processing {len(event.get('Records', []))} DLQ messages")
+        # One timestamp for the whole batch
+        now = datetime.utcnow()
+        pending_writes = {}
+        error_message_ids = set()
         
-        for record in event.get('Records', []):
+        for record in records:
+            message_id = record.get('messageId', 'unknown')
             try:
-                # Extract message information
-                message_id = record.get('messageId', 'unknown')
-                receipt_handle = record.get('receiptHandle', 'unknown')
-                
-                # Parse the message body
-                try:
-                    if isinstance(record['body'], str):
-                        message_body = json.loads(record['body'])
-                    else:
-                        message_body = record['body']
-                except json.JSONDecodeError:
-                    message_body = record['body']
-                
-                # Extract order data if available
-                order_data = None
-                order_id = None
-                
-                if isinstance(message_body, dict):
-                    if 'order_id' in message_body:
-                        order_data = message_body
-                        order_id = message_body['order_id']
-                    elif 'order_data' in message_body:
-                        order_data = message_body['order_data']
-                        order_id = order_data.get('order_id') if order_data else None
-                
-                if not order_id:
-                    order_id = f"dlq-{message_id}-{int(datetime.utcnow().timestamp())}"
+                failed_order = build_failed_order(record, environment, now)
+            except Exception as e:
+                logger.error("Error processing DLQ record %s: %s", message_id, e)
+                error_message_ids.add(message_id)
                 
-                # Create failed order record
+                # Save the problematic record anyway
                 failed_order = {
-                    'order_id': order_id,
-                    'failed_at': datetime.utcnow().isoformat(),
-                    'failure_source': 'DLQ',
-                    'status': 'DLQ_PROCESSING_FAILED',
-                    'message_id': message_id,
-                    'receipt_handle': receipt_handle,
+                    'order_id': f"error-{message_id}-{int(now.timestamp())}",
+                    'failed_at': now.isoformat(),
+                    'failure_source': 'DLQ_PROCESSOR_ERROR',
+                    'status': 'DLQ_PROCESSOR_FAILED',
+                    'error_message': str(e),
                     'environment': environment,
-                    'original_message': convert_floats_to_decimal(message_body),
+                    'original_record': record,
                     'dlq_metadata': {
-                        'processed_at': datetime.utcnow().isoformat(),
-                        'processor_version': '1.0',
-                        'message_attributes': record.get('messageAttributes', {}),
-                        'approximate_receive_count': record.get('attributes', {}).get('ApproximateReceiveCount', 'unknown')
+                        'processed_at': now.isoformat(),
+                        'processor_version': PROCESSOR_VERSION,
+                        'processing_error': True
                     }
                 }
-                
-                # Add order data if available
-                if order_data:
-                    failed_order['original_order_data'] = convert_floats_to_decimal(order_data)
-                    failed_order['customer_name'] = order_data.get('customer_name', 'unknown')
-                    failed_order['customer_email'] = order_data.get('customer_email', 'unknown')
-                    
-                    # Calculate order value if items exist
-                    if 'items' in order_data and isinstance(order_data['items'], list):
-                        total_value = 0
-                        for item in order_data['items']:
-                            quantity = item.get('quantity', 0)
-                            price = item.get('unit_price') or item.get('price', 0)
-                            total_value += quantity * price
-                        failed_order['order_value'] = Decimal(str(total_value))
-                        failed_order['item_count'] = len(order_data['items'])
-                
-                # Store in failed orders table
-                failed_orders_table.put_item(Item=failed_order)
-                
-                logger.info(f"DLQ message processed successfully", extra={
-                    'order_id': order_id,
-                    'message_id': message_id,
-                    'failure_source': 'DLQ',
-                    'processed_at': datetime.utcnow().isoformat()
-                })
-                
-                processed_count += 1
-                
-            except Exception as e:
-                logger.error(f"Error processing DLQ record {record.get('messageId', 'unknown')}: {str(e)}")
-                error_count += 1
-                
-                # Try to save the problematic record anyway
-                try:
-                    error_record = {
-                        'order_id': f"error-{record.get('messageId', 'unknown')}-{int(datetime.utcnow().timestamp())}",
-                        'failed_at': datetime.utcnow().isoformat(),
-                        'failure_source': 'DLQ_PROCESSOR_ERROR',
-                        'status': 'DLQ_PROCESSOR_FAILED',
-                        'error_message': str(e),
-                        'environment': environment,
-                        'original_record': record,
-                        'dlq_metadata': {
-                            'processed_at': datetime.utcnow().isoformat(),
-                            'processor_version': '1.0',
-                            'processing_error': True
-                        }
-                    }
-                    failed_orders_table.put_item(Item=error_record)
-                except:
-                    logger.error("Failed to save error record for DLQ message processing failure")
+            failed_order['failed_shard'] = order_index.failed_shard(
+                failed_order['status'], failed_order['order_id'], failed_order['failed_at'])
+            batch_writes.queue_write(pending_writes, failed_orders_table_name, failed_order, message_id)
+        
+        with telemetry.metrics.timer('DLQBatchWriteLatency'):
+            unwritten_message_ids = batch_writes.write_all(dynamodb, pending_writes, workers=WRITE_WORKERS)
+        
+        # Only messages whose record was not written go back to the DLQ
+        batch_item_failures = [
+            {'itemIdentifier': record.get('messageId', 'unknown')}
+            for record in records
+            if record.get('messageId', 'unknown') in unwritten_message_ids
+        ]
+        error_count = len(error_message_ids - unwritten_message_ids)
+        processed_count = len(records) - error_count - len(batch_item_failures)
+        
+        telemetry.metrics.count('DLQMessagesProcessed', processed_count)
+        telemetry.metrics.count('DLQProcessingErrors', error_count)
+        telemetry.metrics.count('DLQWriteFailures', len(batch_item_failures))
         
-        logger.info(f"DLQ processing complete", extra={
+        logger.info("DLQ processing complete", extra={
             'processed_count': processed_count,
             'error_count': error_count,
-            'total_records': len(event.get('Records', [])),
+            'unwritten_count': len(batch_item_failures),
+            'total_records': len(records),
             'environment': environment
         })
         
@@ -143,23 +105,77 @@ def lambda_handler(event, context):
                 'message': 'DLQ processing completed',
                 'processed_count': processed_count,
                 'error_count': error_count,
-                'total_records': len(event.get('Records', []))
-            })
+                'unwritten_count': len(batch_item_failures),
+                'total_records': len(records)
+            }),
+            'batchItemFailures': batch_item_failures
         }
         
     except Exception as e:
-        logger.error(f"Critical error in DLQ processor: {str(e)}")
+        logger.error("Critical error in DLQ processor: %s", e)
         raise
 
-def convert_floats_to_decimal(obj):
+def build_failed_order(record, environment, now):
+    """
+    failed_orders item for one DLQ record. The body is parsed once,
+    straight into DynamoDB types, and stored once.
+    """
+    message_id = record.get('messageId', 'unknown')
+    
+    # Parse the message body straight into DynamoDB-ready types
+    message_body = order_codec.parse_message_body(record['body'])
+    
+    # The order itself, or the one nested in a state machine message
+    order_data = order_codec.order_from_message(message_body)
+    order_id = order_data.get('order_id') if order_data else None
+    
+    if not order_id:
+        order_id = f"dlq-{message_id}-{int(now.timestamp())}"
+    
+    failed_order = {
+        'order_id': order_id,
+        'failed_at': now.isoformat(),
+        'failure_source': 'DLQ',
+        'status': 'DLQ_PROCESSING_FAILED',
+        'message_id': message_id,
+        'receipt_handle': record.get('receiptHandle', 'unknown'),
+        'environment': environment,
+        'original_message': message_body,
+        'dlq_metadata': {
+            'processed_at': now.isoformat(),
+            'processor_version': PROCESSOR_VERSION,
+            'message_attributes': record.get('messageAttributes', {}),
+            'approximate_receive_count': record.get('attributes', {}).get('ApproximateReceiveCount', 'unknown')
+        }
+    }
+    
+    if order_data:
+        # original_message already holds the order, nested or not
+        failed_order['customer_name'] = order_data.get('customer_name', 'unknown')
+        failed_order['customer_email'] = order_data.get('customer_email', 'unknown')
+        
+        items = order_data.get('items')
+        if isinstance(items, list):
+            failed_order['order_value'] = order_value(order_data, items)
+            failed_order['item_count'] = len(items)
+        
+        # The order ends here: its trace gets a DLQ mark and is recorded
+        tracing.mark(order_data, 'dlq', tracing.started())
+        tracing.finish(order_data, 'Failure')
+    
+    return failed_order
+
+def order_value(order_data, items):
     """
-    Convert float values to Decimal for DynamoDB compatibility
+    The validator's calculated_total_amount when the order got that far
+    (kept for claim-checked orders too), otherwise the sum of the line
+    items; the client's own total_amount is never trusted
     """
-    if isinstance(obj, list):
-        return [convert_floats_to_decimal(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {key: convert_floats_to_decimal(value) for key, value in obj.items()}
-    elif isinstance(obj, float):
-        return Decimal(str(obj))
-    else:
-        return obj 
\ No newline at end of file
+    calculated_total = order_data.get('calculated_total_amount')
+    if calculated_total is not None:
+        return Decimal(str(calculated_total))
+    return sum(
+        (Decimal(str(item.get('quantity', 0))) * Decimal(str(item.get('unit_price') or item.get('price', 0)))
+         for item in items),
+        Decimal(0)
+    )
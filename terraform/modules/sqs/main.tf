@@ -9,6 +9,19 @@ resource "aws_sqs_queue" "order_dlq" {
   }
 }
 
+# On-failure destination of the order aggregates stream triggers: stream
+# batches that still fail after their retries are recorded here
+resource "aws_sqs_queue" "aggregates_failures" {
+  name = "${var.project_name}-aggregates-failures-${var.environment}"
+
+  message_retention_seconds = 1209600 # 14 days
+
+  tags = {
+    Name        = "${var.project_name}-aggregates-failures-${var.environment}"
+    Environment = var.environment
+  }
+}
+
 resource "aws_sqs_queue" "order_queue" {
   name                      = "${var.project_name}-order-queue-${var.environment}"
   visibility_timeout_seconds = var.visibility_timeout_seconds
@@ -33,6 +46,7 @@ resource "aws_lambda_function" "dlq_processor" {
   runtime       = "python3.11"
   timeout       = 30
   memory_size   = 256
+  layers        = [var.shared_layer_arn]
 
   filename      = "${path.module}/dlq_processor.zip"
   source_code_hash = data.archive_file.dlq_processor_zip.output_base64sha256
@@ -41,6 +55,8 @@ resource "aws_lambda_function" "dlq_processor" {
     variables = {
       FAILED_ORDERS_TABLE_NAME = var.failed_orders_table_name
       ENVIRONMENT = var.environment
+      LOG_LEVEL = var.log_level
+      DLQ_WRITE_WORKERS = var.dlq_write_workers
     }
   }
 
@@ -99,7 +115,8 @@ resource "aws_iam_role_policy" "dlq_processor_policy" {
       {
         Effect = "Allow"
         Action = [
-          "dynamodb:PutItem"
+          "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem"
         ]
         Resource = "arn:aws:dynamodb:*:*:table/${var.failed_orders_table_name}"
       }
@@ -111,8 +128,18 @@ resource "aws_iam_role_policy" "dlq_processor_policy" {
 resource "aws_lambda_event_source_mapping" "dlq_trigger" {
   event_source_arn = aws_sqs_queue.order_dlq.arn
   function_name    = aws_lambda_function.dlq_processor.arn
-  batch_size       = 1
+  batch_size       = var.dlq_batch_size
   enabled          = true
 
+  # Batches larger than 10 require a batching window
+  maximum_batching_window_in_seconds = var.dlq_batching_window_seconds
+
+  scaling_config {
+    maximum_concurrency = var.dlq_max_concurrency
+  }
+
+  # Only messages that could not be written are returned to the DLQ
+  function_response_types = ["ReportBatchItemFailures"]
+
   depends_on = [aws_iam_role_policy.dlq_processor_policy]
 }
\ No newline at end of file
@@ -17,3 +17,13 @@ output "dlq_arn" {
   description = "Dead letter queue ARN"
   value       = aws_sqs_queue.order_dlq.arn
 }
+
+output "aggregates_failure_queue_url" {
+  description = "Order aggregates stream failure queue URL"
+  value       = aws_sqs_queue.aggregates_failures.url
+}
+
+output "aggregates_failure_queue_arn" {
+  description = "Order aggregates stream failure queue ARN"
+  value       = aws_sqs_queue.aggregates_failures.arn
+}
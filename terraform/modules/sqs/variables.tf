@@ -24,3 +24,38 @@ variable "failed_orders_table_name" {
   description = "DynamoDB failed orders table name"
   type        = string
 }
+
+variable "shared_layer_arn" {
+  description = "ARN of the shared Python modules Lambda layer"
+  type        = string
+}
+
+variable "dlq_batch_size" {
+  description = "Maximum number of DLQ messages delivered to the DLQ processor per invocation"
+  type        = number
+  default     = 100
+}
+
+variable "dlq_batching_window_seconds" {
+  description = "Maximum time to gather a DLQ batch before invoking"
+  type        = number
+  default     = 5
+}
+
+variable "dlq_max_concurrency" {
+  description = "Maximum concurrent DLQ processor invocations (2-1000)"
+  type        = number
+  default     = 10
+}
+
+variable "dlq_write_workers" {
+  description = "BatchWriteItem chunks the DLQ processor writes concurrently"
+  type        = number
+  default     = 4
+}
+
+variable "log_level" {
+  description = "Log level for the Lambda functions"
+  type        = string
+  default     = "INFO"
+}
@@ -9,6 +9,16 @@ output "api_endpoint" {
   value       = "${module.api_gateway.api_url}/order"
 }
 
+output "batch_api_endpoint" {
+  description = "API endpoint URL for bulk order submission"
+  value       = "${module.api_gateway.api_url}/orders/batch"
+}
+
+output "orders_list_endpoint" {
+  description = "API endpoint URL for listing orders by status"
+  value       = "${module.api_gateway.api_url}/orders"
+}
+
 output "curl_example" {
   description = "Example curl command to test the API"
   value       = "curl -X POST ${module.api_gateway.api_url}/order -H 'Content-Type: application/json' -d '{\"order_id\":\"12345\",\"customer_name\":\"Test User\",\"items\":[{\"item\":\"Product A\",\"quantity\":1}],\"total_amount\":25.99}'"
@@ -44,11 +54,36 @@ output "dlq_url" {
   value       = module.sqs.dlq_url
 }
 
+output "aggregates_failure_queue_url" {
+  description = "SQS queue of order aggregates stream batches that failed after their retries"
+  value       = module.sqs.aggregates_failure_queue_url
+}
+
 output "lambda_artifacts_bucket" {
   description = "S3 bucket for Lambda artifacts"
   value       = aws_s3_bucket.lambda_artifacts.bucket
 }
 
+output "order_idempotency_table_name" {
+  description = "Order submission idempotency key DynamoDB table name"
+  value       = module.dynamodb.order_idempotency_table_name
+}
+
+output "order_aggregates_table_name" {
+  description = "Order aggregates DynamoDB table name"
+  value       = module.dynamodb.order_aggregates_table_name
+}
+
+output "inventory_table_name" {
+  description = "Inventory DynamoDB table name"
+  value       = module.dynamodb.inventory_table_name
+}
+
+output "claim_check_bucket" {
+  description = "S3 bucket holding the items of claim-checked orders"
+  value       = aws_s3_bucket.claim_check.bucket
+}
+
 output "sns_topic_arn" {
   description = "SNS topic ARN for alerts"
   value       = module.monitoring.sns_topic_arn
@@ -63,10 +98,12 @@ output "aws_region" {
 output "lambda_functions" {
   description = "Lambda function names"
   value = {
-    api_handler    = module.lambdas.api_handler_function_name
-    validator      = module.lambdas.validator_function_name
-    order_storage  = module.lambdas.order_storage_function_name
-    fulfill_order  = module.lambdas.fulfill_order_function_name
+    api_handler      = module.lambdas.api_handler_function_name
+    validator        = module.lambdas.validator_function_name
+    order_storage    = module.lambdas.order_storage_function_name
+    fulfill_order    = module.lambdas.fulfill_order_function_name
+    redrive          = module.lambdas.redrive_function_name
+    order_aggregates = module.lambdas.order_aggregates_function_name
   }
 }
 
@@ -74,10 +111,12 @@ output "lambda_functions" {
 output "log_groups" {
   description = "CloudWatch Log Group names"
   value = {
-    api_handler    = "/aws/lambda/${module.lambdas.api_handler_function_name}"
-    validator      = "/aws/lambda/${module.lambdas.validator_function_name}"
-    order_storage  = "/aws/lambda/${module.lambdas.order_storage_function_name}"
-    fulfill_order  = "/aws/lambda/${module.lambdas.fulfill_order_function_name}"
-    step_functions = "/aws/stepfunctions/${var.project_name}-order-processor-${var.environment}"
+    api_handler      = "/aws/lambda/${module.lambdas.api_handler_function_name}"
+    validator        = "/aws/lambda/${module.lambdas.validator_function_name}"
+    order_storage    = "/aws/lambda/${module.lambdas.order_storage_function_name}"
+    fulfill_order    = "/aws/lambda/${module.lambdas.fulfill_order_function_name}"
+    redrive          = "/aws/lambda/${module.lambdas.redrive_function_name}"
+    order_aggregates = "/aws/lambda/${module.lambdas.order_aggregates_function_name}"
+    step_functions   = "/aws/stepfunctions/${var.project_name}-order-processor-${var.environment}"
   }
 }
\ No newline at end of file
@@ -67,6 +67,250 @@ variable "max_receive_count" {
   default     = 3
 }
 
+# SQS batching for the fulfill order lambda
+variable "fulfillment_batch_size" {
+  description = "Maximum number of order messages delivered to fulfill order per invocation"
+  type        = number
+  default     = 100
+}
+
+variable "fulfillment_batching_window_seconds" {
+  description = "Maximum time to gather a fulfillment batch before invoking"
+  type        = number
+  default     = 5
+}
+
+variable "aggregates_batch_size" {
+  description = "Maximum number of stream records delivered to order aggregates per invocation"
+  type        = number
+  default     = 500
+}
+
+variable "aggregates_batching_window_seconds" {
+  description = "Maximum time to gather a stream batch for order aggregates before invoking"
+  type        = number
+  default     = 5
+}
+
+variable "aggregates_max_retry_attempts" {
+  description = "Retries of a failing order aggregates stream batch before it goes to the failure queue"
+  type        = number
+  default     = 5
+}
+
+variable "fulfillment_concurrency" {
+  description = "Threads fulfill order processes the records of a batch on (1 = one at a time)"
+  type        = number
+  default     = 16
+}
+
+# DLQ ingestion
+variable "dlq_batch_size" {
+  description = "Maximum number of DLQ messages delivered to the DLQ processor per invocation"
+  type        = number
+  default     = 100
+}
+
+variable "dlq_batching_window_seconds" {
+  description = "Maximum time to gather a DLQ batch before invoking"
+  type        = number
+  default     = 5
+}
+
+variable "dlq_max_concurrency" {
+  description = "Maximum concurrent DLQ processor invocations (2-1000)"
+  type        = number
+  default     = 10
+}
+
+variable "dlq_write_workers" {
+  description = "BatchWriteItem chunks the DLQ processor writes concurrently"
+  type        = number
+  default     = 4
+}
+
+variable "batch_write_max_attempts" {
+  description = "BatchWriteItem attempts before unprocessed items are redelivered"
+  type        = number
+  default     = 5
+}
+
+# Fulfillment retries
+variable "fulfillment_max_retries" {
+  description = "Failed fulfillment attempts before an order moves to the failed orders table"
+  type        = number
+  default     = 3
+}
+
+variable "fulfillment_retry_base_seconds" {
+  description = "Backoff delay before the first fulfillment retry, doubled per attempt"
+  type        = number
+  default     = 30
+}
+
+variable "fulfillment_retry_max_delay_seconds" {
+  description = "Upper bound on the fulfillment retry delay; delays over 900s go through the retry sweep"
+  type        = number
+  default     = 3600
+}
+
+variable "retry_sweep_schedule" {
+  description = "EventBridge schedule for the sweep of due fulfillment retries"
+  type        = string
+  default     = "rate(1 minute)"
+}
+
+# Failed order redrive
+variable "redrive_messages_per_second" {
+  description = "Default send rate of the failed order redrive"
+  type        = number
+  default     = 20
+}
+
+variable "redrive_segments" {
+  description = "Default number of parallel scan segments for the failed order redrive"
+  type        = number
+  default     = 4
+}
+
+variable "redrive_max_queue_depth" {
+  description = "Order queue depth above which the redrive pauses (0 = never)"
+  type        = number
+  default     = 1000
+}
+
+variable "redrive_timeout" {
+  description = "Timeout of the redrive Lambda in seconds; it returns a checkpoint before timing out"
+  type        = number
+  default     = 900
+}
+
+# Bulk order submission in the API handler
+variable "batch_max_orders" {
+  description = "Maximum number of orders accepted in one bulk submission"
+  type        = number
+  default     = 500
+}
+
+variable "batch_max_workers" {
+  description = "Concurrent StartExecution calls per bulk submission"
+  type        = number
+  default     = 16
+}
+
+variable "pipeline_mode" {
+  description = "Order pipeline used by the API handler: stepfunctions, or inline to run validation and storage in-process"
+  type        = string
+  default     = "stepfunctions"
+
+  validation {
+    condition     = contains(["stepfunctions", "inline"], var.pipeline_mode)
+    error_message = "pipeline_mode must be \"stepfunctions\" or \"inline\"."
+  }
+}
+
+# Admission control in the API handler
+variable "admission_client_rate" {
+  description = "Orders per second each client (API key or source IP) may submit per API handler container (0 = no limit)"
+  type        = number
+  default     = 50
+}
+
+variable "admission_client_burst" {
+  description = "Orders a client may submit at once before its rate applies (0 = twice the rate)"
+  type        = number
+  default     = 0
+}
+
+variable "admission_max_queue_depth" {
+  description = "Order queue depth above which the API handler sheds new orders with 429 (0 = never)"
+  type        = number
+  default     = 5000
+}
+
+variable "admission_max_dlq_growth" {
+  description = "DLQ growth in messages per second above which the API handler sheds new orders with 429 (0 = never)"
+  type        = number
+  default     = 5
+}
+
+# Idempotent order submission in the API handler
+variable "idempotency_key_ttl_seconds" {
+  description = "Seconds a submission's Idempotency-Key (or client order_id) replays its first response"
+  type        = number
+  default     = 86400
+}
+
+# Order lookups in the API handler
+variable "order_cache_ttl_seconds" {
+  description = "Seconds the API handler caches an in-flight order's status for GET /orders/{order_id}"
+  type        = number
+  default     = 2
+}
+
+# Order queue messages
+variable "order_message_format" {
+  description = "Order queue message body format: envelope (versioned, compressed) or json"
+  type        = string
+  default     = "envelope"
+
+  validation {
+    condition     = contains(["envelope", "json"], var.order_message_format)
+    error_message = "order_message_format must be \"envelope\" or \"json\"."
+  }
+}
+
+# Claim checks for large orders
+variable "claim_check_threshold_bytes" {
+  description = "Encoded order size above which the order's items are stored in the claim-check bucket"
+  type        = number
+  default     = 65536
+}
+
+variable "claim_check_retention_days" {
+  description = "Days claim-checked order items are kept"
+  type        = number
+  default     = 30
+}
+
+# Inventory reservations
+variable "inventory_reservations_enabled" {
+  description = "Reserve stock in the inventory table before fulfilling orders; load stock first, since a product without a stock row has none"
+  type        = bool
+  default     = false
+}
+
+variable "inventory_hot_skus" {
+  description = "Product IDs whose stock is split over several rows to spread reservation writes"
+  type        = list(string)
+  default     = []
+}
+
+variable "inventory_hot_sku_shards" {
+  description = "Stock rows per hot SKU; changing it requires reloading the hot SKUs' stock"
+  type        = number
+  default     = 8
+}
+
+variable "inventory_cache_ttl_seconds" {
+  description = "Seconds fulfill_order caches stock levels to fail out-of-stock orders without a write"
+  type        = number
+  default     = 2
+}
+
+# Logging
+variable "log_level" {
+  description = "Log level for all Lambda functions"
+  type        = string
+  default     = "INFO"
+}
+
+variable "log_payload_sample_rate" {
+  description = "Fraction of invocations that log their full (redacted) order payload"
+  type        = number
+  default     = 0.01
+}
+
 # DLQ monitoring
 variable "dlq_alarm_threshold" {
   description = "DLQ message count threshold for alerts"